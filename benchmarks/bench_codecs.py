@@ -0,0 +1,325 @@
+"""
+Benchmark codec throughput (MB/s) and peak RSS.
+
+Cases:
+  refpack.decompress        RefPack streams of the tuning XML and DATA corpora
+  extract_resource.zlib     zlib resources (type 0x5A42) through PackageReader
+  extract_resource.fallback zlib resources of an unknown compression type,
+                            decoded by the heuristic fallback chain
+  unshuffle_dst1/dst5       DST block reordering on texture blocks
+  stbl.parse                StringTableReader.parse on a STBL resource
+
+Throughput is measured against the decompressed (or parsed) size. Each
+case runs in a fresh process so its peak RSS is its own (RSS is not
+reported on Windows). Corpora are deterministic (see benchmarks.corpora);
+compressed inputs are cached on disk because compressing the 128 MB
+corpora with the pure-Python RefPack encoder takes minutes.
+
+Usage:
+    python -m benchmarks.bench_codecs [--sizes 1M 16M 128M] [--cases ...]
+        [--output report.json] [--compare baseline.json --threshold 10]
+
+With --compare, cases more than --threshold percent slower (or larger in
+peak RSS) than the baseline report are listed and the exit status is 1.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.corpora import CORPORA, parse_size
+from util.datamining import image_decoder, refpack
+from util.datamining.compression import COMPRESSION_ZLIB, CodecRegistry
+from util.datamining.index_cache import default_cache_dir
+from util.datamining.package_index import IndexTable
+from util.datamining.package_reader import DBPF_HEADER_SIZE, PackageReader
+from util.datamining.string_table import StringTableReader
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_VERSION = 1
+DEFAULT_THRESHOLD = 10.0
+
+# Size of each resource in the extract_resource packages
+RESOURCE_SIZE = 1 << 20
+
+# A compression type no codec is registered for, to force the fallback chain
+_UNKNOWN_COMPRESSION = 0x0001
+
+# case name: corpora it runs on
+CASES = {
+    "refpack.decompress": ("tuning_xml", "binary_data"),
+    "extract_resource.zlib": ("tuning_xml", "binary_data"),
+    "extract_resource.fallback": ("tuning_xml",),
+    "unshuffle_dst1": ("dds_blocks",),
+    "unshuffle_dst5": ("dds_blocks",),
+    "stbl.parse": ("stbl_blob",),
+}  # type: Dict[str, Tuple[str, ...]]
+
+
+def default_bench_cache_dir():
+    # type: () -> str
+    """Cache directory for generated inputs, next to the index cache."""
+    return os.path.join(os.path.dirname(default_cache_dir()), "bench")
+
+
+def _cached(cache_dir, name, build):
+    # type: (str, str, Callable[[], bytes]) -> str
+    """Path of a cached input file, building it on first use."""
+    path = os.path.join(cache_dir, name)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        data = build()
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _read(path):
+    # type: (str) -> bytes
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_package(corpus, compression_type):
+    # type: (bytes, int) -> Tuple[bytes, List[tuple]]
+    """Package body (header + zlib resources) and its index rows."""
+    parts = [bytes(DBPF_HEADER_SIZE)]
+    rows = []
+    offset = DBPF_HEADER_SIZE
+    for instance, start in enumerate(range(0, len(corpus), RESOURCE_SIZE)):
+        chunk = corpus[start:start + RESOURCE_SIZE]
+        stored = zlib.compress(chunk, 6)
+        parts.append(stored)
+        rows.append((0x545AC67A, 0, instance, offset, len(stored), len(chunk), compression_type))
+        offset += len(stored)
+    return b"".join(parts), rows
+
+
+def _input_file(case, corpus_name, size, cache_dir):
+    # type: (str, str, int, str) -> str
+    """Cached input of a case: the corpus, or its RefPack stream."""
+    corpus_file = _cached(cache_dir, "{}-{}.bin".format(corpus_name, size),
+                          lambda: CORPORA[corpus_name](size, 0))
+    if case == "refpack.decompress":
+        return _cached(cache_dir, "{}-{}.refpack".format(corpus_name, size),
+                       lambda: refpack.compress(_read(corpus_file), 1))
+    return corpus_file
+
+
+def _prepare(case, corpus_name, size, cache_dir):
+    # type: (str, str, int, str) -> Tuple[Callable[[], object], Callable[[], None]]
+    """Load the input of a case; returns (timed function, cleanup)."""
+    data = _read(_input_file(case, corpus_name, size, cache_dir))
+
+    if case == "refpack.decompress":
+        return lambda: refpack.decompress(data), lambda: None
+
+    if case.startswith("extract_resource."):
+        fallback = case.endswith(".fallback")
+        compression_type = _UNKNOWN_COMPRESSION if fallback else COMPRESSION_ZLIB
+        package, rows = _write_package(data, compression_type)
+        del data
+        fd, path = tempfile.mkstemp(suffix=".package")
+        with os.fdopen(fd, "wb") as f:
+            f.write(package)
+        del package
+        reader = PackageReader(path, codecs=CodecRegistry(fallback=fallback))
+        reader.entries = IndexTable.from_rows(rows)
+        reader.open()
+
+        def extract_all():
+            for entry in reader.entries:
+                reader.extract_resource(entry)
+
+        def cleanup():
+            reader.close()
+            os.remove(path)
+        return extract_all, cleanup
+
+    if case == "unshuffle_dst1":
+        return lambda: image_decoder._unshuffle_dst1(data), lambda: None
+    if case == "unshuffle_dst5":
+        return lambda: image_decoder._unshuffle_dst5(data), lambda: None
+    if case == "stbl.parse":
+        return lambda: StringTableReader.parse(data), lambda: None
+    raise ValueError("Unknown benchmark case: {}".format(case))
+
+
+def _peak_rss_mb():
+    # type: () -> Optional[float]
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def run_case(case, corpus_name, size, repeat, cache_dir):
+    # type: (str, str, int, int, str) -> Dict[str, object]
+    """Time one case in this process and return its report entry."""
+    func, cleanup = _prepare(case, corpus_name, size, cache_dir)
+    try:
+        best = None  # type: Optional[float]
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        cleanup()
+    return {
+        "case": case,
+        "corpus": corpus_name,
+        "size": size,
+        "seconds": best,
+        "mb_per_s": size / (1 << 20) / best if best else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_case_child(queue, *args):
+    try:
+        queue.put(run_case(*args))
+    except Exception as e:
+        queue.put({"error": "{}: {}".format(type(e).__name__, e)})
+
+
+def _run_isolated(*args):
+    # type: (object) -> Dict[str, object]
+    """Run one case in a fresh process, so ru_maxrss is the case's own."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case_child, args=(queue,) + args)
+    process.start()
+    try:
+        result = queue.get()
+    finally:
+        process.join()
+    if "error" in result:
+        raise RuntimeError("Benchmark case {} failed: {}".format(args[0], result["error"]))
+    return result
+
+
+def run(cases, sizes, repeat=3, cache_dir=None, isolate=True):
+    # type: (List[str], List[int], int, Optional[str], bool) -> Dict[str, object]
+    """Run the selected cases at each size and return the report."""
+    cache_dir = cache_dir or default_bench_cache_dir()
+    results = []
+    for size in sizes:
+        for case in cases:
+            for corpus_name in CASES[case]:
+                # Generate inputs here so their cost stays out of the case's RSS
+                _input_file(case, corpus_name, size, cache_dir)
+                args = (case, corpus_name, size, repeat, cache_dir)
+                results.append(_run_isolated(*args) if isolate else run_case(*args))
+    return {
+        "version": REPORT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def _result_key(result):
+    # type: (Dict[str, object]) -> str
+    return "{case}/{corpus}/{size}".format(**result)
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    # type: (Dict[str, object], Dict[str, object], float) -> List[str]
+    """Describe each case that regressed by more than threshold percent.
+
+    A regression is lower throughput or higher peak RSS than the baseline.
+    Cases missing from either report are skipped.
+    """
+    previous = {_result_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = _result_key(result)
+        base = previous.get(key)
+        if base is None:
+            continue
+        if result["mb_per_s"] and base["mb_per_s"]:
+            change = (result["mb_per_s"] / base["mb_per_s"] - 1) * 100
+            if change < -threshold:
+                regressions.append("{}: {:.1f} MB/s vs {:.1f} MB/s ({:+.1f}%)".format(
+                    key, result["mb_per_s"], base["mb_per_s"], change))
+        if result["peak_rss_mb"] and base["peak_rss_mb"]:
+            change = (result["peak_rss_mb"] / base["peak_rss_mb"] - 1) * 100
+            if change > threshold:
+                regressions.append("{}: peak RSS {:.0f} MB vs {:.0f} MB ({:+.1f}%)".format(
+                    key, result["peak_rss_mb"], base["peak_rss_mb"], change))
+    return regressions
+
+
+def _format_size(size):
+    # type: (int) -> str
+    for suffix, unit in (("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)):
+        if size >= unit and size % unit == 0:
+            return "{}{}".format(size // unit, suffix)
+    return str(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark codec throughput")
+    parser.add_argument("--sizes", nargs="+", default=["1M"],
+                        help="Corpus sizes, e.g. 1M 16M 128M (default: 1M)")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES),
+                        help="Cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per case; the best is reported (default: 3)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="Baseline JSON report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Regression threshold in percent (default: 10)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Where generated inputs are cached (default: {})".format(
+                            default_bench_cache_dir()))
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="Run cases in this process (peak RSS is then cumulative)")
+    args = parser.parse_args()
+
+    report = run(args.cases, [parse_size(s) for s in args.sizes], args.repeat,
+                 args.cache_dir, isolate=not args.no_isolate)
+
+    print("{:<28} {:<12} {:>6} {:>12} {:>12}".format("Case", "Corpus", "Size", "MB/s", "Peak RSS"))
+    for result in report["results"]:
+        rss = result["peak_rss_mb"]
+        print("{:<28} {:<12} {:>6} {:>12.1f} {:>12}".format(
+            result["case"], result["corpus"], _format_size(result["size"]), result["mb_per_s"],
+            "{:.0f} MB".format(rss) if rss is not None else "-"))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print("Report written to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("Regressions over {:.0f}% against {}:".format(args.threshold, args.compare))
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("No regressions over {:.0f}% against {}".format(args.threshold, args.compare))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark DBPF index parsing throughput (entries/sec).
+
+Compares the original field-by-field loop (one read + unpack per field)
+against the bulk struct parser and, when NumPy is installed, the
+structured-array backend. The "table" rows build only the columnar
+IndexTable, without materializing a tuple per entry.
+
+Usage:
+    python -m benchmarks.bench_index [--entries 200000] [--repeat 3]
+"""
+
+import argparse
+import io
+import random
+import struct
+import time
+
+from util.datamining.package_index import IndexTable, index_body_size, np, parse_index
+
+
+def build_index_body(entry_count, flags=0, seed=0):
+    # type: (int, int, int) -> bytes
+    """Build a synthetic index body (everything after the flags word)."""
+    rng = random.Random(seed)
+    parts = [struct.pack("<I", 0x00B2D882) for bit in range(4) if flags & (1 << bit)]
+    record = struct.Struct("<" + "I" * (4 - len(parts)) + "IIIHH")
+    key_count = 4 - len(parts)
+    for _ in range(entry_count):
+        key = [rng.getrandbits(32) for _ in range(key_count)]
+        parts.append(record.pack(*key, rng.getrandbits(31), rng.getrandbits(31),
+                                 rng.getrandbits(31), 0x5A42, 1))
+    return b"".join(parts)
+
+
+def legacy_parse(f, flags, entry_count):
+    """The pre-bulk PackageReader._read_index loop, kept as a baseline."""
+    const = [0, 0, 0, 0]
+    for i in range(4):
+        if flags & (1 << i):
+            const[i] = struct.unpack("<I", f.read(4))[0]
+    rows = []
+    for _ in range(entry_count):
+        type_id = const[0] if (flags & 0x01) else struct.unpack("<I", f.read(4))[0]
+        group = const[1] if (flags & 0x02) else struct.unpack("<I", f.read(4))[0]
+        instance_hi = const[2] if (flags & 0x04) else struct.unpack("<I", f.read(4))[0]
+        instance_lo = const[3] if (flags & 0x08) else struct.unpack("<I", f.read(4))[0]
+        offset, file_size = struct.unpack("<II", f.read(8))
+        mem_size, compressed = struct.unpack("<IH", f.read(6))
+        f.read(2)
+        rows.append((type_id, group, (instance_hi << 32) | instance_lo,
+                     offset, file_size & 0x7FFFFFFF, mem_size, compressed))
+    return rows
+
+
+def _best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(entry_count, flags, repeat):
+    # type: (int, int, int) -> dict
+    """Time each parser and return {name: entries_per_second}."""
+    body = build_index_body(entry_count, flags)
+    assert len(body) == index_body_size(flags, entry_count)
+
+    expected = legacy_parse(io.BytesIO(body), flags, entry_count)
+    candidates = [
+        ("legacy", lambda: legacy_parse(io.BytesIO(body), flags, entry_count)),
+        ("struct", lambda: parse_index(body, flags, entry_count, backend="struct")),
+    ]
+    if np is not None:
+        candidates.append(
+            ("numpy", lambda: parse_index(body, flags, entry_count, backend="numpy")))
+
+    for backend in ("struct", "numpy") if np is not None else ("struct",):
+        # Columns only; correctness is covered by the row variant above
+        candidates.append(("table-" + backend, lambda backend=backend: IndexTable.from_index(
+            body, flags, entry_count, backend=backend)))
+
+    results = {}
+    for name, func in candidates:
+        if not name.startswith("table-") and func() != expected:
+            raise AssertionError("{} parser output differs from legacy".format(name))
+        results[name] = entry_count / _best_time(func, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DBPF index parsing")
+    parser.add_argument("--entries", type=int, default=200000,
+                        help="Number of index entries (default: 200000)")
+    parser.add_argument("--flags", type=lambda v: int(v, 0), default=0,
+                        help="Index constant-field flags (default: 0)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per parser; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    results = run(args.entries, args.flags, args.repeat)
+    baseline = results["legacy"]
+    print("Index parsing: {} entries, flags=0x{:X}".format(args.entries, args.flags))
+    for name, rate in results.items():
+        print("  {:<14} {:>14,.0f} entries/sec  ({:.1f}x)".format(name, rate, rate / baseline))
+    print("  (table-* = columnar IndexTable only, no per-entry rows)")
+
+
+if __name__ == "__main__":
+    main()
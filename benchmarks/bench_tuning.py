@@ -0,0 +1,77 @@
+"""
+Benchmark binary CombinedTuning decoding into an ElementTree.
+
+Compares the text round trip (decode_combined_tuning, then ET.fromstring)
+against build_combined_tuning_tree, which feeds elements to a TreeBuilder
+straight from the DATA tables. Each is run with the NumPy table reader
+(when installed) and the pure-Python one. The input is a deterministic
+synthetic DATA blob from benchmarks.corpora.
+
+Usage:
+    python -m benchmarks.bench_tuning [--size 16M] [--repeat 3]
+"""
+
+import argparse
+import time
+import xml.etree.ElementTree as ET
+
+from benchmarks.corpora import combined_tuning_data, parse_size
+from util.datamining.binary_tuning import build_combined_tuning_tree, decode_combined_tuning, np
+
+
+def _best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(size, repeat, seed=0):
+    # type: (int, int, int) -> dict
+    """Time each decoder on a DATA blob of about size bytes.
+
+    Returns {name: seconds} plus "bytes", the actual blob size.
+    """
+    data = combined_tuning_data(size, seed)
+    expected = ET.tostring(ET.fromstring(decode_combined_tuning(data, backend="python")))
+
+    candidates = []
+    for backend in ("numpy", "python") if np is not None else ("python",):
+        candidates.append(("text-" + backend, lambda backend=backend: ET.fromstring(
+            decode_combined_tuning(data, backend=backend))))
+        candidates.append(("tree-" + backend, lambda backend=backend: build_combined_tuning_tree(
+            data, backend=backend)))
+
+    results = {"bytes": len(data)}
+    for name, func in candidates:
+        if ET.tostring(func()) != expected:
+            raise AssertionError("{} tree differs from the decoded XML".format(name))
+        results[name] = _best_time(func, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CombinedTuning tree building")
+    parser.add_argument("--size", type=parse_size, default=parse_size("16M"),
+                        help="Approximate DATA blob size, e.g. 1M or 64M (default: 16M)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per decoder; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    results = run(args.size, args.repeat)
+    size = results.pop("bytes")
+    print("CombinedTuning to ElementTree: {:,} bytes of DATA".format(size))
+    for name, seconds in results.items():
+        print("  {:<14} {:>8.3f}s  {:>7.1f} MB/s".format(name, seconds, size / seconds / 1e6))
+    for backend in ("numpy", "python"):
+        if "tree-" + backend in results:
+            text, tree = results["text-" + backend], results["tree-" + backend]
+            print("  {}: building the tree directly saves {:.3f}s ({:.1f}x)".format(
+                backend, text - tree, text / tree))
+
+
+if __name__ == "__main__":
+    main()
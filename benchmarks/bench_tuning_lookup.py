@@ -0,0 +1,125 @@
+"""
+Benchmark CombinedTuningParser lookups (lookups/sec).
+
+Builds a tree of synthetic <I> elements and times find_by_name,
+find_by_instance_id and by_class against the original linear scans over
+every TuningElement. Index lookups are timed once the index exists; the
+one-off cost of building each index is reported separately.
+
+Usage:
+    python -m benchmarks.bench_tuning_lookup [--elements 200000] [--lookups 2000]
+"""
+
+import argparse
+import random
+import time
+import xml.etree.ElementTree as ET
+
+from util.datamining.combined_tuning import CombinedTuningParser
+
+_CLASSES = ["Buff", "Trait", "Skill", "Career", "Interaction", "Loot", "Object", "Situation"]
+
+
+def build_tuning_root(element_count, seed=0):
+    # type: (int, int) -> ET.Element
+    """A <combined> root with element_count <I> entries spread over <R> groups."""
+    rng = random.Random(seed)
+    root = ET.Element("combined")
+    ET.SubElement(root, "g", s="merged")
+    group = None
+    for i in range(element_count):
+        if i % 1000 == 0:
+            group = ET.SubElement(root, "R")
+        cls = rng.choice(_CLASSES)
+        el = ET.SubElement(group, "I", c=cls, i=cls.lower(), m="tuning.{}".format(cls.lower()),
+                           n="{}_{}".format(cls.lower(), i), s=str(100000 + i))
+        ET.SubElement(el, "T", n="value").text = str(i)
+    return root
+
+
+def _linear_find(parser, attribute, value):
+    """The pre-index lookup: scan every element."""
+    for el in parser:
+        if getattr(el, attribute) == value:
+            return el
+    return None
+
+
+def _best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(element_count, lookup_count, repeat=3, seed=0):
+    # type: (int, int, int, int) -> dict
+    """Time each lookup strategy.
+
+    Returns {name: lookups_per_second} for the scans and the warm indexes,
+    and {"build-" + attribute: seconds} for building each index once.
+    """
+    root = build_tuning_root(element_count, seed)
+    rng = random.Random(seed + 1)
+    rows = [rng.randrange(element_count) for _ in range(lookup_count)]
+    names = [root[1 + row // 1000][row % 1000].get("n") for row in rows]
+    ids = [100000 + row for row in rows]
+    classes = [rng.choice(_CLASSES) for _ in range(lookup_count)]
+    # Scans are slow, so they only do 1% of the lookups
+    scan_count = max(lookup_count // 100, 1)
+
+    results = {}
+    for attribute in ("name", "instance_id", "cls"):
+        parser = CombinedTuningParser(root)
+        start = time.perf_counter()
+        parser._index(attribute)
+        results["build-" + attribute] = time.perf_counter() - start
+
+    parser = CombinedTuningParser(root)
+    candidates = [
+        ("name-scan", scan_count,
+         lambda: [_linear_find(parser, "name", n) for n in names[:scan_count]]),
+        ("name-index", lookup_count, lambda: [parser.find_by_name(n) for n in names]),
+        ("id-scan", scan_count,
+         lambda: [_linear_find(parser, "instance_id", i) for i in ids[:scan_count]]),
+        ("id-index", lookup_count, lambda: [parser.find_by_instance_id(i) for i in ids]),
+        ("class-scan", scan_count,
+         lambda: [[el for el in parser if el.cls == c] for c in classes[:scan_count]]),
+        ("class-index", lookup_count, lambda: [parser.by_class(c) for c in classes]),
+    ]
+
+    for name, i in zip(names[:10], ids[:10]):
+        found = parser.find_by_name(name)
+        if found is not _linear_find(parser, "name", name) or \
+                parser.find_by_instance_id(i) is not found:
+            raise AssertionError("Indexed lookup differs from the linear scan")
+
+    for name, count, func in candidates:
+        results[name] = count / _best_time(func, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CombinedTuningParser lookups")
+    parser.add_argument("--elements", type=int, default=200000,
+                        help="Number of <I> elements (default: 200000)")
+    parser.add_argument("--lookups", type=int, default=2000,
+                        help="Lookups per indexed run; scans do 1%% of these (default: 2000)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per strategy; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    results = run(args.elements, args.lookups, args.repeat)
+    print("CombinedTuningParser lookups: {} elements".format(args.elements))
+    for name, value in results.items():
+        if name.startswith("build-"):
+            print("  {:<18} {:>10.3f} s (index build)".format(name, value))
+        else:
+            print("  {:<18} {:>10,.0f} lookups/sec".format(name, value))
+
+
+if __name__ == "__main__":
+    main()
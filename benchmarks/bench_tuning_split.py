@@ -0,0 +1,175 @@
+"""
+Benchmark splitting CombinedTuning into files: time and peak RSS.
+
+Compares split_combined_tuning, which returns every entry's XML before
+anything is written, against iter_split_combined_tuning, which yields
+entries so each file is written and dropped as it comes (as extract-all
+does). Both write one file per entry into a temporary directory, laid out
+like xml/{class}/{name}.xml. Each runs on binary DATA and on the XML text
+it decodes to (the base game format). The seconds include creating every
+file, so they are mostly filesystem time.
+
+Each mode runs in a fresh process so its peak RSS is its own (RSS is not
+reported on Windows). Inputs are generated in a process of their own and
+passed by file: Linux carries ru_maxrss across fork and exec, so the
+parent has to stay small for the children's peaks to mean anything.
+"baseline" is the peak RSS with the input loaded, before splitting.
+
+Usage:
+    python -m benchmarks.bench_tuning_split [--size 16M] [--formats data xml]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Iterable, List, Sequence
+
+from benchmarks.bench_codecs import _peak_rss_mb
+from benchmarks.corpora import combined_tuning_data, parse_size
+from util.datamining.binary_tuning import decode_combined_tuning
+from util.datamining.tuning_splitter import SplitEntry, iter_split_combined_tuning, split_combined_tuning
+
+MODES = {
+    "list": split_combined_tuning,
+    "iter": iter_split_combined_tuning,
+}
+
+FORMATS = ("data", "xml")
+
+
+def _write_entries(entries, out_dir):
+    # type: (Iterable[SplitEntry], str) -> int
+    """Write each entry to out_dir/{class}/{name}.xml; returns the count."""
+    count = 0
+    for entry in entries:
+        cls_dir = os.path.join(out_dir, entry.cls or "_modules")
+        os.makedirs(cls_dir, exist_ok=True)
+        path = os.path.join(cls_dir, "{}.xml".format(entry.name or entry.instance_id))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(entry.xml)
+        count += 1
+    return count
+
+
+def run_mode(mode, data_path):
+    # type: (str, str) -> Dict[str, object]
+    """Split the resource in data_path with one mode, in this process."""
+    with open(data_path, "rb") as f:
+        data = f.read()
+    baseline = _peak_rss_mb()
+    out_dir = tempfile.mkdtemp(prefix="bench-split-")
+    try:
+        start = time.perf_counter()
+        count = _write_entries(MODES[mode](data), out_dir)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(out_dir)
+    return {
+        "mode": mode,
+        "entries": count,
+        "seconds": seconds,
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _write_inputs(paths, size, seed):
+    # type: (Dict[str, str], int, int) -> None
+    """Write the DATA blob and/or its XML to paths ({format: path})."""
+    data = combined_tuning_data(size, seed)
+    for fmt, path in paths.items():
+        with open(path, "wb") as f:
+            f.write(data if fmt == "data" else decode_combined_tuning(data).encode("utf-8"))
+
+
+def _run_mode_child(queue, *args):
+    try:
+        queue.put(run_mode(*args))
+    except Exception as e:
+        queue.put({"error": "{}: {}".format(type(e).__name__, e)})
+
+
+def _run_isolated(*args):
+    # type: (object) -> Dict[str, object]
+    """Run one mode in a fresh process, so ru_maxrss is the mode's own."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_mode_child, args=(queue,) + args)
+    process.start()
+    try:
+        result = queue.get()
+    finally:
+        process.join()
+    if "error" in result:
+        raise RuntimeError("Split mode {} failed: {}".format(args[0], result["error"]))
+    return result
+
+
+def run(size, seed=0, formats=FORMATS, isolate=True):
+    # type: (int, int, Sequence[str], bool) -> Dict[str, object]
+    """Split a DATA blob of about size bytes, or its XML, with each mode.
+
+    Returns {"bytes": {format: input size}, "results": [...]}, one result
+    per format and mode.
+    """
+    paths = {}  # type: Dict[str, str]
+    try:
+        for fmt in formats:
+            fd, paths[fmt] = tempfile.mkstemp(suffix="." + fmt)
+            os.close(fd)
+        if isolate:
+            process = multiprocessing.get_context("spawn").Process(
+                target=_write_inputs, args=(paths, size, seed))
+            process.start()
+            process.join()
+            if process.exitcode:
+                raise RuntimeError("Generating the benchmark inputs failed")
+        else:
+            _write_inputs(paths, size, seed)
+
+        results = []  # type: List[Dict[str, object]]
+        for fmt in formats:
+            for mode in MODES:
+                args = (mode, paths[fmt])
+                result = _run_isolated(*args) if isolate else run_mode(*args)
+                result["format"] = fmt
+                results.append(result)
+        return {
+            "bytes": {fmt: os.path.getsize(path) for fmt, path in paths.items()},
+            "results": results,
+        }
+    finally:
+        for path in paths.values():
+            os.remove(path)
+
+
+def _format_rss(rss):
+    # type: (object) -> str
+    return "{:.0f} MB".format(rss) if rss is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CombinedTuning splitting")
+    parser.add_argument("--size", type=parse_size, default=parse_size("16M"),
+                        help="Approximate DATA blob size, e.g. 1M or 64M (default: 16M)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS),
+                        help="Input formats to split (default: both)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.size, args.seed, args.formats)
+    for fmt, size in report["bytes"].items():
+        print("{} input: {:.1f} MB".format(fmt, size / (1 << 20)))
+    print("{:<6} {:<6} {:>8} {:>10} {:>10} {:>10}".format(
+        "Format", "Mode", "Entries", "Seconds", "Baseline", "Peak RSS"))
+    for result in report["results"]:
+        print("{:<6} {:<6} {:>8} {:>10.2f} {:>10} {:>10}".format(
+            result["format"], result["mode"], result["entries"], result["seconds"],
+            _format_rss(result["baseline_rss_mb"]), _format_rss(result["peak_rss_mb"])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Deterministic synthetic corpora for the codec benchmarks.
+
+Each generator returns exactly `size` bytes and gives the same output for
+the same (size, seed) on every platform and Python version, so reports
+from different machines and commits measure the same input. Content is
+assembled from a pool of pre-generated pieces, which keeps generation of
+the 128 MB sizes fast and gives realistic compressibility.
+"""
+
+import random
+import struct
+import xml.etree.ElementTree as ET
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from util.datamining.string_table import STBL_HEADER_SIZE, STBL_MAGIC
+
+SIZES = {
+    "1M": 1 << 20,
+    "16M": 16 << 20,
+    "128M": 128 << 20,
+}
+
+_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+_WORDS = [
+    "buff", "trait", "interaction", "loot", "object", "sim", "career", "mood",
+    "skill", "commodity", "aspiration", "situation", "affordance", "tuning",
+    "state", "test", "tooltip", "statistic", "reward", "whim", "zone", "venue",
+]
+
+
+def parse_size(text):
+    # type: (str) -> int
+    """Parse a corpus size such as "1M", "128M" or "64K"."""
+    text = text.strip().upper()
+    if text and text[-1] in _UNITS:
+        return int(text[:-1]) * _UNITS[text[-1]]
+    return int(text)
+
+
+def _random_bytes(rng, count):
+    # type: (random.Random, int) -> bytes
+    return rng.getrandbits(count * 8).to_bytes(count, "little") if count else b""
+
+
+def _fill(pieces, size, rng):
+    # type: (List[bytes], int, random.Random) -> bytes
+    """Concatenate randomly chosen pieces up to exactly size bytes."""
+    average = sum(len(p) for p in pieces) // len(pieces)
+    parts = []  # type: List[bytes]
+    total = 0
+    while total < size:
+        batch = rng.choices(pieces, k=max((size - total) // average + 1, 1))
+        parts.extend(batch)
+        total += sum(len(p) for p in batch)
+    return b"".join(parts)[:size]
+
+
+def tuning_xml(size, seed=0):
+    # type: (int, int) -> bytes
+    """Text-like tuning XML lines."""
+    rng = random.Random(seed)
+    lines = []  # type: List[bytes]
+    for i in range(4096):
+        name = "_".join(rng.choice(_WORDS) for _ in range(rng.randint(2, 4)))
+        kind = rng.choice(("T", "E", "V", "U"))
+        if kind == "T":
+            value = str(rng.randint(0, 10 ** rng.randint(1, 10)))
+        elif kind == "E":
+            value = rng.choice(_WORDS).upper()
+        else:
+            value = "{:.4f}".format(rng.random() * 100)
+        lines.append('  <{0} n="{1}">{2}</{0}>\n'.format(kind, name, value).encode("ascii"))
+    return _fill(lines, size, rng)
+
+
+def binary_data(size, seed=0):
+    # type: (int, int) -> bytes
+    """DATA-like binary records: small integers, floats, and hashes."""
+    rng = random.Random(seed)
+    records = []  # type: List[bytes]
+    for _ in range(2048):
+        records.append(struct.pack(
+            "<IIQfHH",
+            rng.randint(0, 64), rng.choice((0, 1, 0xFFFFFFFF)), rng.getrandbits(64),
+            rng.random(), rng.randint(0, 16), 0))
+    return _fill(records, size, rng)
+
+
+def dds_blocks(size, seed=0):
+    # type: (int, int) -> bytes
+    """Block-compressed texture data (a multiple of 16 bytes, near incompressible)."""
+    rng = random.Random(seed)
+    size -= size % 16
+    step = 1 << 20
+    return b"".join(_random_bytes(rng, min(step, size - pos)) for pos in range(0, size, step))
+
+
+def stbl_blob(size, seed=0):
+    # type: (int, int) -> bytes
+    """A valid STBL resource of about size bytes (never more)."""
+    rng = random.Random(seed)
+    entries = []  # type: List[bytes]
+    total = STBL_HEADER_SIZE
+    while True:
+        text = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 12))).capitalize()
+        encoded = text.encode("utf-8")
+        entry = struct.pack("<IBH", rng.getrandbits(32), 0, len(encoded)) + encoded
+        if total + len(entry) > size:
+            break
+        entries.append(entry)
+        total += len(entry)
+    body = b"".join(entries)
+    header = STBL_MAGIC + struct.pack("<HBQHI", 5, 0, len(entries), 0, len(body))
+    return header + body
+
+
+CORPORA = {
+    "tuning_xml": tuning_xml,
+    "binary_data": binary_data,
+    "dds_blocks": dds_blocks,
+    "stbl_blob": stbl_blob,
+}  # type: Dict[str, Callable[[int, int], bytes]]
+
+
+# -- Binary CombinedTuning (DATA) --
+
+_DATA_OBJECT = 13
+_DATA_UINT32 = 7
+_DATA_CHARACTER = 1
+_RELOFFSET_NULL = -0x80000000
+
+# (schema name, [(column name, data type, offset)], row size)
+_DATA_SCHEMAS = [
+    ("PackedXmlDocument", [("first_element", _DATA_OBJECT, 0), ("top_element", _DATA_OBJECT, 4),
+                           ("element_count", _DATA_UINT32, 8), ("string_table", _DATA_OBJECT, 12)], 16),
+    ("PackedXmlNode", [("text", _DATA_UINT32, 0), ("attrs", _DATA_OBJECT, 4),
+                       ("children", _DATA_OBJECT, 8)], 12),
+    ("PackedXmlAttributes", [("name", _DATA_UINT32, 0), ("value", _DATA_UINT32, 4)], 8),
+]
+
+
+def _align(pos, alignment=16):
+    # type: (int, int) -> int
+    return pos + (-pos & (alignment - 1))
+
+
+def encode_combined_tuning(root):
+    # type: (ET.Element) -> bytes
+    """Encode an element tree as binary CombinedTuning (DATA version 0x101).
+
+    Element text becomes a text node before the element's children (tails
+    are not encoded). The layout follows what binary_tuning decodes: text
+    nodes come first in the node table, then elements in document order.
+    """
+    strings = {}  # type: Dict[str, int]
+
+    def string_index(text):
+        # type: (str) -> int
+        return strings.setdefault(text, len(strings))
+
+    # Number the nodes: text nodes first, then elements in document order
+    elements = list(root.iter())
+    element_row = {id(el): i for i, el in enumerate(elements)}
+    text_nodes = []  # type: List[str]
+    children = []  # type: List[List[Tuple[str, int]]]
+    for el in elements:
+        kids = []  # type: List[Tuple[str, int]]
+        if el.text:
+            kids.append(("text", len(text_nodes)))
+            text_nodes.append(el.text)
+        kids.extend(("element", element_row[id(child)]) for child in el)
+        children.append(kids)
+    text_count = len(text_nodes)
+
+    # Row counts of tables 0-5; attribute/child reference lists end with a null
+    attr_count = sum(len(el.attrib) for el in elements)
+    attr_ref_count = sum(len(el.attrib) + 1 for el in elements if el.attrib)
+    node_ref_count = sum(len(kids) + 1 for kids in children if kids)
+    for el in elements:
+        string_index(el.tag)
+        for name, value in el.attrib.items():
+            string_index(name)
+            string_index(value)
+    for text in text_nodes:
+        string_index(text)
+    char_data = b"".join(s.encode("utf-8") + b"\x00" for s in strings)
+
+    header_size = 28
+    table_header_size = 28
+    counts = [1, text_count + len(elements), attr_count, node_ref_count, attr_ref_count,
+              len(strings), len(char_data)]
+    row_sizes = [16, 12, 8, 4, 4, 4, 1]
+    starts = []  # type: List[int]
+    pos = header_size + 7 * table_header_size
+    for count, row_size in zip(counts, row_sizes):
+        pos = _align(pos)
+        starts.append(pos)
+        pos += count * row_size
+    schema_start = _align(pos, 4)
+    columns_start = schema_start + 24 * len(_DATA_SCHEMAS)
+    names_start = columns_start + 20 * sum(len(cols) for _, cols, _ in _DATA_SCHEMAS)
+
+    buf = bytearray(names_start)
+    names = bytearray()
+
+    def name_at(field_pos, name):
+        # type: (int, str) -> Tuple[int, int]
+        """Relative offset of a name string from field_pos, and its hash."""
+        offset = names_start + len(names)
+        names.extend(name.encode("utf-8") + b"\x00")
+        return offset - field_pos, zlib.crc32(name.encode("utf-8"))
+
+    def offset_to(field_pos, target):
+        # type: (int, Optional[int]) -> int
+        return _RELOFFSET_NULL if target is None else target - field_pos
+
+    struct.pack_into("<4sIiiiiI", buf, 0, b"DATA", 0x101, header_size - 8, 7,
+                     schema_start - 16, len(_DATA_SCHEMAS), 0)
+
+    # Table headers: tables 0-2 use schemas 0-2; 3-5 are offsets, 6 characters
+    for i in range(7):
+        pos = header_size + i * table_header_size
+        name_offset, name_hash = name_at(pos, "Table{}".format(i))
+        schema = _RELOFFSET_NULL if i > 2 else schema_start + 24 * i - (pos + 8)
+        data_type = _DATA_CHARACTER if i == 6 else _DATA_OBJECT
+        struct.pack_into("<iIiIIiI", buf, pos, name_offset, name_hash, schema, data_type,
+                         row_sizes[i], starts[i] - (pos + 20), counts[i])
+
+    column_pos = columns_start
+    for i, (schema_name, columns, size) in enumerate(_DATA_SCHEMAS):
+        pos = schema_start + 24 * i
+        name_offset, name_hash = name_at(pos, schema_name)
+        struct.pack_into("<iIIIiI", buf, pos, name_offset, name_hash, name_hash, size,
+                         column_pos - (pos + 16), len(columns))
+        for column_name, data_type, offset in columns:
+            name_offset, name_hash = name_at(column_pos, column_name)
+            struct.pack_into("<iIHHIi", buf, column_pos, name_offset, name_hash, data_type, 0,
+                             offset, _RELOFFSET_NULL)
+            column_pos += 20
+
+    def node_pos(kind, index):
+        # type: (str, int) -> int
+        row = index if kind == "text" else text_count + index
+        return starts[1] + 12 * row
+
+    # Table 0: the document
+    first_element = node_pos("element", 0)
+    struct.pack_into("<iiIi", buf, starts[0], first_element - starts[0],
+                     first_element - (starts[0] + 4), len(elements),
+                     starts[5] - (starts[0] + 12))
+
+    # Tables 1-4: nodes, attributes, and their reference lists
+    attr_row = 0
+    attr_ref = 0
+    node_ref = 0
+    for i, text in enumerate(text_nodes):
+        pos = starts[1] + 12 * i
+        struct.pack_into("<Iii", buf, pos, string_index(text), _RELOFFSET_NULL, _RELOFFSET_NULL)
+    for i, el in enumerate(elements):
+        pos = node_pos("element", i)
+        attrs_at = None
+        if el.attrib:
+            attrs_at = starts[4] + 4 * attr_ref
+            for name, value in el.attrib.items():
+                attr_pos = starts[2] + 8 * attr_row
+                struct.pack_into("<II", buf, attr_pos, string_index(name), string_index(value))
+                ref_pos = starts[4] + 4 * attr_ref
+                struct.pack_into("<i", buf, ref_pos, attr_pos - ref_pos)
+                attr_row += 1
+                attr_ref += 1
+            struct.pack_into("<i", buf, starts[4] + 4 * attr_ref, _RELOFFSET_NULL)
+            attr_ref += 1
+        children_at = None
+        if children[i]:
+            children_at = starts[3] + 4 * node_ref
+            for kind, index in children[i]:
+                ref_pos = starts[3] + 4 * node_ref
+                struct.pack_into("<i", buf, ref_pos, node_pos(kind, index) - ref_pos)
+                node_ref += 1
+            struct.pack_into("<i", buf, starts[3] + 4 * node_ref, _RELOFFSET_NULL)
+            node_ref += 1
+        struct.pack_into("<Iii", buf, pos, string_index(el.tag), offset_to(pos + 4, attrs_at),
+                         offset_to(pos + 8, children_at))
+
+    # Tables 5-6: string references into the character data
+    char_pos = starts[6]
+    for i, text in enumerate(strings):
+        ref_pos = starts[5] + 4 * i
+        struct.pack_into("<i", buf, ref_pos, char_pos - ref_pos)
+        char_pos += len(text.encode("utf-8")) + 1
+    buf[starts[6]:starts[6] + len(char_data)] = char_data
+
+    return bytes(buf + names)
+
+
+def combined_tuning_tree(entries, seed=0):
+    # type: (int, int) -> ET.Element
+    """A <combined> tuning document with a shared <g> table and entries <I>."""
+    rng = random.Random(seed)
+    root = ET.Element("combined")
+    shared = ET.SubElement(root, "g")
+    for x in range(64):
+        value = ET.SubElement(shared, rng.choice(("T", "E")), x=str(x))
+        value.text = rng.choice(_WORDS)
+    group = ET.SubElement(root, "R")
+    for i in range(entries):
+        name = "_".join(rng.choice(_WORDS) for _ in range(3)) + "_{}".format(i)
+        entry = ET.SubElement(group, "I", c=rng.choice(_WORDS).capitalize(),
+                              i=rng.choice(_WORDS), m="tuning." + rng.choice(_WORDS),
+                              n=name, s=str(10000 + i))
+        for _ in range(rng.randint(2, 12)):
+            kind = rng.random()
+            field = rng.choice(_WORDS) + "_" + rng.choice(_WORDS)
+            if kind < 0.5:
+                child = ET.SubElement(entry, "T", n=field)
+                child.text = str(rng.randint(0, 100000))
+            elif kind < 0.7:
+                ET.SubElement(entry, "r", n=field, x=str(rng.randrange(64)))
+            elif kind < 0.85:
+                items = ET.SubElement(entry, "L", n=field)
+                for _ in range(rng.randint(1, 6)):
+                    ET.SubElement(items, "T").text = str(rng.randint(0, 1000))
+            else:
+                tup = ET.SubElement(entry, "U", n=field)
+                ET.SubElement(tup, "E", n="kind").text = rng.choice(_WORDS).upper()
+                ET.SubElement(tup, "V", n="amount", t="value").text = "{:.2f}".format(rng.random())
+    return root
+
+
+def combined_tuning_data(size, seed=0):
+    # type: (int, int) -> bytes
+    """Binary CombinedTuning of roughly size bytes (whole entries only)."""
+    # About 700 bytes of DATA per entry
+    return encode_combined_tuning(combined_tuning_tree(max(size // 700, 1), seed))
@@ -3,7 +3,11 @@ import json
 import os
 import sys
 
-from util.datamining.package_reader import PackageReader
+from util.datamining.compression import COMPRESSION_DELETED, CodecRegistry
+from util.datamining.index_cache import IndexCache, default_cache_dir
+from util.datamining.package_reader import ZERO_COPY_SUPPORTED, PackageReader
+from util.datamining.parallel_extract import ParallelExtractor
+from util.datamining.resource_index import GameResourceIndex
 from util.datamining.resource_types import (
     RESOURCE_TYPE_LABELS,
     COMBINED_TUNING_TYPE_ID,
@@ -15,9 +19,17 @@ from util.datamining.resource_types import (
 from util.datamining.tuning_parser import TuningParser
 
 
+def _open_index_cache(args):
+    """Return the IndexCache selected on the command line, or None if disabled."""
+    cache_dir = getattr(args, "index_cache", None)
+    if not cache_dir:
+        return None
+    return IndexCache(cache_dir)
+
+
 def cmd_extract(args):
     """Extract tuning XML from a .package file."""
-    reader = PackageReader(args.package)
+    reader = PackageReader(args.package, index_cache=_open_index_cache(args))
     reader.read()
 
     tuning_entries = reader.extract_tuning_entries()
@@ -39,7 +51,8 @@ def cmd_extract(args):
 
 def cmd_info(args):
     """Show information about a .package file."""
-    reader = PackageReader(args.package)
+    index_cache = _open_index_cache(args)
+    reader = PackageReader(args.package, index_cache=index_cache)
     reader.read()
 
     print("Package: {}".format(args.package))
@@ -57,6 +70,13 @@ def cmd_info(args):
         suffix = " ({})".format(label) if label else ""
         print("    0x{:08X}: {} entries{}".format(type_id, count, suffix))
 
+    if index_cache is not None:
+        stats = index_cache.stats()
+        print("  Index cache: {}".format(index_cache.cache_dir))
+        print("    Hits: {}, misses: {}".format(stats["hits"], stats["misses"]))
+        print("    Bytes read: {}, bytes written: {}".format(
+            stats["bytes_read"], stats["bytes_written"]))
+
 
 def cmd_extract_all(args):
     """Extract resources from all game packages.
@@ -68,7 +88,7 @@ def cmd_extract_all(args):
     - --types DDS STBL ...: Extract only the specified types (smart processing
                             where available, raw .bin otherwise)
     """
-    from util.datamining.tuning_splitter import split_combined_tuning
+    from util.datamining.tuning_splitter import iter_split_combined_tuning
     from util.datamining.string_table import StringTableReader
     from util.datamining.image_decoder import decode_image_to_png
 
@@ -103,13 +123,23 @@ def cmd_extract_all(args):
 
     os.makedirs(output_dir, exist_ok=True)
 
+    jobs = getattr(args, "jobs", 1) or 1
+
+    # Load every package index once; each phase reads from the merged view
+    codecs = CodecRegistry(fallback=getattr(args, "compression_fallback", False))
+    resource_index = GameResourceIndex.from_game_folder(
+        game_folder, index_cache=_open_index_cache(args), codecs=codecs)
+    print("Indexed {} unique resources from {} packages ({} overridden)".format(
+        len(resource_index), len(resource_index.packages), resource_index.overridden_count))
+
     # --- Tuning XML (smart processing) ---
     if _should_extract(COMBINED_TUNING_TYPE_ID):
-        _extract_tuning(game_folder, output_dir, split_combined_tuning)
+        _extract_tuning(game_folder, output_dir, iter_split_combined_tuning, resource_index,
+                        tuning_stats=getattr(args, "tuning_stats", False))
 
     # --- String Tables (smart processing) ---
     if _should_extract(STRING_TABLE_TYPE_ID):
-        _extract_strings(game_folder, output_dir, StringTableReader)
+        _extract_strings(game_folder, output_dir, StringTableReader, resource_index)
 
     # --- Images (smart processing) ---
     if _should_extract(DDS_TYPE_ID) or _should_extract(PNG_TYPE_ID):
@@ -118,47 +148,73 @@ def cmd_extract_all(args):
             img_types.add(DDS_TYPE_ID)
         if _should_extract(PNG_TYPE_ID):
             img_types.add(PNG_TYPE_ID)
-        _extract_images(game_folder, output_dir, img_types, decode_image_to_png)
+        _extract_images(output_dir, img_types, decode_image_to_png, resource_index, jobs)
 
     # --- Raw extraction for non-smart types ---
     # Collect type IDs that need raw extraction
     if extract_everything:
         # Extract all types that don't have smart handlers
-        _extract_raw(game_folder, output_dir, exclude_types=_SMART_TYPES)
+        _extract_raw(resource_index, output_dir, exclude_types=_SMART_TYPES, jobs=jobs)
     elif type_filter is not None:
         # Extract requested types that don't have smart handlers
         raw_types = type_filter - _SMART_TYPES
         if raw_types:
-            _extract_raw(game_folder, output_dir, include_types=raw_types)
+            _extract_raw(resource_index, output_dir, include_types=raw_types, jobs=jobs)
+
+    _print_codec_stats(codecs)
+
+
+def _print_codec_stats(codecs):
+    """Print per-codec decompression counters."""
+    stats = codecs.stats()
+    if not stats:
+        return
+    print("Decompression:")
+    for name, counters in sorted(stats.items()):
+        print("  {}: {} resources, {} -> {} bytes, {} errors".format(
+            name, counters["calls"], counters["bytes_in"], counters["bytes_out"],
+            counters["errors"]))
 
 
-def _extract_tuning(game_folder, output_dir, split_combined_tuning):
-    """Extract CombinedTuning into individual XML files."""
+def _extract_tuning(game_folder, output_dir, iter_split_combined_tuning, resource_index,
+                    tuning_stats=False):
+    """Extract CombinedTuning into individual XML files.
+
+    Entries are written as the splitter yields them, so only one entry's
+    XML is held at a time.
+
+    With tuning_stats, binary DATA parsing counters are collected per
+    resource and the slowest resources and tables are printed at the end.
+    """
+    from util.datamining.binary_tuning import DataParseStats
     from util.datamining.package_discovery import discover_simulation_packages
 
     xml_dir = os.path.join(output_dir, "xml")
     modules_dir = os.path.join(xml_dir, "_modules")
     os.makedirs(modules_dir, exist_ok=True)
 
-    sim_packages = discover_simulation_packages(game_folder)
+    sim_packages = [pkg_path for pkg_path, _ in discover_simulation_packages(game_folder)]
     print("Extracting tuning from {} simulation packages...".format(len(sim_packages)))
 
     seen_instances = {}  # instance_id -> (cls, name) for dedup tracking
     total_entries = 0
     total_modules = 0
+    parse_stats = []  # (rel_path, DataParseStats) per resource, with tuning_stats
 
-    for pkg_path, rel_path in sim_packages:
-        reader = PackageReader(pkg_path)
-        reader.read()
-
-        ct_entries = reader.extract_combined_tuning_entries()
-        if not ct_entries:
-            continue
-
+    # CombinedTuning deltas only carry the changed entries, so every layer is
+    # read and merged at the entry level (delta overrides full)
+    for reader, rel_path, ct_entries in resource_index.by_package(
+            include_types={COMBINED_TUNING_TYPE_ID}, packages=sim_packages,
+            include_overridden=True):
         for ct_entry in ct_entries:
             try:
                 raw_data = reader.extract_resource(ct_entry)
-                entries = split_combined_tuning(raw_data)
+                if tuning_stats:
+                    stats = DataParseStats()
+                    parse_stats.append((rel_path, stats))
+                    entries = iter_split_combined_tuning(raw_data, stats)
+                else:
+                    entries = iter_split_combined_tuning(raw_data)
             except Exception as e:
                 print("  Warning: failed to split {}: {}".format(rel_path, e))
                 continue
@@ -187,28 +243,50 @@ def _extract_tuning(game_folder, output_dir, split_combined_tuning):
 
     print("  Tuning: {} entries, {} modules ({} unique instances)".format(
         total_entries, total_modules, len(seen_instances)))
+    if tuning_stats:
+        _print_tuning_stats(parse_stats)
 
 
-def _extract_strings(game_folder, output_dir, StringTableReader):
+def _print_tuning_stats(parse_stats, count=5):
+    """Print DATA parsing totals and the slowest resources and tables."""
+    parsed = [(rel_path, stats) for rel_path, stats in parse_stats if stats.files]
+    if not parsed:
+        return
+    print("  DATA parsing: {} resources, {} rows, {} schemas resolved "
+          "({} by size), {:.3f}s".format(
+              len(parsed), sum(s.rows_decoded for _, s in parsed),
+              sum(s.schemas_resolved for _, s in parsed),
+              sum(s.schema_size_fallbacks for _, s in parsed),
+              sum(s.seconds for _, s in parsed)))
+    print("  String pool: {} strings decoded, {} lookups".format(
+        sum(s.string_pool_size for _, s in parsed),
+        sum(s.string_pool_hits for _, s in parsed)))
+    slowest = sorted(parsed, key=lambda item: item[1].seconds, reverse=True)[:count]
+    for rel_path, stats in slowest:
+        print("    {:.3f}s {} ({} rows)".format(stats.seconds, rel_path, stats.rows_decoded))
+        for name, rows, seconds in stats.slowest_tables(3):
+            print("      {:.3f}s {} ({} rows)".format(seconds, name, rows))
+
+
+def _extract_strings(game_folder, output_dir, StringTableReader, resource_index):
     """Extract and merge all string tables into a single JSON file."""
     from util.datamining.package_discovery import discover_string_packages
 
     string_packages = discover_string_packages(game_folder)
     print("Extracting strings from {} string packages...".format(len(string_packages)))
 
+    # String tables are merged per string hash, so overridden tables are read too
     merged = {}  # hash -> string
-    for pkg_path in string_packages:
-        reader = PackageReader(pkg_path)
-        reader.read()
-
-        stbl_entries = reader.extract_string_table_entries()
-        for entry in stbl_entries:
+    for reader, rel_path, stbl_entries in resource_index.by_package(
+            include_types={STRING_TABLE_TYPE_ID}, packages=string_packages,
+            include_overridden=True):
+        for entry in stbl_entries.by_group(0x00000000):
             try:
                 data = reader.extract_resource(entry)
                 table = StringTableReader.parse(data)
                 merged.update(table.strings)
             except Exception as e:
-                print("  Warning: failed to parse STBL in {}: {}".format(pkg_path, e))
+                print("  Warning: failed to parse STBL in {}: {}".format(reader.filepath, e))
 
     # Write merged strings as JSON
     output_path = os.path.join(output_dir, "strings.json")
@@ -223,91 +301,145 @@ def _extract_strings(game_folder, output_dir, StringTableReader):
     print("  Strings: {} entries".format(len(merged)))
 
 
-def _extract_images(game_folder, output_dir, image_types, decode_image_to_png):
+def _iter_resources(resource_index, jobs, direct=None, **filters):
+    """Yield (reader, entry, data) for every resource selected from the merged index.
+
+    With jobs > 1, decompression runs on worker pools shared across packages
+    and results arrive in completion order; failures are yielded as
+    ValueError instances in place of the data. Entries for which direct(entry)
+    is true are yielded with data None, for the caller to copy or stream to
+    disk itself while the package is open.
+    """
+    extractor = None
+    if jobs > 1:
+        extractor = ParallelExtractor(max_workers=jobs, process_workers=jobs)
+    try:
+        for reader, rel_path, entries in resource_index.by_package(**filters):
+            large = []
+            if direct is not None:
+                large = [e for e in entries if direct(e)]
+                if large:
+                    entries = [e for e in entries if not direct(e)]
+
+            if extractor is None:
+                results = reader.extract_many(entries, errors="return")
+            else:
+                results = extractor.extract(reader, entries, ordered=False, errors="return")
+            for entry, data in results:
+                yield reader, entry, data
+            for entry in large:
+                yield reader, entry, None
+    finally:
+        if extractor is not None:
+            extractor.close()
+
+
+def _extract_images(output_dir, image_types, decode_image_to_png, resource_index, jobs=1):
     """Extract all image resources as PNG files.
 
+    Only the winning copy of each image is decoded (delta overrides full),
+    whichever package it is in, so an image overridden from outside the
+    client packages is still extracted; images a delta deletes are skipped.
+
     Args:
         image_types: set of type IDs to extract (DDS_TYPE_ID, PNG_TYPE_ID, or both)
     """
-    from util.datamining.package_discovery import discover_client_packages
-
     images_dir = os.path.join(output_dir, "images")
     os.makedirs(images_dir, exist_ok=True)
 
-    client_packages = discover_client_packages(game_folder)
-    print("Extracting images from {} client packages...".format(len(client_packages)))
+    print("Extracting images from {} packages...".format(len(resource_index.packages)))
 
     seen = set()
     total = 0
     errors = 0
 
-    for pkg_path, rel_path in client_packages:
-        reader = PackageReader(pkg_path)
-        reader.read()
+    for _, entry, data in _iter_resources(resource_index, jobs, include_types=image_types):
+        instance_id = entry.key.instance
+        seen.add(instance_id)
+        if isinstance(data, Exception):
+            errors += 1
+            continue
 
-        for entry in reader.entries:
-            if entry.key.type_id not in image_types:
-                continue
+        try:
+            png_data = decode_image_to_png(bytes(data))
+            filename = "{:016x}.png".format(instance_id)
+            filepath = os.path.join(images_dir, filename)
+            with open(filepath, "wb") as f:
+                f.write(png_data)
+            total += 1
+        except Exception:
+            errors += 1
 
-            # Deduplicate by instance ID (delta overrides full)
-            instance_id = entry.key.instance
-            seen.add(instance_id)
+    deleted = len(resource_index.deleted_keys(include_types=image_types))
+    print("  Images: {} extracted ({} unique instances, {} errors), {} deleted by a delta".format(
+        total, len(seen), errors, deleted))
 
-            try:
-                data = reader.extract_resource(entry)
-                png_data = decode_image_to_png(data)
-                filename = "{:016x}.png".format(instance_id)
-                filepath = os.path.join(images_dir, filename)
-                with open(filepath, "wb") as f:
-                    f.write(png_data)
-                total += 1
-            except Exception:
-                errors += 1
 
-    print("  Images: {} extracted ({} unique instances, {} errors)".format(
-        total, len(seen), errors))
+# Raw resources at least this large (decompressed) are streamed to disk
+RAW_STREAM_THRESHOLD = 8 * 1024 * 1024
 
 
-def _extract_raw(game_folder, output_dir, include_types=None, exclude_types=None):
+def _extract_raw(resource_index, output_dir, include_types=None, exclude_types=None, jobs=1):
     """Extract raw resources as .bin files organized by type ID.
 
+    Only the winning copy of each resource is written (delta overrides full);
+    resources a delta deletes are skipped and counted. Resources of
+    RAW_STREAM_THRESHOLD bytes or more are decompressed straight into their
+    output file instead of being held in memory, and on Linux uncompressed
+    resources are copied by the kernel (os.sendfile / os.copy_file_range)
+    without passing through Python at all.
+
     Args:
         include_types: if set, only extract these type IDs
         exclude_types: if set, skip these type IDs (used with --types all)
     """
-    from util.datamining.package_discovery import discover_all_packages
+    print("Extracting raw resources from {} packages...".format(len(resource_index.packages)))
 
-    all_packages = discover_all_packages(game_folder)
-    print("Extracting raw resources from {} packages...".format(len(all_packages)))
+    def _direct(entry):
+        if entry.mem_size >= RAW_STREAM_THRESHOLD:
+            return True
+        return ZERO_COPY_SUPPORTED and not entry.is_compressed \
+            and entry.compression_type != COMPRESSION_DELETED
 
     total = 0
+    zero_copy_bytes = 0
     type_counts = {}
-    for pkg_path, rel_path in all_packages:
-        reader = PackageReader(pkg_path)
-        reader.read()
-
-        for entry in reader.entries:
-            tid = entry.key.type_id
-            if include_types is not None and tid not in include_types:
-                continue
-            if exclude_types is not None and tid in exclude_types:
-                continue
-
-            type_dir = os.path.join(output_dir, "{:08X}".format(tid))
-            os.makedirs(type_dir, exist_ok=True)
+    for reader, entry, data in _iter_resources(
+            resource_index, jobs, direct=_direct,
+            include_types=include_types, exclude_types=exclude_types):
+        tid = entry.key.type_id
+        if isinstance(data, Exception):
+            print("  Warning: failed to extract {}: {}".format(entry.key, data))
+            continue
 
-            try:
-                data = reader.extract_resource(entry)
-                filename = "{:08X}_{:016X}.bin".format(entry.key.group, entry.key.instance)
-                filepath = os.path.join(type_dir, filename)
-                with open(filepath, "wb") as f:
+        type_dir = os.path.join(output_dir, "{:08X}".format(tid))
+        os.makedirs(type_dir, exist_ok=True)
+
+        try:
+            filename = "{:08X}_{:016X}.bin".format(entry.key.group, entry.key.instance)
+            filepath = os.path.join(type_dir, filename)
+            with open(filepath, "wb") as f:
+                if data is None:
+                    try:
+                        copied = reader.copy_raw_to(entry, f)
+                        if copied is None:
+                            reader.extract_to(entry, f)
+                        else:
+                            zero_copy_bytes += copied
+                    except Exception:
+                        f.close()
+                        os.remove(filepath)
+                        raise
+                else:
                     f.write(data)
-                total += 1
-                type_counts[tid] = type_counts.get(tid, 0) + 1
-            except Exception as e:
-                print("  Warning: failed to extract {}: {}".format(entry.key, e))
+            total += 1
+            type_counts[tid] = type_counts.get(tid, 0) + 1
+        except Exception as e:
+            print("  Warning: failed to extract {}: {}".format(entry.key, e))
 
-    print("  Raw: {} resources extracted across {} types".format(total, len(type_counts)))
+    deleted = len(resource_index.deleted_keys(include_types, exclude_types))
+    print("  Raw: {} resources extracted across {} types ({} bytes copied zero-copy), "
+          "{} deleted by a delta".format(total, len(type_counts), zero_copy_bytes, deleted))
 
 
 def main():
@@ -316,20 +448,31 @@ def main():
     )
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
+    # Index cache options shared by every command that reads packages
+    cache_parser = argparse.ArgumentParser(add_help=False)
+    cache_parser.add_argument("--index-cache", metavar="DIR", default=default_cache_dir(),
+                              help="Directory for cached package indexes "
+                                   "(default: {})".format(default_cache_dir()))
+    cache_parser.add_argument("--no-index-cache", dest="index_cache", action="store_const",
+                              const=None, help="Always parse package indexes from scratch")
+
     # extract command
-    extract_parser = subparsers.add_parser("extract", help="Extract tuning XML from a .package file")
+    extract_parser = subparsers.add_parser("extract", parents=[cache_parser],
+                                           help="Extract tuning XML from a .package file")
     extract_parser.add_argument("package", help="Path to the .package file")
     extract_parser.add_argument("-o", "--output", help="Output directory for extracted XML files")
     extract_parser.set_defaults(func=cmd_extract)
 
     # info command
-    info_parser = subparsers.add_parser("info", help="Show information about a .package file")
+    info_parser = subparsers.add_parser("info", parents=[cache_parser],
+                                        help="Show information about a .package file")
     info_parser.add_argument("package", help="Path to the .package file")
     info_parser.set_defaults(func=cmd_info)
 
     # extract-all command
     extract_all_parser = subparsers.add_parser(
         "extract-all",
+        parents=[cache_parser],
         help="Extract resources from all game packages"
     )
     extract_all_parser.add_argument("game_folder", help="Path to the game installation folder")
@@ -340,6 +483,15 @@ def main():
                                           "or specify hex IDs (0x2F7D0004) or labels "
                                           "(DDS, PNG, STBL, Tuning, CombinedTuning). "
                                           "Default: tuning, strings, and images.")
+    extract_all_parser.add_argument("--compression-fallback", action="store_true",
+                                     help="Guess the codec (RefPack, then zlib) for entries with "
+                                          "an unknown or mislabelled compression type")
+    extract_all_parser.add_argument("-j", "--jobs", type=int, default=1,
+                                     help="Decompress images and raw resources on N worker "
+                                          "threads/processes (default: 1, serial)")
+    extract_all_parser.add_argument("--tuning-stats", action="store_true",
+                                     help="Print binary CombinedTuning parsing counters and the "
+                                          "slowest resources and tables")
     extract_all_parser.set_defaults(func=cmd_extract_all)
 
     args = parser.parse_args()
@@ -0,0 +1,63 @@
+"""Tests for benchmarks/ — synthetic corpora and the codec benchmark report."""
+
+import pytest
+
+from benchmarks.bench_codecs import CASES, compare, run
+from benchmarks.corpora import CORPORA, parse_size, stbl_blob
+from util.datamining.string_table import StringTableReader
+
+
+class TestCorpora:
+    @pytest.mark.parametrize("name", sorted(CORPORA))
+    def test_deterministic_and_sized(self, name):
+        data = CORPORA[name](100000, 0)
+        assert data == CORPORA[name](100000, 0)
+        assert data != CORPORA[name](100000, 1)
+        assert 100000 - 32 <= len(data) <= 100000
+
+    def test_stbl_blob_parses(self):
+        data = stbl_blob(50000)
+        table = StringTableReader.parse(data)
+        assert len(table) > 100
+
+    @pytest.mark.parametrize("text, size", [
+        ("1M", 1 << 20), ("128m", 128 << 20), ("64K", 65536), ("1000", 1000),
+    ])
+    def test_parse_size(self, text, size):
+        assert parse_size(text) == size
+
+
+def _report(**rates):
+    return {"results": [
+        {"case": case, "corpus": "tuning_xml", "size": 1024, "mb_per_s": rate, "peak_rss_mb": rss}
+        for case, (rate, rss) in rates.items()
+    ]}
+
+
+class TestCompare:
+    def test_flags_slower_and_larger(self):
+        baseline = _report(a=(100.0, 50.0), b=(100.0, 50.0), c=(100.0, 50.0))
+        report = _report(a=(85.0, 50.0), b=(93.0, 54.0), c=(120.0, None))
+        regressions = compare(report, baseline, threshold=10)
+        assert len(regressions) == 1
+        assert regressions[0].startswith("a/tuning_xml/1024: 85.0 MB/s")
+
+        regressions = compare(report, baseline, threshold=5)
+        assert [r.split(":")[0] for r in regressions] == [
+            "a/tuning_xml/1024", "b/tuning_xml/1024", "b/tuning_xml/1024"]
+        assert "peak RSS 54 MB vs 50 MB (+8.0%)" in regressions[2]
+
+    def test_missing_cases_skipped(self):
+        assert compare(_report(a=(1.0, 1.0)), _report(b=(100.0, 1.0))) == []
+
+
+class TestRun:
+    def test_all_cases_in_process(self, tmp_path):
+        report = run(sorted(CASES), [64 * 1024], repeat=1, cache_dir=str(tmp_path),
+                     isolate=False)
+        results = report["results"]
+        assert len(results) == sum(len(corpora) for corpora in CASES.values())
+        assert all(r["mb_per_s"] > 0 for r in results)
+        assert report["version"] == 1
+        # Generated inputs are cached for the next run
+        assert any(p.suffix == ".refpack" for p in tmp_path.iterdir())
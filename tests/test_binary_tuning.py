@@ -1,18 +1,59 @@
 """Tests for util.datamining.binary_tuning module."""
 
+import io
+import random
 import struct
+import sys
+import xml.etree.ElementTree as ET
+
 import pytest
 
+from benchmarks.corpora import combined_tuning_tree, encode_combined_tuning
 from util.datamining.binary_tuning import (
     BinaryDecoder,
+    DataParseStats,
     DataType,
+    RowDecoder,
+    Schema,
+    SchemaColumn,
+    _numpy_dtype,
+    _read_data_type,
+    _read_values,
     is_binary_combined_tuning,
     parse_binary_data,
     decode_combined_tuning,
+    decode_combined_tuning_to,
+    build_combined_tuning_tree,
+    read_tuning_tables,
     RELOFFSET_NULL,
 )
 
 
+SMALL_XML = ('<M n="module" s="1"><T n="a">5 &amp; 6</T><E n="b" />'
+             '<L n="c"><T>1</T><T>2</T></L><U n="d"><V t="x" /></U></M>')
+
+
+def _schema(columns, size):
+    """Schema from (name, data_type, offset) tuples."""
+    schema = Schema()
+    for name, data_type, offset in columns:
+        col = SchemaColumn()
+        col.name, col.data_type, col.offset = name, data_type, offset
+        schema.columns.append(col)
+    schema.schema_size = size
+    return schema
+
+
+def _reference_row(data, schema, row_start):
+    """Read a row one field at a time, as parse_binary_data used to."""
+    decoder = BinaryDecoder(data)
+    row = {}
+    for col in schema.columns:
+        decoder.seek(row_start + col.offset)
+        row[col.name] = _read_data_type(decoder, col.data_type)
+    return row
+
+
 class TestBinaryDecoder:
     def test_uint8(self):
         d = BinaryDecoder(b'\x42')
@@ -105,3 +146,315 @@ class TestParseHeader:
         data = b'DATA' + struct.pack('<I', 0x200) + b'\x00' * 100
         with pytest.raises(ValueError, match="Unknown DATA version"):
             parse_binary_data(data)
+
+
+# Every fixed-layout type, at aligned offsets with gaps between some columns
+ALL_TYPES_SCHEMA = [
+    ("bool", DataType.Boolean, 0), ("char", DataType.Character, 1),
+    ("i8", DataType.Int8, 2), ("u8", DataType.UInt8, 3),
+    ("i16", DataType.Int16, 4), ("u16", DataType.UInt16, 6),
+    ("i32", DataType.Int32, 8), ("u32", DataType.UInt32, 12),
+    ("i64", DataType.Int64, 16), ("u64", DataType.UInt64, 24),
+    ("float", DataType.Float, 32), ("string", DataType.String, 36),
+    ("hashed", DataType.HashedString, 40), ("object", DataType.Object, 48),
+    ("vector", DataType.Vector, 56), ("f2", DataType.Float2, 64),
+    ("f3", DataType.Float3, 72), ("f4", DataType.Float4, 84),
+    ("tsr", DataType.TableSetReference, 104), ("key", DataType.ResourceKey, 112),
+    ("loc", DataType.LocalizationKey, 128), ("variant", DataType.Variant, 132),
+]
+
+
+class TestRowDecoder:
+    def test_matches_field_reads(self):
+        schema = _schema(ALL_TYPES_SCHEMA, 144)
+        row_decoder = RowDecoder.compile(schema)
+        assert row_decoder is not None
+        rng = random.Random(0)
+        data = bytes(rng.getrandbits(8) for _ in range(144 * 4))
+        for row in range(4):
+            assert row_decoder.decode(data, row * 144) == _reference_row(data, schema, row * 144)
+
+    def test_simple_schema(self):
+        schema = _schema([("b", DataType.UInt32, 4), ("a", DataType.UInt16, 0)], 8)
+        schema.columns.sort(key=lambda c: c.offset)
+        row_decoder = RowDecoder.compile(schema)
+        assert row_decoder.simple
+        assert row_decoder.struct.format in ("<H2xI", b"<H2xI")
+        assert row_decoder.decode(struct.pack("<HHI", 7, 0, 9), 0) == {"a": 7, "b": 9}
+
+    def test_overlapping_columns_not_compiled(self):
+        schema = _schema([("a", DataType.UInt32, 0), ("b", DataType.UInt16, 2)], 4)
+        assert RowDecoder.compile(schema) is None
+
+    def test_unknown_type_not_compiled(self):
+        assert RowDecoder.compile(_schema([("a", DataType.Undefined, 0)], 4)) is None
+
+
+class TestReadValues:
+    @pytest.mark.parametrize("data_type", [
+        DataType.Character, DataType.UInt8, DataType.Int16, DataType.UInt32,
+        DataType.Float, DataType.Object, DataType.Vector, DataType.Float3,
+        DataType.ResourceKey,
+    ])
+    def test_matches_value_reads(self, data_type):
+        data = bytes(random.Random(data_type).getrandbits(8) for _ in range(16 * 20))
+        expected = []
+        decoder = BinaryDecoder(data)
+        for _ in range(10):
+            expected.append(_read_data_type(decoder, data_type))
+            decoder.seek(decoder.tell() + (-decoder.tell() & (DataType.alignment(data_type) - 1)))
+        end = decoder.tell()
+
+        decoder = BinaryDecoder(data)
+        assert _read_values(decoder, data, data_type, 10) == expected
+        assert decoder.tell() == end
+
+
+class TestDecodeCombinedTuning:
+    def test_small_document(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        assert is_binary_combined_tuning(data)
+        assert decode_combined_tuning(data) == '<?xml version="1.0" encoding="utf-8"?>\n' + SMALL_XML
+
+    def test_large_document_round_trip(self):
+        root = combined_tuning_tree(300)
+        xml = decode_combined_tuning(encode_combined_tuning(root))
+        assert ET.tostring(ET.fromstring(xml)) == ET.tostring(root)
+
+    def test_parsed_tables(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        tables, schemas, table_data, version = parse_binary_data(data)
+        assert version == 0x101
+        assert len(tables) == 7
+        assert all(schema.row_decoder is not None for schema in schemas)
+        meta = table_data[0][0]
+        assert set(meta) == {"first_element", "top_element", "element_count", "string_table"}
+        assert meta["element_count"] == 8
+        # 3 text nodes, then 8 elements
+        assert len(table_data[1]) == 11
+        assert set(table_data[1][0]) == {"text", "attrs", "children"}
+        assert table_data[1][0]["attrs"]["mDataOffset"] == RELOFFSET_NULL
+        assert "".join(table_data[6]).split("\x00")[:3] == ["M", "n", "module"]
+
+
+def _set_table_field(data, table, field_offset, value):
+    # type: (bytes, int, int, int) -> bytes
+    """Overwrite one int32 field of a table header (28-byte header, 28-byte tables)."""
+    buf = bytearray(data)
+    pos = 28 + table * 28 + field_offset
+    struct.pack_into("<i", buf, pos, struct.unpack_from("<i", buf, pos)[0] + value)
+    return bytes(buf)
+
+
+class TestDecodeCombinedTuningTo:
+    def test_matches_string_decode(self):
+        data = encode_combined_tuning(combined_tuning_tree(200))
+        fp = io.StringIO()
+        assert decode_combined_tuning_to(data, fp) is None
+        assert fp.getvalue() == decode_combined_tuning(data)
+
+    def test_writes_in_batches(self, monkeypatch, tmp_path):
+        import util.datamining.binary_tuning as binary_tuning
+        monkeypatch.setattr(binary_tuning, "_EMIT_BATCH", 16)
+        data = encode_combined_tuning(combined_tuning_tree(50))
+        writes = []
+
+        class Recorder(io.StringIO):
+            def write(self, s):
+                writes.append(s)
+                return super().write(s)
+
+        fp = Recorder()
+        decode_combined_tuning_to(data, fp)
+        assert len(writes) > 10
+        path = tmp_path / "tuning.xml"
+        with open(str(path), "w", encoding="utf-8") as f:
+            decode_combined_tuning_to(data, f)
+        assert path.read_text(encoding="utf-8") == fp.getvalue()
+
+    def test_deep_nesting(self):
+        depth = sys.getrecursionlimit() * 2
+        root = ET.Element("M", n="deep")
+        el = root
+        for _ in range(depth):
+            el = ET.SubElement(el, "L")
+        el.text = "leaf"
+        xml = decode_combined_tuning(encode_combined_tuning(root))
+        assert xml.endswith('<M n="deep">' + "<L>" * depth + "leaf" + "</L>" * depth + "</M>")
+
+
+class TestBuildCombinedTuningTree:
+    def test_matches_parsed_xml(self):
+        data = encode_combined_tuning(combined_tuning_tree(300))
+        root = build_combined_tuning_tree(data)
+        assert ET.tostring(root) == ET.tostring(ET.fromstring(decode_combined_tuning(data)))
+
+    def test_small_document(self):
+        root = build_combined_tuning_tree(encode_combined_tuning(ET.fromstring(SMALL_XML)))
+        assert ET.tostring(root, encoding="unicode") == SMALL_XML
+
+    def test_python_backend(self):
+        data = encode_combined_tuning(combined_tuning_tree(50))
+        assert ET.tostring(build_combined_tuning_tree(data, backend="python")) == \
+            ET.tostring(build_combined_tuning_tree(data))
+
+    def test_whitespace_normalized_like_parser(self):
+        root = ET.Element("M", n="line1\nline2")
+        ET.SubElement(root, "T", n="tab\there", v="crlf\r\nlone\rcr").text = "a\r\nb\rc\td"
+        ET.SubElement(root, "E").text = "x\n\ty"
+        data = encode_combined_tuning(root)
+
+        built = build_combined_tuning_tree(data)
+        assert ET.tostring(built) == ET.tostring(ET.fromstring(decode_combined_tuning(data)))
+        assert built.get("n") == "line1 line2"
+        assert built[0].attrib == {"n": "tab here", "v": "crlf lone cr"}
+        assert built[0].text == "a\nb\nc\td"
+        assert built[1].text == "x\n\ty"
+
+    def test_deep_nesting(self):
+        depth = sys.getrecursionlimit() * 2
+        root = ET.Element("M")
+        el = root
+        for _ in range(depth):
+            el = ET.SubElement(el, "L")
+        el.text = "leaf"
+        built = build_combined_tuning_tree(encode_combined_tuning(root))
+        assert len(list(built.iter("L"))) == depth
+        assert list(built.iter("L"))[-1].text == "leaf"
+
+
+class TestTuningTables:
+    def test_small_document(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        t = read_tuning_tables(data, backend="python")
+        # 3 text nodes, then 8 elements; the root is the first element
+        assert t.first_element == 3
+        assert t.top == 3
+        assert len(t.node_text) == 11
+        assert t.node_attrs[:3] == [-1, -1, -1]
+        assert t.node_refs[t.node_children[t.top]] > t.top
+        assert all(0 <= row < len(t.attr_name) for row in t.attr_refs if row >= 0)
+        assert data[t.strings[t.node_text[t.top]]:].startswith(b"M\x00")
+
+    def test_numpy_matches_python(self):
+        pytest.importorskip("numpy")
+        data = encode_combined_tuning(combined_tuning_tree(300))
+        python = read_tuning_tables(data, backend="python")
+        numpy = read_tuning_tables(data, backend="numpy")
+        for name in python.__slots__:
+            assert getattr(numpy, name) == getattr(python, name), name
+        assert all(type(row) is int for row in numpy.node_refs)
+
+    def test_numpy_decode(self):
+        pytest.importorskip("numpy")
+        data = encode_combined_tuning(combined_tuning_tree(300))
+        assert decode_combined_tuning(data, backend="numpy") == \
+            decode_combined_tuning(data, backend="python")
+
+    def test_numpy_dtype_rejects_composite_columns(self):
+        pytest.importorskip("numpy")
+        assert _numpy_dtype([("a", DataType.UInt32, 0), ("b", DataType.Object, 4)], 12) \
+            .itemsize == 12
+        assert _numpy_dtype([("a", DataType.Float2, 0)], 8) is None
+        assert _numpy_dtype([("a", DataType.Character, 0)], 1) is None
+
+    def test_string_pool(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        t = read_tuning_tables(data)
+        assert len(t.texts) == len(t.strings)
+        assert t.texts[t.node_text[t.top]] == "M"
+        assert t.texts[t.node_text[0]] == "5 & 6"
+        assert t.texts[t.attr_value[0]] == "module"
+        # Tag and attribute names are interned
+        assert t.texts[t.attr_name[0]] is sys.intern("".join(["n"]))
+        assert t.texts[t.node_text[t.top + 1]] is sys.intern("".join(["T"]))
+
+    def test_string_pool_stats(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        t = read_tuning_tables(data)
+        nodes = len(t.node_text)
+        attrs = len(t.attr_name)
+        for decode in (decode_combined_tuning, build_combined_tuning_tree):
+            stats = DataParseStats()
+            decode(data, stats)
+            assert stats.string_pool_size == len(t.texts)
+            # One lookup per node, two per attribute
+            assert stats.string_pool_hits == nodes + 2 * attrs
+            assert stats.as_dict()["string_pool_hits"] == stats.string_pool_hits
+
+    def test_unknown_backend(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        with pytest.raises(ValueError, match="Unknown tuning backend"):
+            read_tuning_tables(data, backend="fortran")
+
+
+class TestDataParseStats:
+    def test_counters(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        stats = DataParseStats()
+        tables, _, table_data, _ = parse_binary_data(data, stats)
+        assert stats.files == 1
+        assert stats.schemas_resolved == 3
+        assert stats.schema_size_fallbacks == 0
+        assert stats.rows_decoded == sum(len(rows) for rows in table_data)
+        assert [name for name, _, _ in stats.tables] == [t.name for t in tables]
+        assert stats.seconds == pytest.approx(sum(s for _, _, s in stats.tables))
+        assert len(stats.slowest_tables(2)) == 2
+
+    def test_accumulates_across_files(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        stats = DataParseStats()
+        decode_combined_tuning(data, stats)
+        decode_combined_tuning(data, stats)
+        assert stats.as_dict()["files"] == 2
+        assert stats.schemas_resolved == 6
+        assert len(stats.tables) == 14
+
+    def test_numpy_fallback_counted_once(self, monkeypatch):
+        pytest.importorskip("numpy")
+        from util.datamining import binary_tuning
+        calls = []
+
+        def reject_third_table(fields, itemsize):
+            calls.append(fields)
+            return None if len(calls) == 3 else _numpy_dtype(fields, itemsize)
+
+        monkeypatch.setattr(binary_tuning, "_numpy_dtype", reject_third_table)
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        stats = DataParseStats()
+        read_tuning_tables(data, backend="numpy", stats=stats)
+        assert len(calls) == 3
+        expected = DataParseStats()
+        read_tuning_tables(data, backend="python", stats=expected)
+        assert stats.files == 1
+        assert stats.schemas_resolved == expected.schemas_resolved
+        assert stats.rows_decoded == expected.rows_decoded
+        assert stats.string_pool_size == expected.string_pool_size
+        assert [t[:2] for t in stats.tables] == [t[:2] for t in expected.tables]
+
+    @pytest.mark.parametrize("backend", ["python", "numpy"])
+    def test_backends_time_same_tables(self, backend):
+        if backend == "numpy":
+            pytest.importorskip("numpy")
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        stats = DataParseStats()
+        read_tuning_tables(data, backend=backend, stats=stats)
+        tables, _, table_data, _ = parse_binary_data(data)
+        assert [t[:2] for t in stats.tables] == \
+            [(t.name, len(rows)) for t, rows in zip(tables, table_data)]
+        assert stats.rows_decoded == sum(len(rows) for rows in table_data)
+        assert stats.seconds == pytest.approx(sum(s for _, _, s in stats.tables))
+
+    def test_schema_size_fallback(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        # Point table 2 (8-byte attribute rows) just past its schema header
+        shifted = _set_table_field(data, 2, 8, 4)
+        stats = DataParseStats()
+        assert parse_binary_data(shifted, stats)[2] == parse_binary_data(data)[2]
+        assert stats.schema_size_fallbacks == 1
+
+    def test_unknown_schema(self):
+        data = encode_combined_tuning(ET.fromstring(SMALL_XML))
+        shifted = _set_table_field(_set_table_field(data, 2, 8, 4), 2, 16, 5)
+        with pytest.raises(ValueError, match="Unknown schema"):
+            parse_binary_data(shifted)
@@ -1,3 +1,7 @@
+import io
+import tracemalloc
+import xml.etree.ElementTree as ET
+
 import pytest
 
 from util.datamining.combined_tuning import CombinedTuningParser, TuningElement
@@ -89,6 +93,117 @@ class TestCombinedTuningParser:
         assert el.name == "career_Astronaut"
 
 
+    def test_find_by_instance_id_string(self):
+        parser = CombinedTuningParser(SAMPLE_COMBINED_XML)
+        assert parser.find_by_instance_id("25000").name == "career_Astronaut"
+        assert parser.find_by_instance_id(" 16700 ").name == "skill_Cooking"
+        assert parser.find_by_instance_id("0x413C").name == "skill_Cooking"
+        assert parser.find_by_instance_id("not-an-id") is None
+        assert parser.find_by_instance_id(12345) is None
+
+    def test_indexes_built_lazily_and_shared(self):
+        parser = CombinedTuningParser(SAMPLE_COMBINED_XML)
+        assert parser._indexes == {}
+        skills = parser.by_class("Skill")
+        assert set(parser._indexes) == {"cls"}
+        index = parser._indexes["cls"]
+        parser.by_class("Career")
+        assert parser._indexes["cls"] is index
+        # Callers get their own list
+        skills.clear()
+        assert len(parser.by_class("Skill")) == 3
+
+    def test_index_keeps_document_order(self):
+        xml = ('<M><I c="A" n="dup" s="1" /><I c="B" n="other" s="2" />'
+               '<I c="A" n="dup" s="3" /></M>')
+        parser = CombinedTuningParser(xml)
+        assert [el.instance_id for el in parser.by_class("A")] == [1, 3]
+        assert parser.find_by_name("dup").instance_id == 1
+
+    def test_prebuilt_tree(self):
+        root = ET.fromstring(SAMPLE_COMBINED_XML)
+        parser = CombinedTuningParser(root)
+        assert len(parser) == 5
+        assert parser.find_by_name("skill_Cooking").get_value("stat_name") == "0x1234ABCD"
+
+
+COMBINED_WITH_REFS = """\
+<?xml version="1.0" encoding="utf-8"?>
+<combined>
+  <g s="merged">
+    <E x="0">MAJOR</E>
+    <L x="1">
+      <T>Creative</T>
+      <T>Cooking</T>
+    </L>
+  </g>
+  <R>
+    <I c="Skill" i="statistic" m="statistics.skill" n="skill_Cooking" s="16700">
+      <r n="skill_level_type" x="0" />
+      <r n="tags" x="1" />
+    </I>
+  </R>
+  <R>
+    <M n="objects.collection_manager" s="99999" />
+    <I c="Career" i="career" m="careers.career_tuning" n="career_Astronaut" s="25000">
+      <T n="career_name">0xCCCCDDDD</T>
+    </I>
+  </R>
+</combined>
+"""
+
+
+def _tuning_file(path, count):
+    with open(str(path), "w", encoding="utf-8") as f:
+        f.write('<combined><g s="merged"><E x="0">MAJOR</E></g><R>')
+        for i in range(count):
+            f.write('<I c="Skill" i="statistic" m="statistics.skill" n="skill_{0}" s="{0}">'
+                    '<r n="level" x="0" /><L n="tags"><T>a</T><T>b</T></L>'
+                    '<T n="description">{1}</T></I>'.format(i, "x" * 200))
+        f.write('</R></combined>')
+
+
+class TestIterparse:
+    def test_matches_parser(self):
+        streamed = list(CombinedTuningParser.iterparse(io.BytesIO(SAMPLE_COMBINED_XML.encode())))
+        parsed = list(CombinedTuningParser(SAMPLE_COMBINED_XML))
+        assert [el.to_dict() for el in streamed] == [el.to_dict() for el in parsed]
+        assert streamed[0].get_list("tags") == ["Creative", "Cooking"]
+        assert streamed[0].get_bool("hidden") is False
+
+    def test_resolves_references(self):
+        streamed = list(CombinedTuningParser.iterparse(io.BytesIO(COMBINED_WITH_REFS.encode())))
+        assert [el.name for el in streamed] == ["skill_Cooking", "career_Astronaut"]
+        assert streamed[0].get_value("skill_level_type") == "MAJOR"
+        assert streamed[0].get_list("tags") == ["Creative", "Cooking"]
+        assert streamed[1].get_value("career_name") == "0xCCCCDDDD"
+
+    def test_yielded_subtrees_stay_intact(self, tmp_path):
+        path = tmp_path / "tuning.xml"
+        _tuning_file(path, 50)
+        streamed = list(CombinedTuningParser.iterparse(str(path)))
+        assert len(streamed) == 50
+        assert all(len(el.raw) == 3 for el in streamed)
+        assert streamed[0].get_list("tags") == ["a", "b"]
+        assert streamed[-1].get_value("level") == "MAJOR"
+
+    def test_bounded_memory(self, tmp_path):
+        def peak(count):
+            path = tmp_path / "tuning_{}.xml".format(count)
+            _tuning_file(path, count)
+            tracemalloc.start()
+            try:
+                for el in CombinedTuningParser.iterparse(str(path)):
+                    el.get_value("description")
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small = peak(500)
+        large = peak(5000)
+        assert large < small * 2
+
+
 class TestTuningElement:
     @pytest.fixture
     def cooking_skill(self):
@@ -155,3 +270,42 @@ class TestTuningElement:
         raw = cooking_skill.raw
         assert raw.tag == "I"
         assert raw.get("c") == "Skill"
+
+    def test_get_values(self, cooking_skill):
+        values = cooking_skill.get_values(["stat_name", "skill_level_type", "nonexistent"])
+        assert values == {"stat_name": "0x1234ABCD", "skill_level_type": "MAJOR",
+                          "nonexistent": None}
+
+    def test_slots(self, cooking_skill):
+        assert not hasattr(cooking_skill, "__dict__")
+
+    def test_field_map_built_once(self, cooking_skill):
+        assert cooking_skill._fields is None
+        cooking_skill.get_value("stat_name")
+        fields = cooking_skill._fields
+        cooking_skill.get_list("tags")
+        cooking_skill.get_child_element("hidden")
+        assert cooking_skill._fields is fields
+
+    def test_references_resolved_once(self, monkeypatch):
+        parser = CombinedTuningParser(COMBINED_WITH_REFS)
+        cooking = parser.find_by_name("skill_Cooking")
+        calls = []
+        original = parser._refs.resolve
+        monkeypatch.setattr(parser._refs, "resolve",
+                            lambda el: calls.append(el) or original(el))
+        for _ in range(3):
+            assert cooking.get_value("skill_level_type") == "MAJOR"
+            assert cooking.get_list("tags") == ["Creative", "Cooking"]
+            assert cooking.get_child_element("tags").tag == "L"
+        assert len(calls) == 2
+
+    def test_duplicate_field_names(self):
+        parser = CombinedTuningParser(
+            '<M><I c="A" n="a" s="1"><T n="f">first</T><T n="f">second</T>'
+            '<T n="tags">scalar</T><L n="tags"><T>x</T></L></I></M>')
+        el = parser.find_by_name("a")
+        assert el.get_value("f") == "first"
+        assert el.get_child_element("tags").tag == "T"
+        # A later list with the same name is still found
+        assert el.get_list("tags") == ["x"]
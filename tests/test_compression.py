@@ -0,0 +1,85 @@
+"""Tests for util/datamining/compression.py — DBPF decompressor registry."""
+
+import zlib
+
+import pytest
+
+from util.datamining.compression import (
+    COMPRESSION_DELETED,
+    COMPRESSION_NONE,
+    COMPRESSION_REFPACK,
+    COMPRESSION_STREAMABLE,
+    COMPRESSION_ZLIB,
+    CodecRegistry,
+)
+from tests.test_refpack import _make_literal_payload
+
+
+PAYLOAD = b"ABCDEFGH"
+
+
+class TestCodecRegistry:
+    def test_zlib(self):
+        codecs = CodecRegistry()
+        assert codecs.decompress(COMPRESSION_ZLIB, zlib.compress(PAYLOAD)) == PAYLOAD
+
+    @pytest.mark.parametrize("compression_type", [COMPRESSION_REFPACK, COMPRESSION_STREAMABLE])
+    def test_refpack(self, compression_type):
+        codecs = CodecRegistry()
+        assert codecs.decompress(compression_type, _make_literal_payload(PAYLOAD)) == PAYLOAD
+
+    def test_raw_and_deleted(self):
+        codecs = CodecRegistry()
+        assert codecs.decompress(COMPRESSION_NONE, PAYLOAD) == PAYLOAD
+        assert codecs.decompress(COMPRESSION_DELETED, PAYLOAD) == b""
+
+    def test_codec_names(self):
+        codecs = CodecRegistry()
+        assert codecs.codec(COMPRESSION_ZLIB) == "zlib"
+        assert codecs.codec(COMPRESSION_STREAMABLE) == "refpack-streamable"
+        assert codecs.codec(0x1234) is None
+
+    def test_no_cross_codec_guessing(self):
+        # RefPack data stored under the zlib type is an error, not a silent retry
+        codecs = CodecRegistry()
+        data = _make_literal_payload(PAYLOAD)
+        with pytest.raises(ValueError, match="Failed to decompress"):
+            codecs.decompress(COMPRESSION_ZLIB, data, key="k")
+        assert codecs.stats()["zlib"] == {
+            "calls": 1, "bytes_in": len(data), "bytes_out": 0, "errors": 1,
+        }
+
+    def test_unknown_type(self):
+        with pytest.raises(ValueError, match="Unsupported compression type 0x1234"):
+            CodecRegistry().decompress(0x1234, PAYLOAD)
+
+    def test_fallback_for_unknown_type(self):
+        codecs = CodecRegistry(fallback=True)
+        assert codecs.decompress(0x1234, zlib.compress(PAYLOAD)) == PAYLOAD
+        assert codecs.decompress(0x1234, b"\x00" * 4 + zlib.compress(PAYLOAD)) == PAYLOAD
+        assert codecs.decompress(0x1234, _make_literal_payload(PAYLOAD)) == PAYLOAD
+        assert codecs.stats()["heuristic"]["calls"] == 3
+
+    def test_fallback_after_codec_failure(self):
+        codecs = CodecRegistry(fallback=True)
+        assert codecs.decompress(COMPRESSION_ZLIB, _make_literal_payload(PAYLOAD)) == PAYLOAD
+        stats = codecs.stats()
+        assert stats["zlib"]["errors"] == 1
+        assert stats["heuristic"]["bytes_out"] == len(PAYLOAD)
+
+    def test_stats(self):
+        codecs = CodecRegistry()
+        data = zlib.compress(PAYLOAD)
+        codecs.decompress(COMPRESSION_ZLIB, data)
+        codecs.decompress(COMPRESSION_ZLIB, memoryview(data))
+        assert codecs.stats() == {
+            "zlib": {"calls": 2, "bytes_in": 2 * len(data), "bytes_out": 16, "errors": 0},
+        }
+        codecs.reset_stats()
+        assert codecs.stats() == {}
+
+    def test_register_custom_codec(self):
+        codecs = CodecRegistry()
+        codecs.register(0x0042, "reverse", lambda data: bytes(data)[::-1])
+        assert codecs.decompress(0x0042, b"abc") == b"cba"
+        assert codecs.stats()["reverse"]["calls"] == 1
@@ -6,11 +6,14 @@ import pytest
 from util.datamining.package_reader import (
     PackageReader,
     ResourceKey,
+    coalesce_reads,
     IndexEntry,
     DBPF_MAGIC,
     DBPF_HEADER_SIZE,
     TUNING_TYPE_ID,
 )
+from util.datamining.compression import CodecRegistry
+from util.datamining.package_index import IndexTable
 from util.datamining.resource_types import (
     COMBINED_TUNING_TYPE_ID,
     STRING_TABLE_TYPE_ID,
@@ -95,6 +98,20 @@ class TestPackageReader:
         assert reader.header.index_entry_count == 0
         assert len(reader.entries) == 0
 
+    def test_entries_are_columnar(self, tmp_path):
+        pkg_file = tmp_path / "test.package"
+        pkg_file.write_bytes(build_test_package([
+            (TUNING_TYPE_ID, 0, 100, b"a"),
+            (0x00000001, 0, 200, b"b"),
+        ]))
+
+        reader = PackageReader(str(pkg_file))
+        reader.read()
+
+        assert isinstance(reader.entries, IndexTable)
+        assert [e.key.instance for e in reader.entries] == [100, 200]
+        assert reader.entries[1].key == ResourceKey(type_id=1, group=0, instance=200)
+
     def test_invalid_magic(self, tmp_path):
         pkg_file = tmp_path / "bad.package"
         pkg_file.write_bytes(b"BAAD" + b"\x00" * 92)
@@ -144,7 +161,7 @@ class TestPackageReader:
         result = reader.extract_resource(reader.entries[0])
         assert result == raw_data
 
-    def test_extract_resource_zlib_compressed(self, tmp_path):
+    def _write_compressed_package(self, tmp_path, compression_type):
         original_data = b"hello world uncompressed resource data" * 10
         compressed_data = zlib.compress(original_data)
 
@@ -158,12 +175,11 @@ class TestPackageReader:
         instance = 100
         instance_hi = (instance >> 32) & 0xFFFFFFFF
         instance_lo = instance & 0xFFFFFFFF
-        # compressed field = 1 (non-zero -> compressed), file_size = compressed, mem_size = original
-        index_data += struct.pack("<IIIIIIIBB",
+        # compression type (non-zero -> compressed), file_size = compressed, mem_size = original
+        index_data += struct.pack("<IIIIIIIHH",
                                  0x00000001, 0, instance_hi, instance_lo,
                                  data_offset, len(compressed_data), len(original_data),
-                                 1, 0)
-        index_data += b'\x00\x00'
+                                 compression_type, 1)
         index_size = len(index_data)
 
         header = bytearray(DBPF_HEADER_SIZE)
@@ -177,14 +193,32 @@ class TestPackageReader:
         pkg_data = bytes(header) + compressed_data + index_data
         pkg_file = tmp_path / "compressed.package"
         pkg_file.write_bytes(pkg_data)
+        return str(pkg_file), original_data
 
-        reader = PackageReader(str(pkg_file))
+    def test_extract_resource_zlib_compressed(self, tmp_path):
+        path, original_data = self._write_compressed_package(tmp_path, 0x5A42)
+        reader = PackageReader(path)
         reader.read()
 
         assert reader.entries[0].is_compressed
         result = reader.extract_resource(reader.entries[0])
         assert result == original_data
 
+    def test_unknown_compression_type(self, tmp_path):
+        path, original_data = self._write_compressed_package(tmp_path, 0x0001)
+        reader = PackageReader(path, codecs=CodecRegistry())
+        reader.read()
+        with pytest.raises(ValueError, match="Unsupported compression type 0x0001"):
+            reader.extract_resource(reader.entries[0])
+
+    def test_heuristic_fallback(self, tmp_path):
+        path, original_data = self._write_compressed_package(tmp_path, 0x0001)
+        codecs = CodecRegistry(fallback=True)
+        reader = PackageReader(path, codecs=codecs)
+        reader.read()
+        assert reader.extract_resource(reader.entries[0]) == original_data
+        assert codecs.stats()["heuristic"]["calls"] == 1
+
     def test_extract_combined_tuning_entries(self, tmp_path):
         combined_data = b'<combined><R><I c="Buff" i="buff" n="buff_Test" s="1"></I></R></combined>'
         other_data = b"other stuff"
@@ -253,6 +287,328 @@ class TestPackageReader:
         assert "buff_Test" in xml_str
 
 
+class TestPackageReaderMapped:
+    def _write(self, tmp_path, resources):
+        pkg_file = tmp_path / "mapped.package"
+        pkg_file.write_bytes(build_test_package(resources))
+        return str(pkg_file)
+
+    def test_context_manager_reads_index(self, tmp_path):
+        path = self._write(tmp_path, [
+            (TUNING_TYPE_ID, 0, 100, b"<I />"),
+            (0x00000001, 0, 200, b"other"),
+        ])
+        with PackageReader(path) as reader:
+            assert reader.is_mapped
+            assert len(reader.entries) == 2
+            assert reader.extract_resource(reader.entries[1]) == b"other"
+        assert not reader.is_mapped
+
+    def test_view_is_zero_copy(self, tmp_path):
+        raw_data = b"uncompressed payload"
+        path = self._write(tmp_path, [(0x00000001, 0, 100, raw_data)])
+        with PackageReader(path) as reader:
+            view = reader.extract_resource_view(reader.entries[0])
+            assert isinstance(view, memoryview)
+            assert view == raw_data
+            view.release()
+
+    def test_close_with_live_view(self, tmp_path):
+        path = self._write(tmp_path, [(0x00000001, 0, 100, b"still alive")])
+        with PackageReader(path) as reader:
+            view = reader.extract_resource_view(reader.entries[0])
+        # The reader is closed, but the outstanding view keeps the mapping valid
+        assert not reader.is_mapped
+        assert bytes(view) == b"still alive"
+
+    def test_view_without_context_manager(self, tmp_path):
+        path = self._write(tmp_path, [(0x00000001, 0, 100, b"plain read")])
+        reader = PackageReader(path)
+        reader.read()
+        assert reader.extract_resource_view(reader.entries[0]) == b"plain read"
+
+    def test_invalid_magic_closes(self, tmp_path):
+        pkg_file = tmp_path / "bad.package"
+        pkg_file.write_bytes(b"BAAD" + b"\x00" * 92)
+        reader = PackageReader(str(pkg_file))
+        with pytest.raises(ValueError, match="Invalid DBPF magic"):
+            with reader:
+                pass
+        assert not reader.is_mapped
+
+    def test_empty_file_too_small(self, tmp_path):
+        pkg_file = tmp_path / "empty.package"
+        pkg_file.write_bytes(b"")
+        with pytest.raises(ValueError, match="File too small"):
+            with PackageReader(str(pkg_file)):
+                pass
+
+
+class TestExtractMany:
+    def _package(self, tmp_path, blobs, gaps=0):
+        """Write blobs back to back (separated by gaps bytes) and index them."""
+        data = bytearray(DBPF_HEADER_SIZE)
+        rows = []
+        for i, (payload, original) in enumerate(blobs):
+            rows.append((1, 0, i, len(data), len(payload), len(original),
+                         0x5A42 if payload != original else 0))
+            data += payload + b"\xAA" * gaps
+        pkg_file = tmp_path / "many.package"
+        pkg_file.write_bytes(bytes(data))
+        reader = PackageReader(str(pkg_file))
+        reader.entries = IndexTable.from_rows(rows)
+        return reader
+
+    def _blobs(self):
+        blobs = []
+        for i in range(6):
+            original = bytes([65 + i]) * (50 + i)
+            payload = zlib.compress(original) if i % 2 else original
+            blobs.append((payload, original))
+        return blobs
+
+    def test_offset_order(self, tmp_path):
+        blobs = self._blobs()
+        reader = self._package(tmp_path, blobs)
+        entries = list(reader.entries)[::-1]
+        results = list(reader.extract_many(entries))
+        assert [e.key.instance for e, _ in results] == list(range(6))
+        assert [bytes(data) for _, data in results] == [original for _, original in blobs]
+
+    def test_original_order(self, tmp_path):
+        blobs = self._blobs()
+        reader = self._package(tmp_path, blobs)
+        entries = [reader.entries[i] for i in (3, 0, 5, 1, 4, 2)]
+        results = list(reader.extract_many(entries, order="original", max_read=120))
+        assert [e.key.instance for e, _ in results] == [3, 0, 5, 1, 4, 2]
+        assert [bytes(data) for _, data in results] == [blobs[i][1] for i in (3, 0, 5, 1, 4, 2)]
+
+    def test_mapped_matches_unmapped(self, tmp_path):
+        reader = self._package(tmp_path, self._blobs(), gaps=10)
+        unmapped = [bytes(d) for _, d in reader.extract_many(reader.entries)]
+        reader.open()
+        try:
+            mapped = [bytes(d) for _, d in reader.extract_many(reader.entries)]
+        finally:
+            reader.close()
+        assert mapped == unmapped
+
+    def test_duplicate_entries(self, tmp_path):
+        reader = self._package(tmp_path, self._blobs())
+        entry = reader.entries[2]
+        results = list(reader.extract_many([entry, entry], order="original"))
+        assert len(results) == 2
+        assert bytes(results[0][1]) == bytes(results[1][1])
+
+    def test_errors_strict(self, tmp_path):
+        reader = self._package(tmp_path, [(b"x" * 10, b"y" * 20)])
+        with pytest.raises(ValueError, match="Failed to decompress"):
+            list(reader.extract_many(reader.entries))
+
+    def test_errors_return(self, tmp_path):
+        blobs = [(b"x" * 10, b"y" * 20), (b"ok", b"ok")]
+        reader = self._package(tmp_path, blobs)
+        results = list(reader.extract_many(reader.entries, errors="return"))
+        assert isinstance(results[0][1], ValueError)
+        assert bytes(results[1][1]) == b"ok"
+
+    def test_past_end_of_file(self, tmp_path):
+        reader = self._package(tmp_path, [(b"abc", b"abc")])
+        reader.entries = IndexTable.from_rows([(1, 0, 0, DBPF_HEADER_SIZE, 100, 100, 0)])
+        results = list(reader.extract_many(reader.entries, errors="return"))
+        assert "extends past end" in str(results[0][1])
+
+    def test_invalid_options(self, tmp_path):
+        reader = self._package(tmp_path, [(b"abc", b"abc")])
+        with pytest.raises(ValueError, match="Unknown extract order"):
+            list(reader.extract_many(reader.entries, order="random"))
+        with pytest.raises(ValueError, match="Unknown errors mode"):
+            list(reader.extract_many(reader.entries, errors="ignore"))
+
+
+class TestExtractTo:
+    class _Sink:
+        """Binary sink recording the size of every write."""
+
+        def __init__(self):
+            self.data = bytearray()
+            self.writes = []
+
+        def write(self, chunk):
+            self.data += chunk
+            self.writes.append(len(chunk))
+            return len(chunk)
+
+    def _reader(self, tmp_path, stored, original, compression_type, codecs=None):
+        pkg_file = tmp_path / "stream.package"
+        pkg_file.write_bytes(bytes(DBPF_HEADER_SIZE) + stored)
+        reader = PackageReader(str(pkg_file), codecs=codecs or CodecRegistry())
+        reader.entries = IndexTable.from_rows([
+            (1, 0, 1, DBPF_HEADER_SIZE, len(stored), len(original), compression_type),
+        ])
+        return reader
+
+    @pytest.mark.parametrize("mapped", [False, True])
+    def test_raw_chunked(self, tmp_path, mapped):
+        original = bytes(range(256)) * 100
+        reader = self._reader(tmp_path, original, original, 0)
+        sink = self._Sink()
+        if mapped:
+            reader.open()
+        try:
+            assert reader.extract_to(reader.entries[0], sink, chunk_size=1000) == len(original)
+        finally:
+            reader.close()
+        assert sink.data == original
+        assert max(sink.writes) == 1000
+
+    def test_zlib_streamed(self, tmp_path):
+        original = bytes(range(256)) * 400
+        codecs = CodecRegistry()
+        reader = self._reader(tmp_path, zlib.compress(original), original, 0x5A42, codecs)
+        sink = self._Sink()
+        assert reader.extract_to(reader.entries[0], sink, chunk_size=4096) == len(original)
+        assert sink.data == original
+        assert max(sink.writes) <= 4096
+        assert codecs.stats()["zlib"]["bytes_out"] == len(original)
+
+    def test_zlib_truncated(self, tmp_path):
+        original = bytes(range(256)) * 400
+        stored = zlib.compress(original)[:-10]
+        reader = self._reader(tmp_path, stored, original, 0x5A42)
+        with pytest.raises(ValueError, match="Failed to decompress"):
+            reader.extract_to(reader.entries[0], self._Sink())
+
+    @pytest.mark.parametrize("mapped", [False, True])
+    def test_refpack_streamed(self, tmp_path, monkeypatch, mapped):
+        from tests.test_refpack import _make_long_copy_stream
+        stored, original = _make_long_copy_stream(400 * 1024)
+        codecs = CodecRegistry()
+        reader = self._reader(tmp_path, stored, original, 0xFFFF, codecs)
+        sink = self._Sink()
+        if mapped:
+            reader.open()
+        else:
+            # An unmapped reader must not load the whole stored entry
+            monkeypatch.setattr(reader, "_read_raw", None)
+        try:
+            assert reader.extract_to(reader.entries[0], sink, chunk_size=8192) == len(original)
+        finally:
+            reader.close()
+        assert sink.data == original
+        assert len(sink.writes) > 10
+        assert max(sink.writes) <= 8192
+        stats = codecs.stats()[codecs.codec(0xFFFF)]
+        assert (stats["bytes_in"], stats["bytes_out"]) == (len(stored), len(original))
+
+    def test_refpack_truncated_streamed(self, tmp_path):
+        from tests.test_refpack import _make_long_copy_stream
+        from util.datamining.refpack import decompress
+        stored, _ = _make_long_copy_stream(64 * 1024)
+        stored = stored[:len(stored) // 2]
+        reader = self._reader(tmp_path, stored, b"", 0xFFFF)
+        sink = self._Sink()
+        reader.extract_to(reader.entries[0], sink, chunk_size=1000)
+        assert sink.data == decompress(stored)
+
+    def test_deleted_writes_nothing(self, tmp_path):
+        reader = self._reader(tmp_path, b"gone", b"gone!", 0xFFE0)
+        sink = self._Sink()
+        assert reader.extract_to(reader.entries[0], sink) == 0
+        assert sink.data == b""
+
+    def test_fallback_registry_decompresses_in_one_piece(self, tmp_path):
+        original = b"fallback" * 100
+        reader = self._reader(tmp_path, zlib.compress(original), original, 0x0001,
+                              CodecRegistry(fallback=True))
+        sink = self._Sink()
+        assert reader.extract_to(reader.entries[0], sink) == len(original)
+        assert sink.writes == [len(original)]
+
+
+class TestCopyRawTo:
+    def _reader(self, tmp_path, stored, original, compression_type=0):
+        pkg_file = tmp_path / "copy.package"
+        pkg_file.write_bytes(bytes(DBPF_HEADER_SIZE) + stored + b"trailer")
+        reader = PackageReader(str(pkg_file))
+        reader.entries = IndexTable.from_rows([
+            (1, 0, 1, DBPF_HEADER_SIZE, len(stored), len(original), compression_type),
+        ])
+        return reader
+
+    @pytest.fixture(autouse=True)
+    def _linux_only(self):
+        from util.datamining.package_reader import ZERO_COPY_SUPPORTED
+        if not ZERO_COPY_SUPPORTED:
+            pytest.skip("zero-copy extraction is Linux only")
+
+    @pytest.mark.parametrize("mapped", [False, True])
+    def test_copies_entry(self, tmp_path, mapped):
+        payload = bytes(range(256)) * 64
+        reader = self._reader(tmp_path, payload, payload)
+        out = tmp_path / "out.bin"
+        if mapped:
+            reader.open()
+        try:
+            with open(str(out), "wb") as f:
+                f.write(b"head")
+                assert reader.copy_raw_to(reader.entries[0], f) == len(payload)
+                f.write(b"tail")
+        finally:
+            reader.close()
+        assert out.read_bytes() == b"head" + payload + b"tail"
+
+    def test_sendfile_when_copy_file_range_fails(self, tmp_path, monkeypatch):
+        import os
+
+        def refuse(*args):
+            raise OSError(18, "Invalid cross-device link")
+        monkeypatch.setattr(os, "copy_file_range", refuse, raising=False)
+        reader = self._reader(tmp_path, b"payload", b"payload")
+        out = tmp_path / "out.bin"
+        with open(str(out), "wb") as f:
+            assert reader.copy_raw_to(reader.entries[0], f) == 7
+        assert out.read_bytes() == b"payload"
+
+    def test_not_applicable(self, tmp_path):
+        import io
+        reader = self._reader(tmp_path, zlib.compress(b"z" * 50), b"z" * 50, 0x5A42)
+        with open(str(tmp_path / "out.bin"), "wb") as f:
+            assert reader.copy_raw_to(reader.entries[0], f) is None
+        reader = self._reader(tmp_path, b"plain", b"plain")
+        assert reader.copy_raw_to(reader.entries[0], io.BytesIO()) is None
+
+
+class TestCoalesceReads:
+    def _entries(self, spans):
+        return list(IndexTable.from_rows([
+            (1, 0, i, offset, size, size, 0) for i, (offset, size) in enumerate(spans)
+        ]))
+
+    def test_adjacent_merged(self):
+        reads = coalesce_reads(self._entries([(200, 50), (100, 100), (250, 10)]))
+        assert [(start, end, len(group)) for start, end, group in reads] == [(100, 260, 3)]
+        assert [e.offset for e in reads[0][2]] == [100, 200, 250]
+
+    def test_gap_threshold(self):
+        entries = self._entries([(100, 10), (120, 10), (1000, 10)])
+        reads = coalesce_reads(entries, max_gap=10)
+        assert [(start, end) for start, end, _ in reads] == [(100, 130), (1000, 1010)]
+        assert len(coalesce_reads(entries, max_gap=0)) == 3
+
+    def test_max_read(self):
+        entries = self._entries([(0, 40), (40, 40), (80, 40), (120, 200)])
+        reads = coalesce_reads(entries, max_read=100)
+        assert [(start, end) for start, end, _ in reads] == [(0, 80), (80, 120), (120, 320)]
+
+    def test_overlapping_entries(self):
+        reads = coalesce_reads(self._entries([(100, 50), (110, 10)]))
+        assert [(start, end) for start, end, _ in reads] == [(100, 150)]
+
+    def test_empty(self):
+        assert coalesce_reads([]) == []
+
+
 class TestIndexEntry:
     def test_is_compressed_true(self):
         key = ResourceKey(type_id=1, group=0, instance=0)
@@ -1,5 +1,6 @@
 """Integration tests for datamine.py extract-all command."""
 
+import io
 import json
 import os
 import struct
@@ -282,6 +283,27 @@ class TestExtractAllDefaults:
         assert magic == b'\x89PNG'
 
 
+    def test_image_winner_outside_client_packages(self, tmp_path):
+        """An image overridden by a non-client package is extracted from the winner."""
+        gf = _setup_game_folder(tmp_path)
+        output = str(tmp_path / "output")
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", (2, 2), (255, 0, 0)).save(buf, format="PNG")
+        winner = buf.getvalue()
+        with open(os.path.join(gf, "Data", "Simulation", "SimulationDeltaBuild1.package"),
+                  "wb") as f:
+            f.write(build_test_package([(PNG_TYPE_ID, 0, 0xAABBCCDD, winner)]))
+
+        from datamine import cmd_extract_all
+        import argparse
+        cmd_extract_all(argparse.Namespace(game_folder=gf, output=output, types=None))
+
+        with Image.open(os.path.join(output, "images", "00000000aabbccdd.png")) as img:
+            assert img.size == (2, 2)
+            assert img.convert("RGB").getpixel((0, 0)) == (255, 0, 0)
+
+
 class TestExtractAllTypesFilter:
     """Test --types filtering."""
 
@@ -349,6 +371,134 @@ class TestExtractAllTypesFilter:
         with open(os.path.join(raw_dir, files[0]), "rb") as f:
             assert f.read() == custom_data
 
+    def test_raw_delta_overrides_full(self, tmp_path):
+        """Raw extraction writes the delta copy even though it sorts first."""
+        gf = _setup_game_folder(tmp_path)
+        output = str(tmp_path / "output")
+
+        client_dir = os.path.join(gf, "Data", "Client")
+        with open(os.path.join(client_dir, "ClientFullBuild1.package"), "wb") as f:
+            f.write(build_test_package([(0xDEADBEEF, 0, 42, b"full copy")]))
+        with open(os.path.join(client_dir, "ClientDeltaBuild1.package"), "wb") as f:
+            f.write(build_test_package([(0xDEADBEEF, 0, 42, b"delta copy")]))
+
+        from datamine import cmd_extract_all
+        import argparse
+        args = argparse.Namespace(
+            game_folder=gf, output=output, types=["0xDEADBEEF"]
+        )
+        cmd_extract_all(args)
+
+        raw_file = os.path.join(output, "DEADBEEF", "00000000_000000000000002A.bin")
+        with open(raw_file, "rb") as f:
+            assert f.read() == b"delta copy"
+
+    def test_parallel_jobs_match_serial(self, tmp_path):
+        """--jobs N writes the same files as a serial run."""
+        gf = _setup_game_folder(tmp_path)
+
+        from datamine import cmd_extract_all
+        import argparse
+        outputs = []
+        for jobs in (1, 2):
+            output = str(tmp_path / "output{}".format(jobs))
+            cmd_extract_all(argparse.Namespace(
+                game_folder=gf, output=output, types=["all"], jobs=jobs
+            ))
+            files = {}
+            for root, _, names in os.walk(output):
+                for name in names:
+                    path = os.path.join(root, name)
+                    with open(path, "rb") as f:
+                        files[os.path.relpath(path, output)] = f.read()
+            outputs.append(files)
+
+        assert outputs[0] == outputs[1]
+        assert os.path.join("images", "00000000aabbccdd.png") in outputs[1]
+
+    def test_large_raw_resources_streamed(self, tmp_path, monkeypatch):
+        """Raw resources above the threshold go through extract_to()."""
+        import datamine
+        from util.datamining.package_reader import PackageReader
+
+        gf = _setup_game_folder(tmp_path)
+        output = str(tmp_path / "output")
+        client_dir = os.path.join(gf, "Data", "Client")
+        with open(os.path.join(client_dir, "ClientFullBuild1.package"), "wb") as f:
+            f.write(build_test_package([(0xDEADBEEF, 0, 42, b"x" * 100)]))
+
+        streamed = []
+        original = PackageReader.extract_to
+
+        def spy(self, entry, fileobj, chunk_size=4):
+            streamed.append(entry.key.instance)
+            return original(self, entry, fileobj, chunk_size)
+
+        import util.datamining.package_reader as package_reader
+        monkeypatch.setattr(package_reader, "ZERO_COPY_SUPPORTED", False)
+        monkeypatch.setattr(datamine, "ZERO_COPY_SUPPORTED", False)
+        monkeypatch.setattr(datamine, "RAW_STREAM_THRESHOLD", 50)
+        monkeypatch.setattr(PackageReader, "extract_to", spy)
+        import argparse
+        datamine.cmd_extract_all(argparse.Namespace(
+            game_folder=gf, output=output, types=["0xDEADBEEF"]
+        ))
+
+        assert streamed == [42]
+        with open(os.path.join(output, "DEADBEEF", "00000000_000000000000002A.bin"), "rb") as f:
+            assert f.read() == b"x" * 100
+
+    def test_raw_zero_copy_reported(self, tmp_path, capsys):
+        """Uncompressed raw resources are copied by the kernel on Linux."""
+        from util.datamining.package_reader import ZERO_COPY_SUPPORTED
+        if not ZERO_COPY_SUPPORTED:
+            pytest.skip("zero-copy extraction is Linux only")
+
+        gf = _setup_game_folder(tmp_path)
+        output = str(tmp_path / "output")
+        client_dir = os.path.join(gf, "Data", "Client")
+        with open(os.path.join(client_dir, "ClientFullBuild1.package"), "wb") as f:
+            f.write(build_test_package([(0xDEADBEEF, 0, 42, b"y" * 100)]))
+
+        from datamine import cmd_extract_all
+        import argparse
+        cmd_extract_all(argparse.Namespace(
+            game_folder=gf, output=output, types=["0xDEADBEEF"]
+        ))
+
+        assert "(100 bytes copied zero-copy)" in capsys.readouterr().out
+        with open(os.path.join(output, "DEADBEEF", "00000000_000000000000002A.bin"), "rb") as f:
+            assert f.read() == b"y" * 100
+
+    def test_deleted_by_delta_skipped(self, tmp_path, capsys):
+        """Resources a delta deletes are neither written nor counted as errors."""
+        gf = _setup_game_folder(tmp_path)
+        output = str(tmp_path / "output")
+        client_dir = os.path.join(gf, "Data", "Client")
+        with open(os.path.join(client_dir, "ClientFullBuild1.package"), "wb") as f:
+            f.write(build_test_package([(0xDEADBEEF, 0, 42, b"full copy"),
+                                        (0xDEADBEEF, 0, 43, b"kept")]))
+        delta = bytearray(build_test_package([(0xDEADBEEF, 0, 42, b""),
+                                              (PNG_TYPE_ID, 0, 0xAABBCCDD, b"")]))
+        index_offset = struct.unpack_from("<I", delta, 64)[0]
+        for row in range(2):
+            struct.pack_into("<H", delta, index_offset + 4 + 32 * row + 28, 0xFFE0)
+        with open(os.path.join(client_dir, "ClientDeltaBuild1.package"), "wb") as f:
+            f.write(delta)
+
+        from datamine import cmd_extract_all
+        import argparse
+        cmd_extract_all(argparse.Namespace(
+            game_folder=gf, output=output, types=["0xDEADBEEF", "PNG"]
+        ))
+
+        out = capsys.readouterr().out
+        assert os.listdir(os.path.join(output, "DEADBEEF")) == ["00000000_000000000000002B.bin"]
+        assert os.listdir(os.path.join(output, "images")) == []
+        assert "Raw: 1 resources extracted across 1 types" in out
+        assert "1 deleted by a delta" in out
+        assert "Images: 0 extracted (0 unique instances, 0 errors), 1 deleted by a delta" in out
+
     def test_types_all(self, tmp_path):
         """--types all should extract everything."""
         gf = _setup_game_folder(tmp_path)
@@ -0,0 +1,187 @@
+"""Tests for util/datamining/index_cache.py — persistent package index cache."""
+
+import os
+
+import pytest
+
+from util.datamining.index_cache import IndexCache
+from util.datamining.package_index import IndexTable
+from util.datamining.package_reader import PackageReader
+from tests.test_datamining import build_test_package
+
+
+RESOURCES = [
+    (0x545AC67A, 0, 0x1111, b"<I n=\"a\"/>"),
+    (0x220557DA, 0x80000000, 0x2222, b"stbl data"),
+    (0x00B2D882, 0, 0xFFFFFFFF00000001, b"dds"),
+]
+
+
+def _write_package(tmp_path, resources=RESOURCES, name="test.package"):
+    path = tmp_path / name
+    path.write_bytes(build_test_package(resources))
+    return str(path)
+
+
+def _read(path, cache):
+    reader = PackageReader(path, index_cache=cache)
+    reader.read()
+    return reader
+
+
+class TestIndexCache:
+    def test_miss_then_hit(self, tmp_path):
+        pkg = _write_package(tmp_path)
+        cache = IndexCache(str(tmp_path / "cache"))
+
+        first = _read(pkg, cache)
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["bytes_written"] > 0
+
+        second = _read(pkg, cache)
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["bytes_read"] == cache.stats()["bytes_written"]
+        assert list(second.entries.iter_rows()) == list(first.entries.iter_rows())
+        assert second.extract_resource(second.entries[1]) == b"stbl data"
+
+    def test_hit_skips_index_parse(self, tmp_path, monkeypatch):
+        pkg = _write_package(tmp_path)
+        cache = IndexCache(str(tmp_path / "cache"))
+        _read(pkg, cache)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("index parsed despite cache hit")
+        monkeypatch.setattr(IndexTable, "from_index", fail)
+        assert len(_read(pkg, cache).entries) == len(RESOURCES)
+
+    def test_invalidated_by_content_change(self, tmp_path):
+        pkg = _write_package(tmp_path)
+        cache = IndexCache(str(tmp_path / "cache"))
+        _read(pkg, cache)
+
+        _write_package(tmp_path, RESOURCES[:2])
+        reader = _read(pkg, cache)
+        assert cache.stats()["misses"] == 2
+        assert len(reader.entries) == 2
+
+    def test_invalidated_by_mtime_change(self, tmp_path):
+        pkg = _write_package(tmp_path)
+        cache = IndexCache(str(tmp_path / "cache"))
+        _read(pkg, cache)
+
+        st = os.stat(pkg)
+        os.utime(pkg, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        _read(pkg, cache)
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    def test_invalidated_by_header_change(self, tmp_path):
+        pkg = _write_package(tmp_path)
+        cache = IndexCache(str(tmp_path / "cache"))
+        _read(pkg, cache)
+
+        assert cache.load(pkg, b"\x00" * 96) is None
+        assert cache.stats()["misses"] == 2
+
+    def test_packages_cached_separately(self, tmp_path):
+        pkg_a = _write_package(tmp_path, RESOURCES, "a.package")
+        pkg_b = _write_package(tmp_path, RESOURCES[:1], "b.package")
+        cache = IndexCache(str(tmp_path / "cache"))
+        _read(pkg_a, cache)
+        _read(pkg_b, cache)
+
+        assert len(_read(pkg_a, cache).entries) == 3
+        assert len(_read(pkg_b, cache).entries) == 1
+        assert cache.stats()["hits"] == 2
+
+    @pytest.mark.parametrize("damage", [
+        lambda data: data[:20],
+        lambda data: b"XXXX" + data[4:],
+        lambda data: data[:-3],
+    ])
+    def test_corrupt_cache_file_is_miss(self, tmp_path, damage):
+        pkg = _write_package(tmp_path)
+        cache = IndexCache(str(tmp_path / "cache"))
+        _read(pkg, cache)
+
+        cache_file = cache.cache_path(pkg)
+        with open(cache_file, "rb") as f:
+            data = f.read()
+        with open(cache_file, "wb") as f:
+            f.write(damage(data))
+
+        reader = _read(pkg, cache)
+        assert cache.stats()["misses"] == 2
+        assert len(reader.entries) == len(RESOURCES)
+        # The damaged file was rewritten
+        assert cache.load(pkg, reader._header_bytes) is not None
+
+    def test_unwritable_cache_dir_ignored(self, tmp_path):
+        pkg = _write_package(tmp_path)
+        blocker = tmp_path / "not_a_dir"
+        blocker.write_bytes(b"")
+        cache = IndexCache(str(blocker / "cache"))
+
+        reader = _read(pkg, cache)
+        assert len(reader.entries) == len(RESOURCES)
+        assert cache.stats()["bytes_written"] == 0
+
+    def test_path_too_long_not_cached(self, tmp_path, monkeypatch):
+        pkg = _write_package(tmp_path)
+        reader = _read(pkg, None)
+        # Stand in for a path whose UTF-8 form overflows the uint16 length
+        long_path = os.path.join(str(tmp_path), "\u00e9" * 40000 + ".package")
+        real_abspath, real_stat = os.path.abspath, os.stat
+        monkeypatch.setattr(os.path, "abspath",
+                            lambda p: p if p == long_path else real_abspath(p))
+        monkeypatch.setattr(os, "stat",
+                            lambda p, *a, **k: real_stat(pkg if p == long_path else p, *a, **k))
+
+        cache = IndexCache(str(tmp_path / "cache"))
+        cache.store(long_path, reader._header_bytes, 0, reader.entries)
+        assert cache.stats()["bytes_written"] == 0
+        assert not os.path.exists(str(tmp_path / "cache"))
+
+    def test_no_cache_by_default(self, tmp_path):
+        pkg = _write_package(tmp_path)
+        reader = _read(pkg, None)
+        assert len(reader.entries) == len(RESOURCES)
+
+
+class TestIndexTableBytes:
+    def test_round_trip(self):
+        rows = [(1, 2, 0xFFFFFFFF00000003, 96, 10, 20, 0x5A42),
+                (4, 5, 6, 106, 7, 7, 0)]
+        table = IndexTable.from_rows(rows)
+        data = table.to_bytes()
+        assert len(data) == table.nbytes
+        assert list(IndexTable.from_bytes(data, 2).iter_rows()) == rows
+
+    def test_empty(self):
+        assert len(IndexTable.from_bytes(b"", 0)) == 0
+
+    def test_short_data_rejected(self):
+        data = IndexTable.from_rows([(1, 2, 3, 4, 5, 6, 7)]).to_bytes()
+        with pytest.raises(ValueError):
+            IndexTable.from_bytes(data[:-1], 1)
+
+
+class TestInfoCommand:
+    def test_reports_cache_stats(self, tmp_path, capsys):
+        import argparse
+        from datamine import cmd_info
+
+        pkg = _write_package(tmp_path)
+        args = argparse.Namespace(package=pkg, index_cache=str(tmp_path / "cache"))
+        cmd_info(args)
+        cmd_info(args)
+        out = capsys.readouterr().out
+        assert "Hits: 0, misses: 1" in out
+        assert "Hits: 1, misses: 0" in out
+
+    def test_cache_disabled(self, tmp_path, capsys):
+        import argparse
+        from datamine import cmd_info
+
+        args = argparse.Namespace(package=_write_package(tmp_path), index_cache=None)
+        cmd_info(args)
+        assert "Index cache" not in capsys.readouterr().out
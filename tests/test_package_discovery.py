@@ -6,6 +6,8 @@ from util.datamining.package_discovery import (
     discover_string_packages,
     discover_client_packages,
     discover_all_packages,
+    is_delta_package,
+    order_full_before_delta,
 )
 
 
@@ -142,3 +144,49 @@ class TestDiscoverAllPackages:
             assert os.path.isabs(abs_path)
             assert not os.path.isabs(rel_path)
             assert os.path.isfile(abs_path)
+
+
+class TestOrderFullBeforeDelta:
+    def test_is_delta_package(self):
+        assert is_delta_package("Data/Client/ClientDeltaBuild0.package")
+        assert is_delta_package("Delta/EP01/Strings_ENG_US.package")
+        assert is_delta_package("Delta\\EP01\\SimulationDeltaBuild0.package")
+        assert not is_delta_package("Data/Client/ClientFullBuild0.package")
+        assert not is_delta_package("EP01/Strings_ENG_US.package")
+
+    def test_all_packages_reordered(self, tmp_path):
+        gf = _make_game_folder(tmp_path)
+        rels = [rel for _, rel in order_full_before_delta(discover_all_packages(gf))]
+        deltas = [is_delta_package(rel) for rel in rels]
+        assert deltas == sorted(deltas)
+        assert any(deltas) and not all(deltas)
+
+    def test_stable_within_group(self, tmp_path):
+        gf = _make_game_folder(tmp_path)
+        pkgs = discover_all_packages(gf)
+        ordered = order_full_before_delta(pkgs)
+        assert [p for p in ordered if not is_delta_package(p[1])] == \
+            [p for p in pkgs if not is_delta_package(p[1])]
+
+    def test_pack_precedence_matches_discover_helpers(self, tmp_path):
+        gf = _make_game_folder(tmp_path)
+        for pack in ("FP01", "SP02", "GP02", "EP02"):
+            _touch(os.path.join(gf, pack, "SimulationFullBuild0.package"))
+            _touch(os.path.join(gf, pack, "ClientFullBuild0.package"))
+            _touch(os.path.join(gf, pack, "Strings_ENG_US.package"))
+            _touch(os.path.join(gf, "Delta", pack, "SimulationDeltaBuild0.package"))
+            _touch(os.path.join(gf, "Delta", pack, "ClientDeltaBuild0.package"))
+        ordered = order_full_before_delta(discover_all_packages(gf))
+
+        rels = [rel for _, rel in ordered]
+        assert [r.split(os.sep)[0] for r in rels if r.endswith("SimulationFullBuild0.package")] == \
+            ["Data", "EP01", "EP02", "GP01", "GP02", "SP02", "FP01"]
+
+        def only(name):
+            return [(p, r.replace(os.sep, "/")) for p, r in ordered if os.path.basename(p) == name]
+        assert only("SimulationFullBuild0.package") + only("SimulationDeltaBuild0.package") == \
+            discover_simulation_packages(gf)
+        assert [p for p, _ in ordered if os.path.basename(p).startswith("Client")] == \
+            [p for p, _ in discover_client_packages(gf)]
+        assert [p for p, _ in ordered if os.path.basename(p) == "Strings_ENG_US.package"] == \
+            discover_string_packages(gf)
@@ -0,0 +1,220 @@
+"""Tests for util/datamining/package_index.py — bulk DBPF index parsing."""
+
+import io
+import random
+import struct
+from array import array
+
+import pytest
+
+from util.datamining.package_index import (
+    INDEX_COLUMNS,
+    IndexEntry,
+    IndexTable,
+    ResourceKey,
+    index_body_size,
+    index_layout,
+    parse_index,
+)
+
+
+def _legacy_parse(flags, body, entry_count):
+    """Field-by-field reference parser (the original PackageReader loop)."""
+    f = io.BytesIO(body)
+    const = [0, 0, 0, 0]
+    for i in range(4):
+        if flags & (1 << i):
+            const[i] = struct.unpack("<I", f.read(4))[0]
+    rows = []
+    for _ in range(entry_count):
+        key = [
+            const[i] if flags & (1 << i) else struct.unpack("<I", f.read(4))[0]
+            for i in range(4)
+        ]
+        offset, file_size = struct.unpack("<II", f.read(8))
+        mem_size, compressed = struct.unpack("<IH", f.read(6))
+        f.read(2)
+        rows.append((key[0], key[1], (key[2] << 32) | key[3],
+                     offset, file_size & 0x7FFFFFFF, mem_size, compressed))
+    return rows
+
+
+def _build_body(flags, entries, const=(0x545AC67A, 0x80000000, 0x0ABC0000, 0x00001234)):
+    """Build the index bytes after the flags word."""
+    body = b""
+    for i in range(4):
+        if flags & (1 << i):
+            body += struct.pack("<I", const[i])
+    for key, offset, file_size, mem_size, compressed in entries:
+        for i in range(4):
+            if not flags & (1 << i):
+                body += struct.pack("<I", key[i])
+        body += struct.pack("<IIIHH", offset, file_size, mem_size, compressed, 1)
+    return body
+
+
+def _random_entries(count, seed=1234):
+    rng = random.Random(seed)
+    entries = []
+    for _ in range(count):
+        key = tuple(rng.getrandbits(32) for _ in range(4))
+        entries.append((key, rng.getrandbits(32), rng.getrandbits(32),
+                        rng.getrandbits(32), rng.choice([0, 0x5A42, 0xFFFF, 0xFFE0])))
+    return entries
+
+
+class TestIndexLayout:
+    def test_no_constant_fields(self):
+        layout = index_layout(0)
+        assert layout.record_size == 32
+        assert layout.constants_size == 0
+
+    def test_all_constant_fields(self):
+        layout = index_layout(0x0F)
+        assert layout.record_size == 16
+        assert layout.constants_size == 16
+
+    def test_layout_is_cached(self):
+        assert index_layout(0x05) is index_layout(0x05)
+
+    def test_upper_flag_bits_ignored(self):
+        assert index_layout(0xF0) is index_layout(0)
+
+    def test_body_size(self):
+        assert index_body_size(0x01, 10) == 4 + 28 * 10
+
+
+class TestParseIndex:
+    @pytest.mark.parametrize("flags", range(16))
+    def test_matches_legacy_parser(self, flags):
+        entries = _random_entries(50, seed=flags)
+        body = _build_body(flags, entries)
+        assert parse_index(body, flags, 50, backend="struct") == _legacy_parse(flags, body, 50)
+
+    def test_file_size_high_bit_masked(self):
+        body = _build_body(0, [((1, 2, 3, 4), 96, 0x80000010, 0x20, 0x5A42)])
+        rows = parse_index(body, 0, 1)
+        assert rows[0][4] == 0x10
+
+    def test_empty_index(self):
+        assert parse_index(b"", 0, 0) == []
+
+    def test_truncated_raises(self):
+        body = _build_body(0, _random_entries(3))
+        with pytest.raises(ValueError, match="Truncated index"):
+            parse_index(body[:-1], 0, 3)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError, match="Unknown index backend"):
+            parse_index(b"", 0, 0, backend="bogus")
+
+    def test_trailing_bytes_ignored(self):
+        entries = _random_entries(2)
+        body = _build_body(0, entries) + b"\xFF" * 10
+        assert parse_index(body, 0, 2) == _legacy_parse(0, body, 2)
+
+
+class TestParseIndexNumpy:
+    @pytest.mark.parametrize("flags", [0, 0x01, 0x06, 0x0F])
+    def test_matches_struct_backend(self, flags):
+        pytest.importorskip("numpy")
+        entries = _random_entries(200, seed=flags)
+        body = _build_body(flags, entries)
+        assert parse_index(body, flags, 200, backend="numpy") == \
+            parse_index(body, flags, 200, backend="struct")
+
+    def test_returns_python_ints(self):
+        pytest.importorskip("numpy")
+        body = _build_body(0, _random_entries(1))
+        row = parse_index(body, 0, 1, backend="numpy")[0]
+        assert all(type(v) is int for v in row)
+
+
+class TestIndexTable:
+    def _table(self, flags=0, count=20, seed=7):
+        body = _build_body(flags, _random_entries(count, seed=seed))
+        return IndexTable.from_index(body, flags, count), _legacy_parse(flags, body, count)
+
+    @pytest.mark.parametrize("flags", range(16))
+    def test_columns_match_legacy_parser(self, flags):
+        table, expected = self._table(flags, seed=flags)
+        assert list(table.iter_rows()) == expected
+
+    def test_entry_views(self):
+        table, expected = self._table()
+        entry = table[3]
+        assert isinstance(entry, IndexEntry)
+        type_id, group, instance, offset, file_size, mem_size, compression = expected[3]
+        assert entry.key == ResourceKey(type_id, group, instance)
+        assert (entry.offset, entry.file_size, entry.mem_size) == (offset, file_size, mem_size)
+        assert entry.compression_type == compression
+        assert entry.compressed == (compression != 0)
+
+    def test_negative_index_and_iteration(self):
+        table, _ = self._table()
+        assert table[-1] == table[len(table) - 1]
+        assert list(table) == [table[i] for i in range(len(table))]
+
+    def test_slice_returns_table(self):
+        table, expected = self._table()
+        sub = table[5:10]
+        assert isinstance(sub, IndexTable)
+        assert list(sub.iter_rows()) == expected[5:10]
+
+    def test_filters(self):
+        table = IndexTable.from_rows([
+            (1, 0, 10, 96, 4, 4, 0),
+            (2, 0, 11, 100, 4, 4, 0),
+            (1, 5, 12, 104, 4, 4, 0x5A42),
+            (1, 0, 11, 108, 4, 4, 0),
+        ])
+        assert [e.key.instance for e in table.by_type(1)] == [10, 12, 11]
+        assert [e.key.instance for e in table.by_group(5)] == [12]
+        assert [e.key.type_id for e in table.by_instance(11)] == [2, 1]
+        assert len(table.by_type(3)) == 0
+        assert [e.key.instance for e in table.by_type(1).by_group(0)] == [10, 11]
+
+    def test_filters_large_table(self):
+        rows = [(i % 3, 0, i, i, 1, 1, 0) for i in range(1000)]
+        table = IndexTable.from_rows(rows)
+        assert [e.key.instance for e in table.by_type(2)] == list(range(2, 1000, 3))
+
+    def test_empty_table(self):
+        table = IndexTable()
+        assert len(table) == 0
+        assert list(table) == []
+        assert len(IndexTable.from_rows([])) == 0
+
+    def test_compact_storage(self):
+        table, _ = self._table(count=100)
+        assert table.nbytes == 100 * 30
+        assert table.key_at(0) == (table.type_id[0], table.group[0], table.instance[0])
+
+    def test_mismatched_columns_rejected(self):
+        with pytest.raises(ValueError, match="different lengths"):
+            IndexTable({
+                name: array(code, [0] * (2 if name == "offset" else 1))
+                for name, code in INDEX_COLUMNS
+            })
+
+    def test_numpy_backend_matches(self):
+        pytest.importorskip("numpy")
+        body = _build_body(0x03, _random_entries(300))
+        struct_table = IndexTable.from_index(body, 0x03, 300, backend="struct")
+        numpy_table = IndexTable.from_index(body, 0x03, 300, backend="numpy")
+        assert list(numpy_table.iter_rows()) == list(struct_table.iter_rows())
+
+
+class TestIndexEntry:
+    def test_slots(self):
+        entry = IndexEntry(key=ResourceKey(1, 0, 0), offset=0, file_size=1,
+                           mem_size=1, compressed=False)
+        assert not hasattr(entry, "__dict__")
+        assert not hasattr(entry.key, "__dict__")
+
+    def test_repr(self):
+        key = ResourceKey(type_id=1, group=2, instance=3)
+        assert repr(key) == "ResourceKey(type_id=1, group=2, instance=3)"
+        entry = IndexEntry(key=key, offset=4, file_size=5, mem_size=6, compressed=True)
+        assert "offset=4" in repr(entry)
+        assert "compression_type=0" in repr(entry)
@@ -0,0 +1,155 @@
+"""Tests for util/datamining/parallel_extract.py — pooled decompression."""
+
+import threading
+import time
+import zlib
+
+import pytest
+
+from util.datamining.compression import CodecRegistry
+from util.datamining.package_index import IndexTable
+from util.datamining.package_reader import DBPF_HEADER_SIZE, PackageReader
+from util.datamining.parallel_extract import ParallelExtractor
+from tests.test_refpack import _make_literal_payload
+
+
+def _package(tmp_path, blobs, codecs=None):
+    """Write (stored, original, compression_type) blobs and index them."""
+    data = bytearray(DBPF_HEADER_SIZE)
+    rows = []
+    for i, (stored, original, compression_type) in enumerate(blobs):
+        rows.append((1, 0, i, len(data), len(stored), len(original), compression_type))
+        data += stored
+    pkg_file = tmp_path / "parallel.package"
+    pkg_file.write_bytes(bytes(data))
+    reader = PackageReader(str(pkg_file), codecs=codecs or CodecRegistry())
+    reader.entries = IndexTable.from_rows(rows)
+    return reader
+
+
+def _mixed_blobs(count=30):
+    blobs = []
+    for i in range(count):
+        original = bytes([65 + i % 26]) * (8 + 4 * (i % 5))
+        kind = i % 3
+        if kind == 0:
+            blobs.append((zlib.compress(original), original, 0x5A42))
+        elif kind == 1:
+            blobs.append((_make_literal_payload(original), original, 0xFFFF))
+        else:
+            blobs.append((original, original, 0))
+    return blobs
+
+
+class TestParallelExtractor:
+    @pytest.mark.parametrize("process_workers", [0, 1])
+    def test_ordered_matches_serial(self, tmp_path, process_workers):
+        blobs = _mixed_blobs()
+        reader = _package(tmp_path, blobs)
+        entries = list(reader.entries)[::-1]
+        reader.open()
+        try:
+            with ParallelExtractor(max_workers=4, process_workers=process_workers) as extractor:
+                results = list(extractor.extract(reader, entries))
+        finally:
+            reader.close()
+        assert [e.key.instance for e, _ in results] == [e.key.instance for e in entries]
+        assert [bytes(d) for _, d in results] == [blobs[e.key.instance][1] for e in entries]
+
+    def test_completion_order(self, tmp_path):
+        blobs = _mixed_blobs()
+        reader = _package(tmp_path, blobs)
+        with ParallelExtractor(max_workers=4, process_workers=0) as extractor:
+            results = {e.key.instance: bytes(d)
+                       for e, d in extractor.extract(reader, reader.entries, ordered=False)}
+        assert results == {i: original for i, (_, original, _) in enumerate(blobs)}
+
+    def test_tiny_budget(self, tmp_path):
+        blobs = _mixed_blobs(10)
+        reader = _package(tmp_path, blobs)
+        with ParallelExtractor(process_workers=0, max_in_flight=1) as extractor:
+            results = [bytes(d) for _, d in extractor.extract(reader, reader.entries)]
+        assert results == [original for _, original, _ in blobs]
+
+    def test_budget_holds_back_submission(self, tmp_path):
+        lock = threading.Lock()
+        active = [0, 0]  # running now, most at once
+
+        def slow_zlib(data):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return zlib.decompress(data)
+
+        codecs = CodecRegistry()
+        codecs.register(0x5A42, "zlib", slow_zlib)
+        original = b"z" * 100
+        stored = zlib.compress(original)
+        reader = _package(tmp_path, [(stored, original, 0x5A42)] * 4, codecs)
+        # Room for one job: the next must not start until the last is done
+        with ParallelExtractor(max_workers=4, process_workers=0,
+                               max_in_flight=len(stored) + len(original)) as extractor:
+            results = [bytes(d) for _, d in
+                       extractor.extract(reader, reader.entries, ordered=False)]
+        assert results == [original] * 4
+        assert active[1] == 1
+
+    def test_pools_shared_across_packages(self, tmp_path):
+        (tmp_path / "a").mkdir()
+        (tmp_path / "b").mkdir()
+        blobs = [_mixed_blobs(6), _mixed_blobs(9)[::-1]]
+        readers = [_package(tmp_path / "a", blobs[0]), _package(tmp_path / "b", blobs[1])]
+        with ParallelExtractor(max_workers=2, process_workers=0) as extractor:
+            for reader, expected in zip(readers, blobs):
+                results = [bytes(d) for _, d in extractor.extract(reader, reader.entries)]
+                assert results == [original for _, original, _ in expected]
+        # Each package's codec counters go to its own registry
+        assert [r.codecs.stats()["zlib"]["calls"] for r in readers] == [2, 3]
+
+    def test_codec_stats_recorded(self, tmp_path):
+        codecs = CodecRegistry()
+        reader = _package(tmp_path, _mixed_blobs(9), codecs)
+        with ParallelExtractor(process_workers=0) as extractor:
+            list(extractor.extract(reader, reader.entries))
+        stats = codecs.stats()
+        assert stats["zlib"]["calls"] == 3
+        assert stats["refpack"]["calls"] == 3
+        assert "raw" not in stats
+
+    def test_errors_return(self, tmp_path):
+        blobs = [(b"not zlib at all", b"x" * 40, 0x5A42), (b"ok", b"ok", 0)]
+        codecs = CodecRegistry()
+        reader = _package(tmp_path, blobs, codecs)
+        with ParallelExtractor(process_workers=0) as extractor:
+            results = list(extractor.extract(reader, reader.entries, errors="return"))
+        assert isinstance(results[0][1], ValueError)
+        assert "Failed to decompress" in str(results[0][1])
+        assert bytes(results[1][1]) == b"ok"
+        assert codecs.stats()["zlib"]["errors"] == 1
+
+    def test_errors_strict(self, tmp_path):
+        reader = _package(tmp_path, [(b"not zlib at all", b"x" * 40, 0x5A42)])
+        with ParallelExtractor(process_workers=0) as extractor:
+            with pytest.raises(ValueError, match="Failed to decompress"):
+                list(extractor.extract(reader, reader.entries))
+
+    def test_unknown_type_and_fallback(self, tmp_path):
+        original = b"y" * 40
+        blobs = [(zlib.compress(original), original, 0x0001)]
+        reader = _package(tmp_path, blobs)
+        with ParallelExtractor(process_workers=0) as extractor:
+            with pytest.raises(ValueError, match="Unsupported compression type"):
+                list(extractor.extract(reader, reader.entries))
+
+        reader = _package(tmp_path, blobs, CodecRegistry(fallback=True))
+        with ParallelExtractor(process_workers=0) as extractor:
+            assert [bytes(d) for _, d in extractor.extract(reader, reader.entries)] == [original]
+
+    def test_invalid_errors_mode(self, tmp_path):
+        reader = _package(tmp_path, _mixed_blobs(1))
+        with ParallelExtractor() as extractor:
+            with pytest.raises(ValueError, match="Unknown errors mode"):
+                list(extractor.extract(reader, reader.entries, errors="ignore"))
@@ -1,9 +1,18 @@
 """Tests for util/datamining/refpack.py — RefPack/QFS decompression."""
 
+import random
 import struct
+import tracemalloc
 import pytest
 
-from util.datamining.refpack import is_refpack, decompress
+from util.datamining.refpack import (
+    WINDOW_SIZE,
+    RefPackDecompressor,
+    compress,
+    decompress,
+    is_refpack,
+    iter_decompress,
+)
 
 
 # ---------------------------------------------------------------------------
@@ -27,6 +36,121 @@ def _make_literal_payload(literal_bytes, magic=b'\x10\xFB'):
     return magic + size_bytes + bytes([code]) + literal_bytes + b'\xFC'
 
 
+def _make_long_copy_stream(total_size, seed=0):
+    """Build a RefPack stream mixing 112-byte literal runs with 4-byte
+    control back-references (offsets up to the full 128 KiB window).
+
+    Returns (stream, expected_output); the expected output is computed here
+    independently of the decoder.
+    """
+    import random
+    rng = random.Random(seed)
+    out = bytearray()
+    codes = bytearray()
+    while len(out) < total_size:
+        if len(out) < 4096 or rng.random() < 0.3:
+            literal = bytes(rng.getrandbits(8) for _ in range(112))
+            codes += bytes([0xFB]) + literal
+            out += literal
+            continue
+        offset = rng.randint(1, min(len(out), WINDOW_SIZE))
+        length = rng.randint(5, 1028)
+        codes += bytes([
+            0xC0 | (((offset - 1) >> 16) & 1) << 4 | (((length - 5) >> 8) & 3) << 2,
+            ((offset - 1) >> 8) & 0xFF,
+            (offset - 1) & 0xFF,
+            (length - 5) & 0xFF,
+        ])
+        start = len(out) - offset
+        for i in range(length):
+            out.append(out[start + i])
+    header = b'\x90\xFB' + struct.pack(">I", len(out))
+    return header + bytes(codes) + b'\xFC', bytes(out)
+
+
+def _reference_decompress(data):
+    """Byte-at-a-time decoder the optimized one must match exactly."""
+    src = 4 if len(data) >= 6 and data[4] in (0x10, 0x50) and data[5] == 0xFB else 0
+    if data[src] & 0x80:
+        size = struct.unpack_from(">I", data, src + 2)[0]
+        src += 6
+    else:
+        size = struct.unpack_from(">I", b"\x00" + data[src + 2:src + 5])[0]
+        src += 5
+    out = bytearray()
+    while src < len(data):
+        code = data[src]
+        copy_length = 0
+        if code <= 0x7F:
+            if src + 1 >= len(data):
+                break
+            literals, copy_length = code & 3, ((code & 0x1C) >> 2) + 3
+            offset = ((code & 0x60) << 3) + data[src + 1] + 1
+            src += 2
+        elif code <= 0xBF:
+            if src + 2 >= len(data):
+                break
+            literals, copy_length = data[src + 1] >> 6, (code & 0x3F) + 4
+            offset = ((data[src + 1] & 0x3F) << 8) + data[src + 2] + 1
+            src += 3
+        elif code <= 0xDF:
+            if src + 3 >= len(data):
+                break
+            literals, copy_length = code & 3, ((code & 0x0C) << 6) + data[src + 3] + 5
+            offset = ((code & 0x10) << 12) + (data[src + 1] << 8) + data[src + 2] + 1
+            src += 4
+        else:
+            literals = ((code & 0x1F) << 2) + 4 if code <= 0xFB else code & 3
+            src += 1
+        out += data[src:src + literals]
+        src += literals
+        start = len(out) - offset if copy_length else 0
+        for i in range(copy_length):
+            out.append(out[start + i])
+        if code >= 0xFC:
+            break
+    return bytes(out[:size])
+
+
+def _make_random_stream(rng, tokens=400, size_delta=0):
+    """Build a RefPack stream from random control codes of every kind,
+    including overlapping short-distance copies. The declared size is the
+    real output size plus size_delta."""
+    codes = bytearray()
+    produced = 0
+    for _ in range(tokens):
+        kind = rng.choice("LSMGR" if produced else "L")
+        if kind == "L":
+            n = rng.randint(0, 27)
+            codes.append(0xE0 | n)
+            codes += bytes(rng.getrandbits(8) for _ in range(n * 4 + 4))
+            produced += n * 4 + 4
+            continue
+        literals = rng.randint(0, 3)
+        if kind == "R":
+            # Run-length style: distance 1-4, longer than the distance
+            offset, length = rng.randint(1, min(4, produced)), rng.randint(5, 67)
+            kind = "M"
+        else:
+            limit = {"S": 1024, "M": 16384, "G": WINDOW_SIZE}[kind]
+            offset = rng.randint(1, min(limit, produced + literals))
+            length = rng.randint(*{"S": (3, 10), "M": (4, 67), "G": (5, 1028)}[kind])
+        o = offset - 1
+        if kind == "S":
+            codes += bytes([(o >> 3) & 0x60 | (length - 3) << 2 | literals, o & 0xFF])
+        elif kind == "M":
+            codes += bytes([0x80 | (length - 4), literals << 6 | o >> 8, o & 0xFF])
+        else:
+            codes += bytes([0xC0 | (o >> 12) & 0x10 | ((length - 5) >> 8) << 2 | literals,
+                            (o >> 8) & 0xFF, o & 0xFF, (length - 5) & 0xFF])
+        codes += bytes(rng.getrandbits(8) for _ in range(literals))
+        produced += literals + length
+    trailing = rng.randint(0, 3)
+    codes.append(0xFC | trailing)
+    codes += bytes(rng.getrandbits(8) for _ in range(trailing))
+    return b'\x90\xFB' + struct.pack(">I", max(produced + size_delta, 0)) + bytes(codes)
+
+
 # ===================================================================
 # is_refpack tests
 # ===================================================================
@@ -192,6 +316,25 @@ class TestDecompressTruncation:
         assert result == b'ABCDE'
         assert len(result) == declared_size
 
+    def test_oversized_declared_size_not_preallocated(self):
+        """A corrupt header claiming ~4 GiB must not allocate it up front."""
+        tracemalloc.start()
+        try:
+            assert decompress(b'\x90\xFB\xFF\xFF\xFF\xF0\xFC') == b''
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert peak < 1 << 20
+
+    def test_oversized_declared_size_keeps_decoded_output(self):
+        payload = b'TESTDATA'
+        stream = b'\x90\xFB\xFF\xFF\xFF\xF0' + bytes([0xE1]) + payload + b'\xFC'
+        assert decompress(stream) == payload
+
+    def test_highly_compressed_stream(self):
+        data = bytes(1 << 20)
+        assert decompress(compress(data)) == data
+
 
 # ===================================================================
 # decompress — back-reference (2-byte control code, 0x00-0x7F range)
@@ -401,3 +544,266 @@ class TestDecompress50FB:
         stream = _make_literal_payload(payload, magic=b'\x50\xFB')
         result = decompress(stream)
         assert result == payload
+
+
+# ===================================================================
+# iter_decompress — windowed streaming decoder
+# ===================================================================
+
+class TestIterDecompress:
+    def test_matches_expected_output(self):
+        stream, expected = _make_long_copy_stream(600 * 1024)
+        assert decompress(stream) == expected
+        assert b"".join(iter_decompress(stream, chunk_size=16 * 1024)) == expected
+
+    def test_chunks_bounded(self):
+        stream, expected = _make_long_copy_stream(600 * 1024, seed=1)
+        chunks = list(iter_decompress(stream, chunk_size=16 * 1024))
+        assert len(chunks) > 10
+        # One control code writes at most 1028 + 3 bytes past the threshold;
+        # the final chunk also carries the retained window
+        assert max(len(c) for c in chunks[:-1]) <= 16 * 1024 + 1031
+        assert len(chunks[-1]) <= WINDOW_SIZE + 16 * 1024 + 1031
+
+    def test_small_stream_single_chunk(self):
+        payload = bytes(range(112))
+        assert list(iter_decompress(_make_literal_payload(payload))) == [payload]
+
+    def test_zero_length(self):
+        assert b"".join(iter_decompress(b'\x10\xFB\x00\x00\x00\xFC')) == b''
+
+    def test_bad_header_raises_immediately(self):
+        with pytest.raises(ValueError, match="Invalid RefPack magic"):
+            iter_decompress(b'\x10\xAA\x00\x00\x00')
+
+
+# ===================================================================
+# decompress — optimized decoder matches the byte-at-a-time reference
+# ===================================================================
+
+class TestDecompressMatchesReference:
+    @pytest.mark.parametrize("seed", range(20))
+    def test_random_streams(self, seed):
+        rng = random.Random(seed)
+        stream = _make_random_stream(rng, size_delta=rng.choice([0, 0, -50, 50]))
+        expected = _reference_decompress(stream)
+        assert decompress(stream) == expected
+        assert b"".join(iter_decompress(stream, chunk_size=4096)) == expected
+
+    @pytest.mark.parametrize("cut", [1, 2, 3, 7, 100])
+    def test_truncated_streams(self, cut):
+        stream = _make_random_stream(random.Random(cut), tokens=50)[:-cut]
+        assert decompress(stream) == _reference_decompress(stream)
+
+    def test_long_copy_stream(self):
+        stream, expected = _make_long_copy_stream(300 * 1024, seed=2)
+        assert _reference_decompress(stream) == expected
+        assert decompress(stream) == expected
+
+    @pytest.mark.parametrize("offset", [1, 2, 3, 4])
+    def test_run_length_patterns(self, offset):
+        # 4 literals, then a 3-byte control copying 67 bytes from `offset` back
+        stream = (b'\x10\xFB\x00\x00\x47\xE0ABCD'
+                  + bytes([0xBF, 0x00, offset - 1]) + b'\xFC')
+        expected = _reference_decompress(stream)
+        assert len(expected) == 71
+        assert decompress(stream) == expected
+
+    def test_offset_before_start_rejected(self):
+        stream = b'\x10\xFB\x00\x00\x0B\xE0ABCD' + bytes([0x80, 0x00, 0x07]) + b'\xFC'
+        with pytest.raises(ValueError, match="back-reference offset 8"):
+            decompress(stream)
+
+
+# ===================================================================
+# compress — round trips through decompress
+# ===================================================================
+
+def _control_forms(stream):
+    """Set of control code forms ("2", "3", "4", "literal", "stop") used."""
+    src = 6 if stream[0] & 0x80 else 5
+    forms = set()
+    while src < len(stream):
+        code = stream[src]
+        if code <= 0x7F:
+            forms.add("2")
+            src += 2 + (code & 3)
+        elif code <= 0xBF:
+            forms.add("3")
+            src += 3 + (stream[src + 1] >> 6)
+        elif code <= 0xDF:
+            forms.add("4")
+            src += 4 + (code & 3)
+        elif code <= 0xFB:
+            forms.add("literal")
+            src += 1 + ((code & 0x1F) << 2) + 4
+        else:
+            forms.add("stop")
+            assert src + 1 + (code & 3) == len(stream)
+            break
+    return forms
+
+
+def _tuning_like(size, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size:
+        parts.append(b'<T n="tuning_%d">%d</T>\n' % (rng.randint(0, 500), rng.randint(0, 99999)))
+        total += len(parts[-1])
+    return b"".join(parts)[:size]
+
+
+class TestCompress:
+    @pytest.mark.parametrize("level", range(1, 10))
+    def test_round_trip_levels(self, level):
+        data = _tuning_like(50000)
+        stream = compress(data, level)
+        assert stream[:2] == b'\x10\xFB'
+        assert len(stream) < len(data) // 2
+        assert decompress(stream) == data
+
+    @pytest.mark.parametrize("data", [
+        b"",
+        b"a",
+        b"ab",
+        b"abc",
+        b"abcabc",
+        b"\x00" * 5000,
+        bytes(range(256)) * 40,
+        bytes(random.Random(3).getrandbits(8) for _ in range(5000)),
+    ], ids=["empty", "1", "2", "3", "repeat", "zeros", "ramp", "random"])
+    def test_round_trip_edge_cases(self, data):
+        for level in (1, 6, 9):
+            assert decompress(compress(data, level)) == data
+
+    def test_uses_every_control_form(self):
+        rng = random.Random(4)
+        block = bytes(rng.getrandbits(8) for _ in range(20000))
+        # Short near repeats, medium repeats, and repeats of distant blocks
+        data = (b"abcXabcYabcZ" + block + block[15000:15040] + bytes(200)
+                + block[5000:5100] + block[:2000] + b"end")
+        stream = compress(data)
+        assert _control_forms(stream) == {"2", "3", "4", "literal", "stop"}
+        assert decompress(stream) == data
+
+    def test_long_matches_within_window(self):
+        data = bytes(random.Random(5).getrandbits(8) for _ in range(WINDOW_SIZE)) * 3
+        stream = compress(data, 1)
+        assert len(stream) < WINDOW_SIZE + 2048
+        assert decompress(stream) == data
+        assert b"".join(iter_decompress(stream, chunk_size=8192)) == data
+
+    def test_higher_level_not_larger(self):
+        data = _tuning_like(100000, seed=1)
+        assert len(compress(data, 9)) <= len(compress(data, 1))
+
+    def test_large_size_header(self):
+        data = bytes(1 << 24)
+        stream = compress(data, 1)
+        assert stream[:6] == b'\x90\xFB' + struct.pack(">I", 1 << 24)
+        assert decompress(stream) == data
+
+    @pytest.mark.parametrize("level", [0, 10, "6"])
+    def test_bad_level(self, level):
+        with pytest.raises(ValueError, match="level must be 1-9"):
+            compress(b"data", level)
+
+
+# ===================================================================
+# RefPackDecompressor — incremental feed/flush decoder
+# ===================================================================
+
+def _feed_in_pieces(stream, rng, max_length=0):
+    decompressor = RefPackDecompressor()
+    out = []
+    pos = 0
+    while pos < len(stream):
+        step = rng.randint(1, 3000)
+        out.append(decompressor.feed(memoryview(stream)[pos:pos + step], max_length))
+        pos += step
+    out.append(decompressor.flush())
+    return decompressor, b"".join(out)
+
+
+class TestRefPackDecompressor:
+    @pytest.mark.parametrize("seed", range(10))
+    def test_pieces_match_decompress(self, seed):
+        rng = random.Random(seed)
+        stream = _make_random_stream(rng, size_delta=rng.choice([0, -50, 50]))
+        _, data = _feed_in_pieces(stream, rng)
+        assert data == decompress(stream)
+
+    @pytest.mark.parametrize("cut", [1, 2, 3, 7, 100])
+    def test_truncated_stream_flush(self, cut):
+        stream = _make_random_stream(random.Random(cut), tokens=50)[:-cut]
+        _, data = _feed_in_pieces(stream, random.Random(cut))
+        assert data == decompress(stream)
+
+    def test_window_bounded(self):
+        stream, expected = _make_long_copy_stream(1024 * 1024, seed=6)
+        decompressor = RefPackDecompressor()
+        out = bytearray()
+        for pos in range(0, len(stream), 4096):
+            out += decompressor.feed(stream[pos:pos + 4096])
+            # History is trimmed back to the window once it doubles
+            assert len(decompressor._output) < 2 * WINDOW_SIZE
+        out += decompressor.flush()
+        assert out == expected
+        assert decompressor.eof
+
+    def test_max_length(self):
+        stream, expected = _make_long_copy_stream(200 * 1024, seed=7)
+        decompressor = RefPackDecompressor()
+        chunks = [decompressor.feed(stream, 1000)]
+        while chunks[-1]:
+            chunks.append(decompressor.feed(b"", 1000))
+        chunks.append(decompressor.flush())
+        assert b"".join(chunks) == expected
+        assert max(len(c) for c in chunks) == 1000
+
+    def test_stream_to_hash(self):
+        import hashlib
+        data = _tuning_like(300000, seed=2)
+        stream = compress(data)
+        digest = hashlib.sha256()
+        decompressor = RefPackDecompressor()
+        for pos in range(0, len(stream), 1000):
+            digest.update(decompressor.feed(stream[pos:pos + 1000]))
+        digest.update(decompressor.flush())
+        assert digest.hexdigest() == hashlib.sha256(data).hexdigest()
+        assert decompressor.size == len(data)
+
+    def test_unused_data(self):
+        stream = _make_literal_payload(b"ABCD") + b"extra"
+        decompressor = RefPackDecompressor()
+        assert decompressor.feed(stream[:5]) == b""
+        assert decompressor.size is None
+        assert decompressor.feed(stream[5:]) == b"ABCD"
+        assert decompressor.eof
+        assert decompressor.feed(b"more") == b""
+        assert decompressor.unused_data == b"extramore"
+        assert decompressor.flush() == b""
+
+    def test_zero_length(self):
+        decompressor = RefPackDecompressor()
+        assert decompressor.feed(b'\x10\xFB\x00\x00\x00\xFC') == b""
+        assert decompressor.flush() == b""
+        assert decompressor.size == 0
+
+    def test_invalid_magic(self):
+        with pytest.raises(ValueError, match="Invalid RefPack magic"):
+            RefPackDecompressor().feed(b'\x10\xAA' + bytes(10))
+
+    def test_short_header_on_flush(self):
+        decompressor = RefPackDecompressor()
+        decompressor.feed(b'\x10\xFB\x00')
+        with pytest.raises(ValueError, match="Data too short"):
+            decompressor.flush()
+
+    def test_feed_after_flush(self):
+        decompressor = RefPackDecompressor()
+        decompressor.feed(_make_literal_payload(b"ABCD"))
+        decompressor.flush()
+        with pytest.raises(ValueError, match="already flushed"):
+            decompressor.feed(b"x")
@@ -0,0 +1,169 @@
+"""Tests for util/datamining/resource_index.py — merged game-wide resource index."""
+
+import os
+import struct
+
+from util.datamining.compression import COMPRESSION_DELETED
+from util.datamining.package_index import ResourceKey
+from util.datamining.resource_index import GameResourceIndex
+from tests.test_datamining import build_test_package
+
+
+IMAGE = 0x00B2D882
+OBJD = 0xC0DB5AE7
+
+
+def _write(path, resources, deleted=()):
+    """Write a package; rows listed in deleted are marked as deletions."""
+    data = bytearray(build_test_package(resources))
+    index_offset = struct.unpack_from("<I", data, 64)[0]
+    for row in deleted:
+        # Compression type follows the 28 bytes of key, offset and sizes
+        struct.pack_into("<H", data, index_offset + 4 + 32 * row + 28, COMPRESSION_DELETED)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _setup_game_folder(tmp_path):
+    gf = str(tmp_path / "game")
+    client = os.path.join(gf, "Data", "Client")
+    _write(os.path.join(client, "ClientFullBuild0.package"), [
+        (IMAGE, 0, 1, b"full-1"),
+        (IMAGE, 0, 2, b"full-2"),
+        (OBJD, 0, 3, b"objd-3"),
+    ])
+    # Sorts before ClientFullBuild0 alphabetically but must still win
+    _write(os.path.join(client, "ClientDeltaBuild0.package"), [
+        (IMAGE, 0, 2, b"delta-2"),
+    ])
+    _write(os.path.join(gf, "EP01", "ClientFullBuild0.package"), [
+        (IMAGE, 0, 4, b"ep01-4"),
+    ])
+    _write(os.path.join(gf, "Delta", "EP01", "ClientDeltaBuild0.package"), [
+        (IMAGE, 0, 2, b"ep-delta-2"),
+        (OBJD, 0, 5, b"objd-5"),
+    ])
+    return gf
+
+
+def _read(location):
+    from util.datamining.package_reader import PackageReader
+    return PackageReader(location.package_path).extract_resource(location.entry)
+
+
+class TestGameResourceIndex:
+    def test_unique_keys(self, tmp_path):
+        index = GameResourceIndex.from_game_folder(_setup_game_folder(tmp_path))
+        assert len(index.packages) == 4
+        assert len(index) == 5
+        assert (IMAGE, 0, 1) in index
+        assert ResourceKey(OBJD, 0, 5) in index
+        assert (IMAGE, 0, 99) not in index
+
+    def test_lookup_delta_wins(self, tmp_path):
+        index = GameResourceIndex.from_game_folder(_setup_game_folder(tmp_path))
+        location = index.lookup(IMAGE, 0, 2)
+        assert location.rel_path.replace(os.sep, "/") == "Delta/EP01/ClientDeltaBuild0.package"
+        assert _read(location) == b"ep-delta-2"
+        assert _read(index.lookup(IMAGE, 0, 1)) == b"full-1"
+        assert index.lookup(IMAGE, 0, 99) is None
+
+    def test_overridden(self, tmp_path):
+        index = GameResourceIndex.from_game_folder(_setup_game_folder(tmp_path))
+        assert index.overridden_keys() == [(IMAGE, 0, 2)]
+        assert index.overridden_count == 2
+        assert [_read(loc) for loc in index.overridden((IMAGE, 0, 2))] == [b"full-2", b"delta-2"]
+        assert index.overridden((IMAGE, 0, 1)) == []
+
+    def test_iter_type(self, tmp_path):
+        index = GameResourceIndex.from_game_folder(_setup_game_folder(tmp_path))
+        images = {loc.entry.key.instance: _read(loc) for loc in index.iter_type(IMAGE)}
+        assert images == {1: b"full-1", 2: b"ep-delta-2", 4: b"ep01-4"}
+        assert [loc.entry.key.instance for loc in index.iter_type(OBJD)] == [3, 5]
+
+    def test_by_package_winners_only(self, tmp_path):
+        index = GameResourceIndex.from_game_folder(_setup_game_folder(tmp_path))
+        extracted = {}
+        for reader, rel_path, entries in index.by_package(include_types={IMAGE}):
+            assert reader.is_mapped
+            for entry in entries:
+                assert entry.key.instance not in extracted
+                extracted[entry.key.instance] = reader.extract_resource(entry)
+        assert extracted == {1: b"full-1", 2: b"ep-delta-2", 4: b"ep01-4"}
+        assert not any(reader.is_mapped for reader in index.readers)
+
+    def test_by_package_include_overridden(self, tmp_path):
+        index = GameResourceIndex.from_game_folder(_setup_game_folder(tmp_path))
+        data = [reader.extract_resource(entry)
+                for reader, _, entries in index.by_package(include_types={IMAGE},
+                                                           include_overridden=True)
+                for entry in entries if entry.key.instance == 2]
+        assert data == [b"full-2", b"delta-2", b"ep-delta-2"]
+
+    def test_by_package_filters(self, tmp_path):
+        gf = _setup_game_folder(tmp_path)
+        index = GameResourceIndex.from_game_folder(gf)
+        rels = [rel for _, rel, _ in index.by_package(exclude_types={IMAGE})]
+        assert [r.replace(os.sep, "/") for r in rels] == [
+            "Data/Client/ClientFullBuild0.package",
+            "Delta/EP01/ClientDeltaBuild0.package",
+        ]
+        only_ep01 = [os.path.join(gf, "EP01", "ClientFullBuild0.package")]
+        tables = [entries for _, _, entries in index.by_package(packages=only_ep01)]
+        assert [len(t) for t in tables] == [1]
+
+    def test_by_package_sorted_by_offset(self, tmp_path):
+        # Reverse the index records so index order is the opposite of data order
+        data = build_test_package([(IMAGE, 0, i, bytes([i]) * 4) for i in range(5)])
+        records = data[-5 * 32:]
+        reversed_records = b"".join(records[i:i + 32] for i in range(4 * 32, -32, -32))
+        path = str(tmp_path / "a.package")
+        with open(path, "wb") as f:
+            f.write(data[:-5 * 32] + reversed_records)
+
+        index = GameResourceIndex([(path, "a.package")])
+        assert [e.key.instance for e in index.readers[0].entries] == [4, 3, 2, 1, 0]
+        _, _, entries = next(index.by_package())
+        assert [entry.key.instance for entry in entries] == [0, 1, 2, 3, 4]
+
+    def test_empty(self, tmp_path):
+        gf = str(tmp_path / "empty")
+        os.makedirs(gf)
+        index = GameResourceIndex.from_game_folder(gf)
+        assert len(index) == 0
+        assert list(index.by_package()) == []
+
+    def test_deleted_by_delta(self, tmp_path):
+        gf = _setup_game_folder(tmp_path)
+        # Deletes image 1 and OBJD 3; re-adds nothing
+        _write(os.path.join(gf, "Delta", "GP01", "ClientDeltaBuild0.package"), [
+            (IMAGE, 0, 1, b""),
+            (OBJD, 0, 3, b""),
+        ], deleted=(0, 1))
+        index = GameResourceIndex.from_game_folder(gf)
+
+        assert index.deleted_keys() == [(IMAGE, 0, 1), (OBJD, 0, 3)]
+        assert index.deleted_keys(include_types={IMAGE}) == [(IMAGE, 0, 1)]
+        assert index.deleted_keys(exclude_types={IMAGE}) == [(OBJD, 0, 3)]
+        assert [_read(loc) for loc in index.overridden((IMAGE, 0, 1))] == [b"full-1"]
+        assert {loc.entry.key.instance for loc in index.iter_type(IMAGE)} == {2, 4}
+
+        winners = {entry.key.instance for _, _, entries in index.by_package()
+                   for entry in entries}
+        assert winners == {2, 4, 5}
+        everything = [entry for _, _, entries in index.by_package(include_overridden=True)
+                      for entry in entries]
+        assert all(entry.compression_type != COMPRESSION_DELETED for entry in everything)
+
+    def test_deleted_then_restored(self, tmp_path):
+        gf = str(tmp_path / "game")
+        _write(os.path.join(gf, "Data", "Client", "ClientFullBuild0.package"),
+               [(IMAGE, 0, 1, b"full")])
+        _write(os.path.join(gf, "Data", "Client", "ClientDeltaBuild0.package"),
+               [(IMAGE, 0, 1, b"")], deleted=(0,))
+        _write(os.path.join(gf, "Delta", "EP01", "ClientDeltaBuild0.package"),
+               [(IMAGE, 0, 1, b"back")])
+        index = GameResourceIndex.from_game_folder(gf)
+        assert index.deleted_keys() == []
+        assert [_read(loc) for loc in index.iter_type(IMAGE)] == [b"back"]
@@ -1,6 +1,16 @@
+import xml.etree.ElementTree as ET
+
 import pytest
 
-from util.datamining.tuning_splitter import split_combined_tuning, SplitEntry
+from benchmarks.corpora import encode_combined_tuning
+from util.datamining.binary_tuning import decode_combined_tuning
+from util.datamining.tuning_splitter import (
+    _build_ref_table,
+    iter_split_combined_tuning,
+    resolve_references,
+    split_combined_tuning,
+    SplitEntry,
+)
 
 
 # CombinedTuning with shared <g> reference table
@@ -84,6 +94,35 @@ NESTED_REFS = b"""\
 </combined>
 """
 
+# Shared entries reused under different names, nested, escaped, with tails,
+# plus references that cannot be resolved
+SHARED_EDGE_CASES = b"""\
+<?xml version="1.0" encoding="utf-8"?>
+<combined>
+  <g s="merged">
+    <T x="0">a &amp; b &lt;c&gt;</T>tail &amp; more
+    <E n="preset" x="1">ENUM</E>
+    <L x="2"><r n="first" x="0" /><T>"quoted"</T><r x="1" />end</L>
+    <U x="3">
+      <r n="list" x="2" />
+      <r n="missing" x="99" />
+    </U>
+  </g>
+  <R>
+    <I c="Test" i="test" m="test.a" n="test_A" s="1">
+      <r n="one" x="0" />
+      <r n="two" x="0" />
+      <r x="1" />
+      <r n="deep" x="3" /> after
+      <r n="gone" x="42"><r n="kept" x="0" /></r>
+      <r n="no_x" />
+      <T n="text">x &gt; y</T>
+    </I>
+    <M n="test.b" s="2"><U n="wrapped"><r n="deep" x="3" /></U></M>
+  </R>
+</combined>
+"""
+
 
 class TestSplitCombinedTuning:
     def test_basic_split(self):
@@ -172,3 +211,97 @@ class TestSplitCombinedTuning:
         career = next(e for e in entries if e.name == "career_Astronaut")
         assert career.cls == "Career"
         assert "0xCCCCDDDD" in career.xml
+
+    def test_prebuilt_tree(self):
+        root = ET.fromstring(COMBINED_WITH_REFS)
+        assert split_combined_tuning(root) == split_combined_tuning(COMBINED_WITH_REFS)
+
+    def test_binary_matches_decoded_xml(self):
+        data = encode_combined_tuning(ET.fromstring(COMBINED_WITH_REFS))
+        entries = split_combined_tuning(data)
+        assert len(entries) == 3
+        assert entries == split_combined_tuning(decode_combined_tuning(data).encode("utf-8"))
+        cooking = next(e for e in entries if e.name == "skill_Cooking")
+        assert "<r " not in cooking.xml
+        assert "Creative" in cooking.xml
+
+    def test_binary_whitespace_matches_decoded_xml(self):
+        root = ET.fromstring(COMBINED_WITH_REFS)
+        shared = root.find("g")[0]
+        shared.text = "two\r\nlines"
+        shared.set("v", "tab\tand\nnewline")
+        next(root.iter("I")).set("n", "name\r\nwrapped")
+        data = encode_combined_tuning(root)
+        entries = split_combined_tuning(data)
+        assert entries == split_combined_tuning(decode_combined_tuning(data).encode("utf-8"))
+        assert entries[0].name == "name wrapped"
+        assert "&#10;" not in "".join(e.xml for e in entries)
+
+    def test_shared_expansion_matches_resolved_tree(self):
+        """Cached expansions must serialize exactly like a resolved deep copy."""
+        root = ET.fromstring(SHARED_EDGE_CASES)
+        ref_table = _build_ref_table(root)
+        expected = [ET.tostring(resolve_references(root.find("R")[i], ref_table), encoding="unicode")
+                    for i in range(2)]
+        before = ET.tostring(root)
+
+        entries = split_combined_tuning(root)
+        assert [e.xml for e in entries] == expected
+        assert ET.tostring(root) == before
+
+    def test_shared_expansion_content(self):
+        # Compare parsed elements: ElementTree on Python 3.7 sorts attributes
+        entries = split_combined_tuning(SHARED_EDGE_CASES)
+        one, two, enum, deep, gone, no_x = ET.fromstring(entries[0].xml)[:6]
+        assert (one.tag, one.attrib, one.text) == ("T", {"x": "0", "n": "one"}, "a & b <c>")
+        assert one.tail.strip() == "tail & more"
+        assert (two.tag, two.attrib, two.text) == ("T", {"x": "0", "n": "two"}, "a & b <c>")
+        assert (enum.tag, enum.attrib, enum.text) == ("E", {"n": "preset", "x": "1"}, "ENUM")
+        assert [child.attrib for child in deep] == [{"x": "2", "n": "list"}, {"n": "missing", "x": "99"}]
+        # Unresolvable references are left as they are, children included
+        assert (gone.tag, gone.attrib) == ("r", {"n": "gone", "x": "42"})
+        assert [(child.tag, child.attrib) for child in gone] == [("r", {"n": "kept", "x": "0"})]
+        assert (no_x.tag, no_x.attrib) == ("r", {"n": "no_x"})
+        module = ET.fromstring(entries[1].xml)
+        assert module.find(".//r[@n='list']") is None
+        assert module.find(".//L").get("n") == "list"
+
+
+class TestResolveReferences:
+    def test_returns_resolved_copy(self):
+        root = ET.fromstring(NESTED_REFS)
+        entry = root.find("R/I")
+        resolved = resolve_references(entry, _build_ref_table(root))
+        assert resolved is not entry
+        assert resolved.find("U").get("n") == "wrapper"
+        assert resolved.find("U/T").text == "inner_value"
+        assert resolved.find("U/T").get("n") == "nested"
+        # The source tree keeps its references
+        assert entry.find("r") is not None
+        assert root.find("g/U/r") is not None
+
+
+class TestIterSplitCombinedTuning:
+    @pytest.mark.parametrize("fixture", [COMBINED_WITH_REFS, WITH_MODULE_TUNING, SIMPLE_FORMAT])
+    def test_matches_split(self, fixture):
+        entries = iter_split_combined_tuning(fixture)
+        assert iter(entries) is entries
+        assert list(entries) == split_combined_tuning(fixture)
+
+    def test_binary_input(self):
+        data = encode_combined_tuning(ET.fromstring(COMBINED_WITH_REFS))
+        assert list(iter_split_combined_tuning(data)) == split_combined_tuning(data)
+
+    def test_entries_serialized_on_demand(self):
+        root = ET.fromstring(WITH_MODULE_TUNING)
+        entries = iter_split_combined_tuning(root)
+        first = next(entries)
+        assert first.element_tag == "I"
+        # Entries not reached yet may still change
+        for module in root.iter("M"):
+            module.set("s", "42")
+        assert {e.instance_id for e in entries if e.element_tag == "M"} == {"42"}
+
+    def test_malformed_data_raises_on_call(self):
+        with pytest.raises(ET.ParseError):
+            iter_split_combined_tuning(b"<combined><R>")
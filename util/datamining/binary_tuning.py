@@ -16,10 +16,33 @@ The binary format encodes XML as 7 tables:
   4: Attribute reference array (offsets to attributes)
   5: String reference array (offsets to null-terminated strings)
   6: Character data (raw strings, read via string ref offsets)
+
+Each schema is compiled once into a struct.Struct covering all of its
+columns (RowDecoder), so a structured row decodes with one unpack_from call
+instead of one seek and read per column.
+
+decode_combined_tuning() walks tables 1-5 as plain integer lists
+(TuningTables) with every relative offset already turned into a row index.
+When NumPy is installed the tables are mapped with np.frombuffer structured
+views and the offsets resolved with array arithmetic, so no per-row objects
+are created at all. The XML is written by an explicit-stack walk straight
+to a text stream (decode_combined_tuning_to), so deep nesting never hits the
+recursion limit and large documents can go to disk as they are produced.
+build_combined_tuning_tree() walks the same tables into an ET.TreeBuilder,
+for callers that want elements rather than text.
 """
 
+import io
 import struct
-from typing import Dict, List, Optional, Tuple
+import sys
+import time
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
 
 
 # Null offset sentinel
@@ -181,7 +204,7 @@ class Schema:
     """Parsed schema."""
     __slots__ = ('name', 'name_hash', 'schema_hash', 'schema_size',
                  'column_offset_pos', 'column_offset', 'num_columns',
-                 'columns', 'name_offset_pos')
+                 'columns', 'name_offset_pos', 'row_decoder')
 
     def __init__(self):
         self.name = None             # type: Optional[str]
@@ -193,6 +216,7 @@ class Schema:
         self.num_columns = 0         # type: int
         self.columns = []            # type: List[SchemaColumn]
         self.name_offset_pos = 0     # type: int
+        self.row_decoder = None      # type: Optional[RowDecoder]
 
 
 def _read_string_at(decoder, offset):
@@ -268,12 +292,237 @@ def _read_data_type(decoder, type_code):
         raise ValueError("Unknown type code: {}".format(type_code))
 
 
-def parse_binary_data(data):
-    # type: (bytes) -> Tuple[List[TableInfo], List[Schema], List[list], int]
-    """Parse the binary DATA format header, tables, schemas, and row data.
+# How each data type is laid out: (struct format, row value kind).
+# Kinds say how the unpacked values become the row value, matching what
+# _read_data_type returns for the type.
+_VALUE = 0        # the single value as-is
+_CHAR = 1         # chr() of a byte
+_OFFSET = 2       # DataOffsetObject dict
+_HASHED = 3       # DataOffsetObject dict with mHash
+_VECTOR = 4       # DataOffsetObject dict with mCount
+_VARIANT = 5      # DataOffsetObject dict with mTypeHash
+_TUPLE = 6        # tuple of all values
+_RESOURCE_KEY = 7  # {'instance', 'type', 'group'} dict
+
+_FIELD_FORMATS = {
+    DataType.Boolean: ('B', _VALUE),
+    DataType.Character: ('B', _CHAR),
+    DataType.Int8: ('B', _VALUE),
+    DataType.UInt8: ('B', _VALUE),
+    DataType.Int16: ('h', _VALUE),
+    DataType.UInt16: ('H', _VALUE),
+    DataType.Int32: ('i', _VALUE),
+    DataType.UInt32: ('I', _VALUE),
+    DataType.Int64: ('Q', _VALUE),
+    DataType.UInt64: ('Q', _VALUE),
+    DataType.Float: ('f', _VALUE),
+    DataType.String: ('i', _OFFSET),
+    DataType.HashedString: ('iI', _HASHED),
+    DataType.Object: ('i', _OFFSET),
+    DataType.Vector: ('iI', _VECTOR),
+    DataType.Float2: ('ff', _TUPLE),
+    DataType.Float3: ('fff', _TUPLE),
+    DataType.Float4: ('ffff', _TUPLE),
+    DataType.TableSetReference: ('Q', _VALUE),
+    DataType.ResourceKey: ('QII', _RESOURCE_KEY),
+    DataType.LocalizationKey: ('I', _VALUE),
+    DataType.Variant: ('iI', _VARIANT),
+}
+
+
+class RowDecoder:
+    """A schema compiled to a single struct.Struct.
+
+    Columns are placed at their offsets with pad bytes in between, so one
+    unpack_from reads a whole row; fields that decode to more than a plain
+    value (offset objects, tuples, resource keys) are rebuilt from the
+    unpacked values afterwards.
+    """
+    __slots__ = ('struct', 'row_size', 'names', 'fields', 'simple')
+
+    def __init__(self, fmt, row_size, fields):
+        # type: (str, int, List[Tuple[str, int, int, int, int]]) -> None
+        self.struct = struct.Struct(fmt)
+        self.row_size = row_size
+        # (column name, kind, index of its first unpacked value, number of
+        # values, column offset)
+        self.fields = fields
+        self.names = [field[0] for field in fields]
+        self.simple = all(field[1] == _VALUE for field in fields)
+
+    @classmethod
+    def compile(cls, schema):
+        # type: (Schema) -> Optional[RowDecoder]
+        """Compile a schema, or return None if its columns overlap or use
+        a type without a fixed layout (those rows are read field by field)."""
+        fmt = ['<']
+        fields = []  # type: List[Tuple[str, int, int, int, int]]
+        position = 0
+        value_index = 0
+        for col in schema.columns:
+            layout = _FIELD_FORMATS.get(col.data_type)
+            if layout is None or col.offset < position:
+                return None
+            field_format, kind = layout
+            if col.offset > position:
+                fmt.append('{}x'.format(col.offset - position))
+            fmt.append(field_format)
+            fields.append((col.name, kind, value_index, len(field_format), col.offset))
+            position = col.offset + struct.calcsize('<' + field_format)
+            value_index += len(field_format)
+        return cls(''.join(fmt), schema.schema_size, fields)
+
+    def decode(self, data, row_start):
+        # type: (bytes, int) -> dict
+        """Decode the row starting at row_start into a column-name dict."""
+        values = self.struct.unpack_from(data, row_start)
+        if self.simple:
+            return dict(zip(self.names, values))
+        row = {}
+        for name, kind, i, count, offset in self.fields:
+            if kind == _VALUE:
+                row[name] = values[i]
+            elif kind == _OFFSET:
+                row[name] = {'startof_mDataOffset': row_start + offset, 'mDataOffset': values[i]}
+            elif kind == _CHAR:
+                row[name] = chr(values[i])
+            elif kind == _HASHED:
+                row[name] = {'startof_mDataOffset': row_start + offset,
+                             'mDataOffset': values[i], 'mHash': values[i + 1]}
+            elif kind == _VECTOR:
+                row[name] = {'startof_mDataOffset': row_start + offset,
+                             'mDataOffset': values[i], 'mCount': values[i + 1]}
+            elif kind == _VARIANT:
+                row[name] = {'startof_mDataOffset': row_start + offset,
+                             'mDataOffset': values[i], 'mTypeHash': values[i + 1]}
+            elif kind == _TUPLE:
+                row[name] = values[i:i + count]
+            else:
+                row[name] = {'instance': values[i], 'type': values[i + 1], 'group': values[i + 2]}
+        return row
 
-    Returns (tables, schemas, table_data, version).
-    table_data[i] is a list of row dicts (if schema) or raw values (if no schema).
+
+class DataParseStats:
+    """Counters collected while parsing DATA resources, for diagnosing slow files.
+
+    One instance can be passed to any number of parse_binary_data() calls;
+    counters accumulate across them.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self.files = 0
+        self.rows_decoded = 0
+        self.schemas_resolved = 0
+        self.schema_size_fallbacks = 0
+        self.string_pool_size = 0   # strings decoded from the character data
+        self.string_pool_hits = 0   # node and attribute lookups into those strings
+        self.seconds = 0.0
+        self.tables = []  # type: List[Tuple[str, int, float]]
+
+    def add_table(self, name, rows, seconds):
+        # type: (str, int, float) -> None
+        self.rows_decoded += rows
+        self.seconds += seconds
+        self.tables.append((name, rows, seconds))
+
+    def add_table_seconds(self, position, seconds):
+        # type: (int, float) -> None
+        """Add more time to the table recorded at position in tables."""
+        name, rows, previous = self.tables[position]
+        self.tables[position] = (name, rows, previous + seconds)
+        self.seconds += seconds
+
+    def merge(self, other):
+        # type: (DataParseStats) -> None
+        """Add the counters and tables of other to this instance."""
+        for name, value in other.as_dict().items():
+            setattr(self, name, getattr(self, name) + value)
+        self.tables.extend(other.tables)
+
+    def slowest_tables(self, count=5):
+        # type: (int) -> List[Tuple[str, int, float]]
+        """The (name, rows, seconds) of the slowest tables, slowest first."""
+        return sorted(self.tables, key=lambda t: t[2], reverse=True)[:count]
+
+    def as_dict(self):
+        # type: () -> Dict[str, object]
+        return {
+            "files": self.files,
+            "rows_decoded": self.rows_decoded,
+            "schemas_resolved": self.schemas_resolved,
+            "schema_size_fallbacks": self.schema_size_fallbacks,
+            "string_pool_size": self.string_pool_size,
+            "string_pool_hits": self.string_pool_hits,
+            "seconds": self.seconds,
+        }
+
+
+def _read_values(decoder, data, data_type, row_count):
+    # type: (BinaryDecoder, bytes, int, int) -> list
+    """Read row_count raw values of one type, each padded to its alignment."""
+    table_start = decoder.tell()
+    layout = _FIELD_FORMATS.get(data_type)
+    alignment = DataType.alignment(data_type)
+    if layout is None or table_start % alignment:
+        rows = []
+        for _ in range(row_count):
+            rows.append(_read_data_type(decoder, data_type))
+            _seek_to_alignment(decoder, alignment - 1)
+        return rows
+
+    field_format, kind = layout
+    size = struct.calcsize('<' + field_format)
+    stride = size + (-size & (alignment - 1))
+    end = table_start + row_count * stride
+    decoder.seek(end)
+    if kind == _CHAR:
+        return list(data[table_start:end].decode('latin-1'))
+    if stride > size:
+        field_format += '{}x'.format(stride - size)
+    values = struct.iter_unpack('<' + field_format, data[table_start:end])
+    if kind == _VALUE:
+        return [v[0] for v in values]
+    if kind == _OFFSET:
+        return [{'startof_mDataOffset': table_start + n * stride, 'mDataOffset': v[0]}
+                for n, v in enumerate(values)]
+    # Uncommon multi-value types: reuse the row decoder logic
+    column = SchemaColumn()
+    column.data_type = data_type
+    schema = Schema()
+    schema.columns = [column]
+    schema.schema_size = stride
+    row_decoder = RowDecoder.compile(schema)
+    return [row_decoder.decode(data, table_start + n * stride)[None] for n in range(row_count)]
+
+
+def _read_rows(decoder, data, schema, row_count):
+    # type: (BinaryDecoder, bytes, Schema, int) -> List[dict]
+    """Read row_count structured rows at the decoder position and move past them."""
+    table_start = decoder.tell()
+    row_size = schema.schema_size
+    row_decoder = schema.row_decoder
+    if row_decoder is not None:
+        decode = row_decoder.decode
+        rows = [decode(data, table_start + n * row_size) for n in range(row_count)]
+    else:
+        rows = []
+        for n in range(row_count):
+            row_start = table_start + n * row_size
+            row = {}
+            for col in schema.columns:
+                decoder.seek(row_start + col.offset)
+                row[col.name] = _read_data_type(decoder, col.data_type)
+            rows.append(row)
+    decoder.seek(table_start + row_count * row_size)
+    return rows
+
+
+def _read_layout(data):
+    # type: (bytes) -> Tuple[BinaryDecoder, List[TableInfo], List[Schema], int, int]
+    """Parse the DATA header, table headers and schemas, without any rows.
+
+    Returns (decoder, tables, schemas, version, row_data_start).
     """
     decoder = BinaryDecoder(data)
 
@@ -352,53 +601,78 @@ def parse_binary_data(data):
             col.schema_offset = decoder.int32()
             s.columns.append(col)
         s.columns.sort(key=lambda c: c.offset)
+        s.row_decoder = RowDecoder.compile(s)
         last_column_end = decoder.tell()
         decoder.seek(schema_end)
         schemas.append(s)
 
-    # Read row data for each table
-    decoder.seek(row_data_start)
+    return decoder, tables, schemas, version, row_data_start
+
 
-    def get_schema_index(offset, row_size=0):
-        # type: (int, int) -> int
+def _schema_resolver(schemas, stats=None):
+    # type: (List[Schema], Optional[DataParseStats]) -> Callable[[TableInfo], Schema]
+    """Return a function mapping a table header to its schema."""
+    # Schemas by header position, and by size for the fallback below
+    schema_by_pos = {}  # type: Dict[int, Schema]
+    schema_by_size = {}  # type: Dict[int, Schema]
+    for sch in schemas:
+        schema_by_pos.setdefault(sch.name_offset_pos, sch)
+        schema_by_size.setdefault(sch.schema_size, sch)
+
+    def schema_for(tbl):
+        # type: (TableInfo) -> Schema
         # Primary: match by absolute offset to schema header position
-        for idx, sch in enumerate(schemas):
-            if offset == sch.name_offset_pos:
-                return idx
-        # Fallback: some packages store schema offsets that don't match header
-        # positions directly. Match by schema_size == row_size instead.
-        if row_size > 0:
-            for idx, sch in enumerate(schemas):
-                if sch.schema_size == row_size:
-                    return idx
-        raise ValueError("Unknown schema at offset {}".format(offset))
+        offset = tbl.schema_offset_pos + tbl.schema_offset
+        schema = schema_by_pos.get(offset)
+        if schema is None and tbl.row_size > 0:
+            # Fallback: some packages store schema offsets that don't match
+            # header positions directly. Match by schema_size == row_size instead.
+            schema = schema_by_size.get(tbl.row_size)
+            if schema is not None and stats is not None:
+                stats.schema_size_fallbacks += 1
+        if schema is None:
+            raise ValueError("Unknown schema at offset {}".format(offset))
+        if stats is not None:
+            stats.schemas_resolved += 1
+        return schema
+
+    return schema_for
+
+
+def parse_binary_data(data, stats=None):
+    # type: (bytes, Optional[DataParseStats]) -> Tuple[List[TableInfo], List[Schema], List[list], int]
+    """Parse the binary DATA format header, tables, schemas, and row data.
+
+    Returns (tables, schemas, table_data, version).
+    table_data[i] is a list of row dicts (if schema) or raw values (if no schema).
+    Pass a DataParseStats to collect row counts and per-table timings.
+    """
+    decoder, tables, schemas, version, row_data_start = _read_layout(data)
+    if stats is not None:
+        stats.files += 1
+    schema_for = _schema_resolver(schemas, stats)
+
+    # Read row data for each table
+    decoder.seek(row_data_start)
 
     table_data = []  # type: List[list]
-    for i in range(num_tables):
+    for i, tbl in enumerate(tables):
         _seek_to_alignment(decoder, 15)
         # Combined tuning doesn't need row-size alignment
-        tbl = tables[i]
-        rows = []
-
-        for _ in range(tbl.row_count):
-            if tbl.schema_offset == RELOFFSET_NULL:
-                # No schema — just read raw values
-                rows.append(_read_data_type(decoder, tbl.data_type))
-                alignment = DataType.alignment(tbl.data_type)
-                _seek_to_alignment(decoder, alignment - 1)
-            else:
-                # Has schema — read structured row
-                si = get_schema_index(tbl.schema_offset_pos + tbl.schema_offset, tbl.row_size)
-                schema = schemas[si]
-                row_start = decoder.tell()
-                row = {}
-                for col in schema.columns:
-                    decoder.seek(row_start + col.offset)
-                    row[col.name] = _read_data_type(decoder, col.data_type)
-                decoder.seek(row_start + schema.schema_size)
-                rows.append(row)
-                _seek_to_alignment(decoder, 0)  # alignment 1 minimum
+        started = time.perf_counter() if stats is not None else 0.0
+
+        if tbl.schema_offset == RELOFFSET_NULL:
+            # No schema — just read raw values
+            rows = _read_values(decoder, data, tbl.data_type, tbl.row_count)
+        elif tbl.row_count:
+            # Has schema — resolve it once for the whole table
+            rows = _read_rows(decoder, data, schema_for(tbl), tbl.row_count)
+        else:
+            rows = []
 
+        if stats is not None:
+            stats.add_table(tbl.name or "table{}".format(i), len(rows),
+                            time.perf_counter() - started)
         table_data.append(rows)
         _seek_to_alignment(decoder, 15)
 
@@ -419,132 +693,523 @@ def _is_null(ref):
     return ref['mDataOffset'] == RELOFFSET_NULL
 
 
-def decode_combined_tuning(data):
-    # type: (bytes) -> str
-    """Decode binary DATA combined tuning to XML string.
-
-    Args:
-        data: Raw decompressed CombinedTuning resource bytes (starts with "DATA").
+class TuningTables:
+    """CombinedTuning tables 1-5 as plain integer lists.
 
-    Returns:
-        XML string equivalent to what the XML-format CombinedTuning would contain.
+    Every offset is already resolved to a row index: node_attrs and
+    node_children index attr_refs and node_refs, whose entries index the
+    attribute and node tables. -1 stands for a null offset. strings holds
+    the absolute position of each string in the character data, and texts
+    the string itself, decoded once (tag and attribute names are interned).
+    node_text, attr_name and attr_value index both.
     """
-    tables, schemas, table_data, version = parse_binary_data(data)
-    decoder = BinaryDecoder(data)
+    __slots__ = ('top', 'first_element', 'node_text', 'node_attrs', 'node_children',
+                 'attr_name', 'attr_value', 'node_refs', 'attr_refs', 'strings', 'texts')
 
+    def __init__(self):
+        # type: () -> None
+        self.top = -1              # type: int  # node row of the root element
+        self.first_element = -1    # type: int  # node rows before this are text nodes
+        self.node_text = []        # type: List[int]
+        self.node_attrs = []       # type: List[int]
+        self.node_children = []    # type: List[int]
+        self.attr_name = []        # type: List[int]
+        self.attr_value = []       # type: List[int]
+        self.node_refs = []        # type: List[int]
+        self.attr_refs = []        # type: List[int]
+        self.strings = []          # type: List[int]
+        self.texts = []            # type: List[str]
+
+
+def _table_starts(tables):
+    # type: (List[TableInfo]) -> List[int]
+    """Absolute start of each table's rows (aligned to 16 bytes)."""
+    starts = []  # type: List[int]
+    for tbl in tables:
+        pos = tbl.row_offset_pos + tbl.row_offset
+        starts.append(pos + (-pos & 15))
+    return starts
+
+
+def _check_tuning_tables(tables):
+    # type: (List[TableInfo]) -> None
     if len(tables) < 7:
         raise ValueError("CombinedTuning DATA needs >= 7 tables, got {}".format(len(tables)))
 
+
+def _tuning_tables_python(data, stats):
+    # type: (bytes, Optional[DataParseStats]) -> TuningTables
+    """Build TuningTables from the row dicts of parse_binary_data().
+
+    stats, if given, must be fresh for this file: each table's time covers
+    reading its rows and converting them to TuningTables columns.
+    """
+    tables, schemas, table_data, version = parse_binary_data(data, stats)
+    _check_tuning_tables(tables)
+
     # Table assignments (per S4TK)
     meta_rows = table_data[0]       # PackedXmlDocument
     node_rows = table_data[1]       # PackedXmlNode
     attr_rows = table_data[2]       # PackedXmlAttributes
-    node_refs = table_data[3]       # DataOffsetObject[]
-    attr_refs = table_data[4]       # DataOffsetObject[]
-    string_refs = table_data[5]     # DataOffsetObject[]
-    # table_data[6] = character data (strings read via decoder)
+    # table_data[3], [4], [5]: DataOffsetObject[] to nodes, attributes, strings
+    # table_data[6] = character data (strings read via their offsets)
 
     if not meta_rows:
         raise ValueError("Empty metadata table in CombinedTuning DATA")
-
     meta = meta_rows[0]
+    starts = _table_starts(tables)
+
+    def row_indexes(refs, table_index):
+        # type: (List[dict], int) -> List[int]
+        start = starts[table_index]
+        row_size = tables[table_index].row_size
+        return [-1 if ref['mDataOffset'] == RELOFFSET_NULL
+                else (ref['startof_mDataOffset'] + ref['mDataOffset'] - start) // row_size
+                for ref in refs]
+
+    clock = time.perf_counter
+
+    def timed(i, started):
+        # type: (int, float) -> None
+        if stats is not None:
+            stats.add_table_seconds(i, clock() - started)
+
+    t = TuningTables()
+    started = clock()
+    t.top, t.first_element = row_indexes([meta['top_element'], meta['first_element']], 1)
+    timed(0, started)
+    started = clock()
+    t.node_text = [node['text'] for node in node_rows]
+    t.node_attrs = row_indexes([node['attrs'] for node in node_rows], 4)
+    t.node_children = row_indexes([node['children'] for node in node_rows], 3)
+    timed(1, started)
+    started = clock()
+    t.attr_name = [attr['name'] for attr in attr_rows]
+    t.attr_value = [attr['value'] for attr in attr_rows]
+    timed(2, started)
+    started = clock()
+    t.node_refs = row_indexes(table_data[3], 1)
+    timed(3, started)
+    started = clock()
+    t.attr_refs = row_indexes(table_data[4], 2)
+    timed(4, started)
+    started = clock()
+    t.strings = [_get_position(ref) for ref in table_data[5]]
+    timed(5, started)
+    return t
+
+
+def _numpy_dtype(fields, itemsize):
+    # type: (List[Tuple[str, int, int]], int) -> object
+    """Structured dtype for (name, data type, offset) fields, or None if a
+    field is not a single value or offset."""
+    names = []  # type: List[str]
+    formats = []  # type: List[str]
+    offsets = []  # type: List[int]
+    for name, data_type, offset in fields:
+        layout = _FIELD_FORMATS.get(data_type)
+        if layout is None or layout[1] not in (_VALUE, _OFFSET):
+            return None
+        names.append(name)
+        formats.append('<' + layout[0])
+        offsets.append(offset)
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                     'itemsize': itemsize})
+
+
+def _tuning_tables_numpy(data, stats):
+    # type: (bytes, Optional[DataParseStats]) -> Optional[TuningTables]
+    """Build TuningTables with np.frombuffer views of the table regions.
+
+    Returns None if a table's layout has no fixed-width NumPy equivalent;
+    stats may then hold partial counters and should be discarded. As with
+    _tuning_tables_python(), stats must be fresh for this file and each
+    table's time covers reading it and converting it to TuningTables columns.
+    """
+    decoder, tables, schemas, version, _ = _read_layout(data)
+    _check_tuning_tables(tables)
+    if stats is not None:
+        stats.files += 1
+    schema_for = _schema_resolver(schemas, stats)
+    starts = _table_starts(tables)
+    clock = time.perf_counter
+
+    def timed(i, rows, started):
+        # type: (int, int, float) -> None
+        if stats is not None:
+            stats.add_table(tables[i].name or "table{}".format(i), rows, clock() - started)
+
+    def records(i, names):
+        # type: (int, Tuple[str, ...]) -> object
+        """Structured view of table i's named columns, or None."""
+        tbl = tables[i]
+        if tbl.schema_offset == RELOFFSET_NULL:
+            # Raw values, each padded to its alignment as in _read_values()
+            layout = _FIELD_FORMATS.get(tbl.data_type)
+            if layout is None:
+                return None
+            columns = [(name, tbl.data_type, 0) for name in names]
+            stride = struct.calcsize('<' + layout[0])
+            stride += -stride & (DataType.alignment(tbl.data_type) - 1)
+        else:
+            if not tbl.row_count:
+                return np.zeros(0, dtype=[(name, '<i4') for name in names])
+            schema = schema_for(tbl)
+            by_name = {col.name: col for col in schema.columns}
+            if any(name not in by_name for name in names):
+                return None
+            columns = [(name, by_name[name].data_type, by_name[name].offset) for name in names]
+            stride = schema.schema_size
+        dtype = _numpy_dtype(columns, stride)
+        if dtype is None:
+            return None
+        return np.frombuffer(data, dtype=dtype, count=tbl.row_count, offset=starts[i])
+
+    def row_indexes(view, name, i, target):
+        # type: (object, str, int, int) -> List[int]
+        """Resolve an offset column of table i to row indexes in table target
+        (target -1: absolute positions)."""
+        rel = view[name].astype(np.int64)
+        positions = starts[i] + view.dtype.fields[name][1] + rel \
+            + np.arange(len(rel), dtype=np.int64) * view.dtype.itemsize
+        if target >= 0:
+            positions = (positions - starts[target]) // tables[target].row_size
+        return np.where(rel == RELOFFSET_NULL, -1, positions).tolist()
+
+    t = TuningTables()
+
+    def convert_meta(meta):
+        if not len(meta):
+            raise ValueError("Empty metadata table in CombinedTuning DATA")
+        t.first_element = row_indexes(meta, 'first_element', 0, 1)[0]
+        t.top = row_indexes(meta, 'top_element', 0, 1)[0]
+
+    def convert_nodes(nodes):
+        t.node_text = nodes['text'].tolist()
+        t.node_attrs = row_indexes(nodes, 'attrs', 1, 4)
+        t.node_children = row_indexes(nodes, 'children', 1, 3)
+
+    def convert_attrs(attrs):
+        t.attr_name = attrs['name'].tolist()
+        t.attr_value = attrs['value'].tolist()
+
+    def convert_node_refs(refs):
+        t.node_refs = row_indexes(refs, 'ref', 3, 1)
+
+    def convert_attr_refs(refs):
+        t.attr_refs = row_indexes(refs, 'ref', 4, 2)
+
+    def convert_string_refs(refs):
+        t.strings = row_indexes(refs, 'ref', 5, -1)
+
+    steps = [
+        (0, ('first_element', 'top_element'), convert_meta),
+        (1, ('text', 'attrs', 'children'), convert_nodes),
+        (2, ('name', 'value'), convert_attrs),
+        (3, ('ref',), convert_node_refs),
+        (4, ('ref',), convert_attr_refs),
+        (5, ('ref',), convert_string_refs),
+    ]
+    for i, names, convert in steps:
+        started = clock()
+        view = records(i, names)
+        if view is None:
+            return None
+        convert(view)
+        timed(i, len(view), started)
+    # The character data is only read when read_tuning_tables() decodes it
+    timed(6, tables[6].row_count, clock())
+    return t
+
+
+def _decode_strings(data, t):
+    # type: (bytes, TuningTables) -> List[str]
+    """Decode every string of the character data once, interning names."""
+    names = set(t.node_text[max(t.first_element, 0):])
+    names.update(t.attr_name)
+    intern = sys.intern
+    find = data.index
+    texts = []  # type: List[str]
+    append = texts.append
+    for row, pos in enumerate(t.strings):
+        if pos < 0:
+            # Null string reference
+            append('')
+            continue
+        text = data[pos:find(b'\x00', pos)].decode('utf-8')
+        append(intern(text) if row in names else text)
+    return texts
+
+
+def read_tuning_tables(data, backend="auto", stats=None):
+    # type: (bytes, str, Optional[DataParseStats]) -> TuningTables
+    """Read the node, attribute and reference tables of binary CombinedTuning.
 
-    # Compute table data start offsets (aligned to 16 bytes)
-    table_offsets = []  # type: List[int]
-    for tbl in tables:
-        pos = tbl.row_offset_pos + tbl.row_offset
-        pad = -pos & 15
-        table_offsets.append(pos + pad)
+    Args:
+        data: Raw decompressed CombinedTuning resource bytes (starts with "DATA").
+        backend: "python", "numpy", or "auto" (NumPy when it is installed).
+            The NumPy reader falls back to the Python one for tables whose
+            columns have no fixed-width NumPy equivalent.
+        stats: Optional DataParseStats to collect parsing counters into.
+            Each table's time covers reading it and converting it to
+            TuningTables columns (decoding the strings, for the character
+            data), whichever backend does the work.
+    """
+    if backend == "auto":
+        backend = "numpy" if np is not None else "python"
+    # Counters for this file, merged into stats once the tables are read
+    file_stats = DataParseStats() if stats is not None else None
+    tuning_tables = None  # type: Optional[TuningTables]
+    if backend == "numpy":
+        if np is None:
+            raise ImportError("NumPy is required for the numpy tuning backend")
+        tuning_tables = _tuning_tables_numpy(data, file_stats)
+        if tuning_tables is None and file_stats is not None:
+            # Drop what the NumPy reader counted before giving up
+            file_stats = DataParseStats()
+    elif backend != "python":
+        raise ValueError("Unknown tuning backend: {!r}".format(backend))
+    if tuning_tables is None:
+        tuning_tables = _tuning_tables_python(data, file_stats)
+
+    started = time.perf_counter()
+    tuning_tables.texts = _decode_strings(data, tuning_tables)
+    if stats is not None:
+        file_stats.add_table_seconds(6, time.perf_counter() - started)
+        file_stats.string_pool_size += len(tuning_tables.texts)
+        stats.merge(file_stats)
+    return tuning_tables
+
+
+def _escape_xml(s):
+    # type: (str) -> str
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+# Number of output pieces gathered before each write to the stream
+_EMIT_BATCH = 4096
+
+
+def _emit_xml(t, write, stats=None):
+    # type: (TuningTables, Callable[[str], object], Optional[DataParseStats]) -> None
+    """Write the XML for TuningTables in document order.
+
+    The tree is walked with an explicit stack of open elements, so nesting
+    depth is not limited by the recursion limit, and output is written in
+    batches as it is produced.
+    """
+    node_text = t.node_text
+    node_attrs = t.node_attrs
+    node_children = t.node_children
+    attr_name = t.attr_name
+    attr_value = t.attr_value
+    node_refs = t.node_refs
+    attr_refs = t.attr_refs
+    texts = t.texts
+    escaped = [_escape_xml(text) for text in texts]
+    first_element = t.first_element
+    ref_count = len(node_refs)
+    attr_ref_count = len(attr_refs)
+    nodes = attrs = 0
+
+    parts = []  # type: List[str]
+    append = parts.append
+    # [next node_refs index, tag] of each element whose children are being written
+    stack = []  # type: List[list]
+    node_idx = t.top
+
+    while True:
+        if node_idx is not None:
+            # Open a node
+            nodes += 1
+            text_row = node_text[node_idx]
+            attrs_idx = node_attrs[node_idx]
+            children_idx = node_children[node_idx]
+
+            if attrs_idx < 0 and children_idx < 0:
+                if node_idx >= first_element:
+                    # Empty element
+                    append("<{} />".format(escaped[text_row]))
+                else:
+                    # Text node
+                    append(escaped[text_row])
+            else:
+                text = texts[text_row]
+                append("<" + text)
+                idx = attrs_idx
+                while 0 <= idx < attr_ref_count:
+                    attr_row = attr_refs[idx]
+                    if attr_row < 0:
+                        break
+                    append(' {}="{}"'.format(texts[attr_name[attr_row]],
+                                             escaped[attr_value[attr_row]]))
+                    idx += 1
+                attrs += idx - attrs_idx
+                if children_idx >= 0:
+                    append(">")
+                    stack.append([children_idx, text])
+                else:
+                    append(" />")
+            if len(parts) >= _EMIT_BATCH:
+                write("".join(parts))
+                del parts[:]
+
+        if not stack:
+            break
+        # Move to the next child of the innermost open element
+        frame = stack[-1]
+        idx = frame[0]
+        if idx < ref_count and node_refs[idx] >= 0:
+            frame[0] = idx + 1
+            node_idx = node_refs[idx]
+        else:
+            stack.pop()
+            append("</{}>".format(frame[1]))
+            node_idx = None
 
-    first_element_pos = _get_position(meta['first_element'])
+    write("".join(parts))
+    if stats is not None:
+        stats.string_pool_hits += nodes + 2 * attrs
 
-    def row_index_at(position, table_index):
-        # type: (int, int) -> int
-        table_start = table_offsets[table_index]
-        return (position - table_start) // tables[table_index].row_size
 
-    def get_text(text_row):
-        # type: (int) -> str
-        text_ref = string_refs[text_row]
-        pos = _get_position(text_ref)
-        saved = decoder.tell()
-        decoder.seek(pos)
-        s = decoder.string()
-        decoder.seek(saved)
-        return s
+def decode_combined_tuning_to(data, fp, stats=None, backend="auto"):
+    # type: (bytes, TextIO, Optional[DataParseStats], str) -> None
+    """Decode binary DATA combined tuning and write the XML to a text stream.
 
-    def _escape_xml(s):
-        # type: (str) -> str
-        return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
-
-    def read_attributes(first_attr_pos):
-        # type: (int) -> List[Tuple[str, str]]
-        attrs = []  # type: List[Tuple[str, str]]
-        idx = row_index_at(first_attr_pos, 4)
-        while idx < len(attr_refs):
-            ref = attr_refs[idx]
-            if _is_null(ref):
-                break
-            attr_pos = _get_position(ref)
-            attr_row_idx = row_index_at(attr_pos, 2)
-            attr_row = attr_rows[attr_row_idx]
-            name = get_text(attr_row['name'])
-            value = get_text(attr_row['value'])
-            attrs.append((name, value))
-            idx += 1
-        return attrs
-
-    def read_children(first_child_pos):
-        # type: (int) -> List[str]
-        children = []  # type: List[str]
-        idx = row_index_at(first_child_pos, 3)
-        while idx < len(node_refs):
-            ref = node_refs[idx]
-            if _is_null(ref):
-                break
-            child_pos = _get_position(ref)
-            children.append(read_node(child_pos))
-            idx += 1
-        return children
-
-    def read_node(position):
-        # type: (int) -> str
-        node_idx = row_index_at(position, 1)
-        node = node_rows[node_idx]
-        text = get_text(node['text'])
+    The document is written in batches while the tree is walked, so large
+    resources can be spilled to an open file without building the whole
+    string in memory.
 
-        has_attrs = not _is_null(node['attrs'])
-        has_children = not _is_null(node['children'])
+    Args:
+        data: Raw decompressed CombinedTuning resource bytes (starts with "DATA").
+        fp: Text stream to write to, e.g. io.StringIO or a file opened with
+            encoding="utf-8".
+        stats: Optional DataParseStats to collect parsing counters into.
+        backend: Table reader, see read_tuning_tables().
+    """
+    t = read_tuning_tables(data, backend, stats)
+    fp.write('<?xml version="1.0" encoding="utf-8"?>\n')
+    _emit_xml(t, fp.write, stats)
 
-        if not has_attrs and not has_children:
-            if position >= first_element_pos:
-                # Empty element
-                return "<{} />".format(_escape_xml(text))
-            else:
-                # Text node
-                return _escape_xml(text)
 
-        parts = []  # type: List[str]
-        parts.append("<{}".format(text))
+def decode_combined_tuning(data, stats=None, backend="auto"):
+    # type: (bytes, Optional[DataParseStats], str) -> str
+    """Decode binary DATA combined tuning to XML string.
 
-        if has_attrs:
-            attrs = read_attributes(_get_position(node['attrs']))
-            for name, value in attrs:
-                parts.append(' {}="{}"'.format(name, _escape_xml(value)))
+    Args:
+        data: Raw decompressed CombinedTuning resource bytes (starts with "DATA").
+        stats: Optional DataParseStats to collect parsing counters into.
+        backend: Table reader, see read_tuning_tables().
 
-        if has_children:
-            parts.append(">")
-            children = read_children(_get_position(node['children']))
-            parts.extend(children)
-            parts.append("</{}>".format(text))
-        else:
-            parts.append(" />")
+    Returns:
+        XML string equivalent to what the XML-format CombinedTuning would contain.
+    """
+    fp = io.StringIO()
+    decode_combined_tuning_to(data, fp, stats, backend)
+    return fp.getvalue()
+
+
+def _parsed_text(text):
+    # type: (str) -> str
+    """Character data as an XML parser reports it: line ends become LF."""
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _parsed_attribute(value):
+    # type: (str) -> str
+    """An attribute value as an XML parser reports it: tabs and line ends become spaces."""
+    if "\r" in value:
+        value = value.replace("\r\n", "\n")
+    if "\t" in value or "\n" in value or "\r" in value:
+        value = value.replace("\t", " ").replace("\n", " ").replace("\r", " ")
+    return value
 
-        return "".join(parts)
 
-    top_pos = _get_position(meta['top_element'])
-    xml_content = read_node(top_pos)
-    return '<?xml version="1.0" encoding="utf-8"?>\n' + xml_content
+def build_combined_tuning_tree(data, stats=None, backend="auto"):
+    # type: (bytes, Optional[DataParseStats], str) -> ET.Element
+    """Decode binary DATA combined tuning straight into an ElementTree.
+
+    Elements are fed to an ET.TreeBuilder while the tables are walked, so
+    no XML text is produced or parsed. Text and attribute values get the
+    line-end and whitespace normalization an XML parser applies, so the tree
+    matches ET.fromstring(decode_combined_tuning(data)).
+
+    Args:
+        data: Raw decompressed CombinedTuning resource bytes (starts with "DATA").
+        stats: Optional DataParseStats to collect parsing counters into.
+        backend: Table reader, see read_tuning_tables().
+
+    Returns:
+        The root element.
+    """
+    t = read_tuning_tables(data, backend, stats)
+    node_text = t.node_text
+    node_attrs = t.node_attrs
+    node_children = t.node_children
+    attr_name = t.attr_name
+    attr_value = t.attr_value
+    node_refs = t.node_refs
+    attr_refs = t.attr_refs
+    texts = t.texts
+    # Tags and attribute names are used as decoded
+    data_texts = [_parsed_text(text) for text in texts]
+    attr_texts = [_parsed_attribute(text) for text in texts]
+    first_element = t.first_element
+    ref_count = len(node_refs)
+    attr_ref_count = len(attr_refs)
+    nodes = attr_count = 0
+
+    builder = ET.TreeBuilder()
+    start = builder.start
+    end = builder.end
+    # [next node_refs index, tag] of each element whose children are being built
+    stack = []  # type: List[list]
+    node_idx = t.top
+
+    while True:
+        if node_idx is not None:
+            nodes += 1
+            text = texts[node_text[node_idx]]
+            attrs_idx = node_attrs[node_idx]
+            children_idx = node_children[node_idx]
+
+            if attrs_idx < 0 and children_idx < 0 and node_idx < first_element:
+                # Text node
+                builder.data(data_texts[node_text[node_idx]])
+            else:
+                attrs = {}  # type: Dict[str, str]
+                idx = attrs_idx
+                while 0 <= idx < attr_ref_count:
+                    attr_row = attr_refs[idx]
+                    if attr_row < 0:
+                        break
+                    attrs[texts[attr_name[attr_row]]] = attr_texts[attr_value[attr_row]]
+                    idx += 1
+                attr_count += idx - attrs_idx
+                start(text, attrs)
+                if children_idx >= 0:
+                    stack.append([children_idx, text])
+                else:
+                    end(text)
+
+        if not stack:
+            break
+        # Move to the next child of the innermost open element
+        frame = stack[-1]
+        idx = frame[0]
+        if idx < ref_count and node_refs[idx] >= 0:
+            frame[0] = idx + 1
+            node_idx = node_refs[idx]
+        else:
+            stack.pop()
+            end(frame[1])
+            node_idx = None
+
+    if stats is not None:
+        stats.string_pool_hits += nodes + 2 * attr_count
+    return builder.close()
 
 
 def is_binary_combined_tuning(data):
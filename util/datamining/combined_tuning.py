@@ -13,10 +13,14 @@ Each tuning entry is an <I> element with attributes:
 
 This module provides iteration over those elements and helpers to read
 common child node patterns, automatically resolving shared references.
+Lookups by class, module, tuning type, name and instance ID go through hash
+indexes that CombinedTuningParser builds on first use.
+CombinedTuningParser.iterparse() streams <I> elements from a file instead,
+keeping only the <g> table and the element being read in memory.
 """
 
 import xml.etree.ElementTree as ET
-from typing import Dict, Iterator, List, Optional
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Union
 
 
 class _RefTable:
@@ -31,11 +35,16 @@ class _RefTable:
         # type: (ET.Element) -> _RefTable
         """Build the reference table from a <g> element."""
         table = cls()
+        table.update(g_element)
+        return table
+
+    def update(self, g_element):
+        # type: (ET.Element) -> None
+        """Add the entries of a <g> element."""
         for child in g_element:
             x = child.get("x")
             if x is not None:
-                table._table[x] = child
-        return table
+                self._table[x] = child
 
     def resolve(self, ref_element):
         # type: (ET.Element) -> Optional[ET.Element]
@@ -58,12 +67,17 @@ class TuningElement:
     """Wrapper around an <I> element providing field accessor helpers.
 
     Automatically resolves <r x="..."> references through the shared ref table.
+    The first accessor call maps each field name (n attribute) to its first
+    child, already resolved, so later lookups are a single dict probe.
     """
 
+    __slots__ = ("_el", "_refs", "_fields")
+
     def __init__(self, element, ref_table=None):
         # type: (ET.Element, Optional[_RefTable]) -> None
         self._el = element
         self._refs = ref_table or _NO_REFS
+        self._fields = None  # type: Optional[Dict[str, ET.Element]]
 
     # -- Top-level attributes --
 
@@ -116,6 +130,29 @@ class TuningElement:
             return resolved.text.strip()
         return None
 
+    def _field_map(self):
+        # type: () -> Dict[str, ET.Element]
+        """Field name -> first child with that name, with references resolved."""
+        fields = self._fields
+        if fields is None:
+            fields = {}
+            for child in self._el:
+                n = child.get("n")
+                if n is not None and n not in fields:
+                    fields[n] = self._resolve_element(child)
+            self._fields = fields
+        return fields
+
+    def _list_items(self, list_el):
+        # type: (ET.Element) -> List[str]
+        """Text values of the items of an <L>, resolving references."""
+        result = []
+        for item in list_el:
+            text = self._get_text(item)
+            if text:
+                result.append(text)
+        return result
+
     # -- Child node accessors --
 
     def get_value(self, field_name):
@@ -125,11 +162,21 @@ class TuningElement:
         Looks for <T n="field_name">, <E n="field_name">, or <r n="field_name">
         and returns the text content (resolving <r> through the ref table).
         """
-        for child in self._el:
-            if child.get("n") == field_name:
-                return self._get_text(child)
+        child = self._field_map().get(field_name)
+        if child is not None and child.text:
+            return child.text.strip()
         return None
 
+    def get_values(self, field_names):
+        # type: (Iterable[str]) -> Dict[str, Optional[str]]
+        """Get several fields at once, as {field_name: get_value(field_name)}."""
+        fields = self._field_map()
+        values = {}  # type: Dict[str, Optional[str]]
+        for name in field_names:
+            child = fields.get(name)
+            values[name] = child.text.strip() if child is not None and child.text else None
+        return values
+
     def get_enum(self, field_name):
         # type: (str) -> Optional[str]
         """Get an enum value (same as get_value, but named for clarity)."""
@@ -150,33 +197,24 @@ class TuningElement:
         Returns text values from children inside the <L>, resolving any <r>
         references through the shared table.
         """
+        child = self._field_map().get(field_name)
+        if child is None:
+            return []
+        # The list itself might be a reference; the field map holds it resolved
+        if child.tag == "L":
+            return self._list_items(child)
+        # Rare: the first child with this name is not a list, a later one may be
         for child in self._el:
-            if child.tag == "L" and child.get("n") == field_name:
-                result = []
-                for item in child:
-                    text = self._get_text(item)
-                    if text:
-                        result.append(text)
-                return result
-            # The list itself might be a reference
-            if child.tag == "r" and child.get("n") == field_name:
-                resolved = self._refs.resolve(child)
-                if resolved is not None and resolved.tag == "L":
-                    result = []
-                    for item in resolved:
-                        text = self._get_text(item)
-                        if text:
-                            result.append(text)
-                    return result
+            if child.get("n") == field_name:
+                resolved = self._resolve_element(child)
+                if resolved.tag == "L":
+                    return self._list_items(resolved)
         return []
 
     def get_child_element(self, field_name):
         # type: (str) -> Optional[ET.Element]
         """Get a direct child element by its n attribute, resolving references."""
-        for child in self._el:
-            if child.get("n") == field_name:
-                return self._resolve_element(child)
-        return None
+        return self._field_map().get(field_name)
 
     @property
     def raw(self):
@@ -202,22 +240,44 @@ class TuningElement:
         )
 
 
+def _instance_key(instance_id):
+    # type: (Union[int, str]) -> Optional[int]
+    """Normalize an instance ID given as int, decimal or 0x-hex string."""
+    if isinstance(instance_id, int):
+        return instance_id
+    text = instance_id.strip()
+    try:
+        if text[:2].lower() == "0x":
+            return int(text, 16)
+        return int(text)
+    except ValueError:
+        return None
+
+
 class CombinedTuningParser:
     """Parses a CombinedTuning XML resource into iterable TuningElements.
 
     Supports two formats:
     - Simple: <M> root with <I> children directly
     - Full game: <combined> root with <g> shared refs + <R> groups containing <I>
+
+    The by_* and find_by_* lookups use one dict per TuningElement attribute,
+    built the first time that attribute is queried and reused afterwards.
     """
 
     def __init__(self, xml_data):
-        # type: (str) -> None
+        # type: (Union[str, ET.Element]) -> None
         """Parse CombinedTuning XML.
 
         Args:
-            xml_data: The raw XML string from a CombinedTuning resource.
+            xml_data: The raw XML string from a CombinedTuning resource, or
+                its already parsed root element (e.g. from
+                binary_tuning.build_combined_tuning_tree).
         """
-        self._root = ET.fromstring(xml_data)
+        if isinstance(xml_data, ET.Element):
+            self._root = xml_data
+        else:
+            self._root = ET.fromstring(xml_data)
 
         # Build reference table from <g> element if present
         g_element = self._root.find("g")
@@ -232,6 +292,69 @@ class CombinedTuningParser:
             for el in self._root.iter("I")
             if el.get("c") is not None
         ]
+        # TuningElement attribute -> {value: elements in document order}
+        self._indexes = {}  # type: Dict[str, Dict[object, List[TuningElement]]]
+
+    @staticmethod
+    def iterparse(source):
+        # type: (Union[str, IO[bytes]]) -> Iterator[TuningElement]
+        """Stream the <I> elements of a CombinedTuning XML file.
+
+        Memory stays roughly constant with document size: the <g> reference
+        table is kept, and every other subtree is detached from the tree
+        once it has been read. A yielded element's own subtree stays intact
+        for as long as the caller holds it, and the accessor API works as
+        usual. References resolve against the <g> entries read so far, so
+        <g> has to come before the <I> elements (as it does in game files).
+
+        Args:
+            source: A file path, or a file object opened in binary mode.
+
+        Yields:
+            TuningElement for each <I> element with a c= attribute, in
+            document order.
+        """
+        refs = _RefTable()
+        stack = []  # type: List[ET.Element]
+        # Open <I c=...> and top-level <g> elements, whose subtrees are kept
+        holding = 0
+
+        for event, el in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if (el.tag == "I" and el.get("c") is not None) or \
+                        (el.tag == "g" and len(stack) == 1):
+                    holding += 1
+                stack.append(el)
+                continue
+
+            stack.pop()
+            is_tuning = el.tag == "I" and el.get("c") is not None
+            if is_tuning or (el.tag == "g" and len(stack) == 1):
+                holding -= 1
+                if not is_tuning:
+                    refs.update(el)
+                    continue
+            # Earlier siblings are already detached, so this is a short search
+            if not holding and stack:
+                stack[-1].remove(el)
+            if is_tuning:
+                yield TuningElement(el, refs)
+
+    def _index(self, attribute):
+        # type: (str) -> Dict[object, List[TuningElement]]
+        """The index on a TuningElement attribute, building it on first use."""
+        index = self._indexes.get(attribute)
+        if index is None:
+            index = {}
+            for el in self._elements:
+                key = getattr(el, attribute)
+                bucket = index.get(key)
+                if bucket is None:
+                    index[key] = [el]
+                else:
+                    bucket.append(el)
+            self._indexes[attribute] = index
+        return index
 
     @property
     def ref_count(self):
@@ -254,30 +377,37 @@ class CombinedTuningParser:
         Args:
             cls_name: e.g. 'Skill', 'Career', 'Trait'
         """
-        return [el for el in self._elements if el.cls == cls_name]
+        return list(self._index("cls").get(cls_name, ()))
 
     def by_module(self, module_path):
         # type: (str) -> List[TuningElement]
         """Filter elements by module path (m attribute)."""
-        return [el for el in self._elements if el.module == module_path]
+        return list(self._index("module").get(module_path, ()))
 
     def by_tuning_type(self, tuning_type):
         # type: (str) -> List[TuningElement]
         """Filter elements by tuning type (i attribute)."""
-        return [el for el in self._elements if el.tuning_type == tuning_type]
+        return list(self._index("tuning_type").get(tuning_type, ()))
 
     def find_by_name(self, name):
         # type: (str) -> Optional[TuningElement]
-        """Find a single element by instance name (n attribute)."""
-        for el in self._elements:
-            if el.name == name:
-                return el
-        return None
+        """Find a single element by instance name (n attribute).
+
+        If several elements share the name, the first in document order.
+        """
+        matches = self._index("name").get(name)
+        return matches[0] if matches else None
 
     def find_by_instance_id(self, instance_id):
-        # type: (str) -> Optional[TuningElement]
-        """Find a single element by tuning instance ID (s attribute)."""
-        for el in self._elements:
-            if el.instance_id == instance_id:
-                return el
-        return None
+        # type: (Union[int, str]) -> Optional[TuningElement]
+        """Find a single element by tuning instance ID (s attribute).
+
+        Args:
+            instance_id: The ID as an int, or a decimal or 0x-prefixed hex
+                string ("16700", "0x413C"). Unparseable strings match nothing.
+        """
+        key = _instance_key(instance_id)
+        if key is None:
+            return None
+        matches = self._index("instance_id").get(key)
+        return matches[0] if matches else None
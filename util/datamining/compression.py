@@ -0,0 +1,194 @@
+"""
+Decompressor registry keyed by DBPF compression type.
+
+Every index entry records how its data is stored:
+  - 0x0000: uncompressed
+  - 0x5A42: zlib
+  - 0xFFFF: RefPack
+  - 0xFFFE: streamable RefPack
+  - 0xFFE0: deleted (the entry hides a resource from an earlier package)
+
+CodecRegistry picks the decompressor for an entry in a single dictionary
+lookup and counts calls, bytes and failures per codec. The old heuristic
+chain (RefPack detection, then zlib, then zlib after a 4-byte header) is
+only used when a registry is created with fallback=True.
+"""
+
+import zlib
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from util.datamining.refpack import decompress as refpack_decompress, is_refpack
+
+COMPRESSION_NONE = 0x0000
+COMPRESSION_ZLIB = 0x5A42
+COMPRESSION_REFPACK = 0xFFFF
+COMPRESSION_STREAMABLE = 0xFFFE
+COMPRESSION_DELETED = 0xFFE0
+
+BytesLike = Union[bytes, memoryview]
+Decompressor = Callable[[BytesLike], BytesLike]
+
+
+def _decompress_raw(data):
+    # type: (BytesLike) -> BytesLike
+    return data
+
+
+def _decompress_zlib(data):
+    # type: (BytesLike) -> bytes
+    return zlib.decompress(data)
+
+
+def _decompress_deleted(data):
+    # type: (BytesLike) -> bytes
+    return b""
+
+
+def _decompress_heuristic(data):
+    # type: (BytesLike) -> bytes
+    """Guess the codec from the data itself (the pre-registry behaviour)."""
+    if is_refpack(data):
+        return refpack_decompress(data)
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        # Some entries have a 4-byte compression header to skip
+        return zlib.decompress(data[4:])
+
+
+# Exceptions a decompressor raises on corrupt input
+DECOMPRESSION_ERRORS = (zlib.error, ValueError, IndexError)
+
+
+def decompression_error(key, name, cause):
+    # type: (object, str, Exception) -> ValueError
+    """The ValueError reported when a codec rejects a resource."""
+    return ValueError("Failed to decompress resource {} ({}): {}".format(key, name, cause))
+
+
+class CodecStats:
+    """Usage counters for one codec."""
+
+    __slots__ = ("calls", "bytes_in", "bytes_out", "errors")
+
+    def __init__(self):
+        # type: () -> None
+        self.calls = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+
+    def as_dict(self):
+        # type: () -> Dict[str, int]
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class CodecRegistry:
+    """Maps DBPF compression types to decompressors.
+
+    Args:
+        fallback: Use the heuristic chain for unknown compression types and
+            for data the registered codec rejects.
+    """
+
+    def __init__(self, fallback=False):
+        # type: (bool) -> None
+        self.fallback = fallback
+        self._codecs = {}  # type: Dict[int, Tuple[str, Decompressor]]
+        self._stats = {}  # type: Dict[str, CodecStats]
+
+        self.register(COMPRESSION_NONE, "raw", _decompress_raw)
+        self.register(COMPRESSION_ZLIB, "zlib", _decompress_zlib)
+        self.register(COMPRESSION_REFPACK, "refpack", refpack_decompress)
+        self.register(COMPRESSION_STREAMABLE, "refpack-streamable", refpack_decompress)
+        self.register(COMPRESSION_DELETED, "deleted", _decompress_deleted)
+
+    def register(self, compression_type, name, decompressor):
+        # type: (int, str, Decompressor) -> None
+        """Register (or replace) the decompressor for a compression type."""
+        self._codecs[compression_type] = (name, decompressor)
+        self._stats.setdefault(name, CodecStats())
+
+    def codec(self, compression_type):
+        # type: (int) -> Optional[str]
+        """Name of the codec registered for a compression type, or None."""
+        entry = self._codecs.get(compression_type)
+        return entry[0] if entry is not None else None
+
+    def resolve(self, compression_type):
+        # type: (int) -> Optional[Tuple[str, Decompressor]]
+        """(name, decompressor) registered for a compression type, or None.
+
+        For callers that run decompressors elsewhere (e.g. worker threads)
+        and report the outcome back through record().
+        """
+        return self._codecs.get(compression_type)
+
+    def record(self, name, bytes_in, bytes_out=0, error=False):
+        # type: (str, int, int, bool) -> None
+        """Add one decompression to a codec's counters."""
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = CodecStats()
+        stats.calls += 1
+        stats.bytes_in += bytes_in
+        stats.bytes_out += bytes_out
+        if error:
+            stats.errors += 1
+
+    def decompress(self, compression_type, data, key=None):
+        # type: (int, BytesLike, object) -> BytesLike
+        """Decompress data stored with the given compression type.
+
+        Args:
+            compression_type: The entry's DBPF compression type.
+            data: The stored bytes.
+            key: Resource key, used only in error messages.
+
+        Raises:
+            ValueError: If the type is unknown or the data is corrupt (and
+                the heuristic fallback is disabled or fails too).
+        """
+        codec = self._codecs.get(compression_type)
+        if codec is None:
+            if self.fallback:
+                return self._run("heuristic", _decompress_heuristic, data, key)
+            raise ValueError("Unsupported compression type 0x{:04X} for resource {}".format(
+                compression_type, key))
+
+        name, decompressor = codec
+        try:
+            return self._run(name, decompressor, data, key)
+        except ValueError:
+            if not self.fallback:
+                raise
+            return self.decompress_fallback(data, key)
+
+    def decompress_fallback(self, data, key=None):
+        # type: (BytesLike, object) -> BytesLike
+        """Decompress with the heuristic chain, regardless of the fallback setting."""
+        return self._run("heuristic", _decompress_heuristic, data, key)
+
+    def _run(self, name, decompressor, data, key):
+        # type: (str, Decompressor, BytesLike, object) -> BytesLike
+        try:
+            result = decompressor(data)
+        except DECOMPRESSION_ERRORS as e:
+            self.record(name, len(data), error=True)
+            raise decompression_error(key, name, e)
+        self.record(name, len(data), len(result))
+        return result
+
+    def stats(self):
+        # type: () -> Dict[str, Dict[str, int]]
+        """Per-codec counters for every codec that has been used."""
+        return {name: stats.as_dict() for name, stats in self._stats.items() if stats.calls}
+
+    def reset_stats(self):
+        # type: () -> None
+        for stats in self._stats.values():
+            stats.__init__()
+
+
+# Registry shared by readers that are not given their own
+DEFAULT_CODECS = CodecRegistry()
@@ -0,0 +1,157 @@
+"""
+Persistent on-disk cache of parsed DBPF package indexes.
+
+Game packages only change on patch day, but every datamine run would
+otherwise re-parse the index of every package. The cache stores each
+package's IndexTable as raw column arrays in a small binary file, keyed by
+the package's absolute path, size, modification time and its 96 header
+bytes. Any change to those invalidates the entry, and the reader falls back
+to parsing the index and refreshing the cache.
+
+Cache file layout (little-endian):
+  - 4 bytes:  magic "S4IX"
+  - 2 bytes:  format version (uint16)
+  - 8 bytes:  package size (uint64)
+  - 8 bytes:  package mtime in nanoseconds (uint64)
+  - 96 bytes: package header
+  - 4 bytes:  index flags (uint32)
+  - 4 bytes:  entry count (uint32)
+  - 2 bytes:  UTF-8 path length (uint16), followed by the absolute path
+  - IndexTable.to_bytes() column data
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from util.datamining.package_index import IndexTable
+
+CACHE_MAGIC = b"S4IX"
+CACHE_VERSION = 1
+
+_PREFIX = struct.Struct("<4sHQQ96sIIH")
+
+# The path length is stored as a uint16
+_MAX_PATH_BYTES = 0xFFFF
+
+
+def default_cache_dir():
+    # type: () -> str
+    """Per-user cache directory for package indexes."""
+    base = (os.environ.get("XDG_CACHE_HOME")
+            or os.environ.get("LOCALAPPDATA")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "sims4-workspace", "index")
+
+
+class IndexCache:
+    """Loads and stores parsed package indexes under a cache directory.
+
+    Tracks hits, misses, and bytes read/written so callers can report how
+    effective the cache was.
+    """
+
+    def __init__(self, cache_dir):
+        # type: (str) -> None
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def cache_path(self, package_path):
+        # type: (str) -> str
+        """Cache file used for a package (one file per absolute path)."""
+        abs_path = os.path.abspath(package_path)
+        digest = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".idx")
+
+    def load(self, package_path, header):
+        # type: (str, bytes) -> Optional[Tuple[int, IndexTable]]
+        """Return (flags, table) for a package, or None on a miss.
+
+        Args:
+            package_path: Path to the .package file.
+            header: The package's 96 header bytes as just read.
+        """
+        result = self._load(package_path, header)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def _load(self, package_path, header):
+        # type: (str, bytes) -> Optional[Tuple[int, IndexTable]]
+        abs_path = os.path.abspath(package_path)
+        try:
+            st = os.stat(abs_path)
+            with open(self.cache_path(abs_path), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        try:
+            magic, version, size, mtime_ns, cached_header, flags, count, path_len = \
+                _PREFIX.unpack_from(data)
+            pos = _PREFIX.size
+            cached_path = data[pos:pos + path_len].decode("utf-8")
+            pos += path_len
+            if (magic != CACHE_MAGIC or version != CACHE_VERSION
+                    or cached_path != abs_path
+                    or size != st.st_size
+                    or mtime_ns != st.st_mtime_ns
+                    or cached_header != bytes(header)):
+                return None
+            table = IndexTable.from_bytes(data[pos:], count)
+        except (struct.error, ValueError, UnicodeDecodeError):
+            # Truncated or corrupt cache file: treat as a miss and rewrite it
+            return None
+
+        self.bytes_read += len(data)
+        return flags, table
+
+    def store(self, package_path, header, flags, table):
+        # type: (str, bytes, int, IndexTable) -> None
+        """Write a package's parsed index to the cache.
+
+        Failures (read-only or missing cache directory) are ignored, and
+        packages whose UTF-8 path does not fit the header are not cached:
+        the cache is an optimization, never a requirement.
+        """
+        abs_path = os.path.abspath(package_path)
+        encoded_path = abs_path.encode("utf-8")
+        if len(encoded_path) > _MAX_PATH_BYTES:
+            return
+        try:
+            st = os.stat(abs_path)
+            data = _PREFIX.pack(
+                CACHE_MAGIC, CACHE_VERSION, st.st_size, st.st_mtime_ns,
+                bytes(header), flags, len(table), len(encoded_path),
+            ) + encoded_path + table.to_bytes()
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.cache_path(abs_path))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            return
+        self.bytes_written += len(data)
+
+    def stats(self):
+        # type: () -> Dict[str, int]
+        """Return hit/miss counters and bytes transferred."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
@@ -5,6 +5,7 @@ Consolidates the package discovery logic used by extraction scripts
 into a single reusable module.
 """
 
+import fnmatch
 import glob
 import os
 from typing import List, Tuple
@@ -144,3 +145,39 @@ def discover_all_packages(game_folder):
                 rel_path = os.path.relpath(abs_path, game_folder)
                 packages.append((abs_path, rel_path))
     return packages
+
+
+def is_delta_package(rel_path):
+    # type: (str) -> bool
+    """True for delta builds: *DeltaBuild*.package files and anything under Delta/."""
+    parts = rel_path.replace("\\", "/").split("/")
+    return parts[0] == "Delta" or "DeltaBuild" in parts[-1]
+
+
+def _pack_rank(rel_path):
+    # type: (str) -> int
+    """0 for the base game (Data/), then one rank per _PACK_PATTERNS entry."""
+    parts = rel_path.replace("\\", "/").split("/")
+    if parts[0] == "Delta" and len(parts) > 2:
+        parts = parts[1:]
+    if parts[0] == "Data":
+        return 0
+    for rank, pattern in enumerate(_PACK_PATTERNS, 1):
+        if fnmatch.fnmatchcase(parts[0], pattern):
+            return rank
+    # Anything else goes after the packs
+    return len(_PACK_PATTERNS) + 1
+
+
+def order_full_before_delta(packages):
+    # type: (List[Tuple[str, str]]) -> List[Tuple[str, str]]
+    """Stable-sort (absolute_path, relative_path) tuples into game precedence.
+
+    discover_all_packages() walks the tree alphabetically, which puts
+    ClientDeltaBuild*.package before ClientFullBuild*.package and FP* packs
+    before GP* and SP*. This restores the order the discover_* helpers use,
+    where later packages override earlier ones: full builds before deltas,
+    and within each the base game, then packs in _PACK_PATTERNS order
+    (EP, GP, SP, FP).
+    """
+    return sorted(packages, key=lambda pkg: (is_delta_package(pkg[1]), _pack_rank(pkg[1])))
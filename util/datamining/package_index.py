@@ -0,0 +1,512 @@
+"""
+Bulk parser for the DBPF v2.0 resource index.
+
+The index starts with a uint32 flags word. Bits 0-3 mark the type, group,
+instance-high and instance-low fields as constant across all entries; each
+constant value is stored once right after the flags (in that order) and is
+left out of every entry record. The remaining per-entry fields are:
+
+  type, group, instance_hi, instance_lo   uint32 each, unless constant
+  offset                                  uint32
+  file_size                               uint32 (high bit: extended flag)
+  mem_size                                uint32
+  compressed                              uint16 (compression type)
+  committed                               uint16 (unused)
+
+Instead of reading and unpacking field by field, the whole record block is
+read in one call and decoded with a precompiled ``struct.Struct`` layout
+chosen from the flags. An optional NumPy backend decodes the block as a
+structured array, which is faster still for very large client packages.
+
+Decoded indexes are stored in an IndexTable: one compact ``array.array`` per
+field instead of a Python object per entry. IndexEntry/ResourceKey objects
+are only created when an entry is accessed.
+"""
+
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from util.datamining.resource_types import TUNING_TYPE_ID
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+
+# Bits of the index flags word marking fields as constant
+INDEX_CONST_TYPE = 0x01
+INDEX_CONST_GROUP = 0x02
+INDEX_CONST_INSTANCE_HI = 0x04
+INDEX_CONST_INSTANCE_LO = 0x08
+
+_KEY_FIELDS = ("type_id", "group", "instance_hi", "instance_lo")
+_CONST_BITS = (INDEX_CONST_TYPE, INDEX_CONST_GROUP, INDEX_CONST_INSTANCE_HI, INDEX_CONST_INSTANCE_LO)
+
+# Mask for the extended-compression bit in the file_size field
+FILE_SIZE_MASK = 0x7FFFFFFF
+
+# Indexes with at least this many entries use NumPy when backend="auto"
+NUMPY_MIN_ENTRIES = 4096
+
+# (type_id, group, instance, offset, file_size, mem_size, compression_type)
+IndexRow = Tuple[int, int, int, int, int, int, int]
+
+
+class IndexLayout:
+    """Precompiled record layout for one combination of constant-field flags."""
+    __slots__ = ('flags', 'const_count', 'record', 'key_fields')
+
+    def __init__(self, flags):
+        # type: (int) -> None
+        self.flags = flags & 0x0F
+        self.key_fields = tuple(
+            name for name, bit in zip(_KEY_FIELDS, _CONST_BITS) if not flags & bit
+        )
+        self.const_count = 4 - len(self.key_fields)
+        self.record = struct.Struct("<" + "I" * len(self.key_fields) + "IIIHH")
+
+    @property
+    def record_size(self):
+        # type: () -> int
+        return self.record.size
+
+    @property
+    def constants_size(self):
+        # type: () -> int
+        """Bytes of constant key values stored between the flags and the records."""
+        return 4 * self.const_count
+
+
+_LAYOUTS = {}  # type: Dict[int, IndexLayout]
+
+
+def index_layout(flags):
+    # type: (int) -> IndexLayout
+    """Return the (cached) record layout for an index flags word."""
+    key = flags & 0x0F
+    layout = _LAYOUTS.get(key)
+    if layout is None:
+        layout = _LAYOUTS[key] = IndexLayout(key)
+    return layout
+
+
+def index_body_size(flags, entry_count):
+    # type: (int, int) -> int
+    """Size in bytes of the index after the flags word (constants + records)."""
+    layout = index_layout(flags)
+    return layout.constants_size + layout.record_size * entry_count
+
+
+def _read_constants(data, layout):
+    # type: (bytes, IndexLayout) -> Dict[str, int]
+    """Read the constant key values, defaulting non-constant fields to 0."""
+    values = dict.fromkeys(_KEY_FIELDS, 0)
+    pos = 0
+    for name, bit in zip(_KEY_FIELDS, _CONST_BITS):
+        if layout.flags & bit:
+            values[name] = struct.unpack_from("<I", data, pos)[0]
+            pos += 4
+    return values
+
+
+def _check_size(data, flags, entry_count):
+    # type: (bytes, int, int) -> None
+    needed = index_body_size(flags, entry_count)
+    if len(data) < needed:
+        raise ValueError(
+            "Truncated index: {} entries need {} bytes, got {}".format(
+                entry_count, needed, len(data)
+            )
+        )
+
+
+class ResourceKey:
+    """Identifies a resource within a .package file."""
+    __slots__ = ('type_id', 'group', 'instance')
+
+    def __init__(self, type_id, group, instance):
+        # type: (int, int, int) -> None
+        self.type_id = type_id
+        self.group = group
+        self.instance = instance
+
+    @property
+    def is_tuning(self):
+        # type: () -> bool
+        return self.type_id == TUNING_TYPE_ID
+
+    def as_tuple(self):
+        # type: () -> Tuple[int, int, int]
+        return (self.type_id, self.group, self.instance)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    __hash__ = None  # mutable, like the dataclass it replaces
+
+    def __repr__(self):
+        # type: () -> str
+        return "ResourceKey(type_id={!r}, group={!r}, instance={!r})".format(
+            self.type_id, self.group, self.instance
+        )
+
+    def __str__(self):
+        # type: () -> str
+        return "{:08X}!{:08X}!{:016X}".format(self.type_id, self.group, self.instance)
+
+
+class IndexEntry:
+    """A single resource entry from the package index."""
+    __slots__ = ('key', 'offset', 'file_size', 'mem_size', 'compressed', 'compression_type')
+
+    def __init__(self, key, offset, file_size, mem_size, compressed, compression_type=0):
+        # type: (ResourceKey, int, int, int, bool, int) -> None
+        self.key = key
+        self.offset = offset
+        self.file_size = file_size  # size in the file (possibly compressed)
+        self.mem_size = mem_size    # size when decompressed
+        self.compressed = compressed
+        self.compression_type = compression_type
+
+    @property
+    def is_compressed(self):
+        # type: () -> bool
+        return self.compressed and self.file_size != self.mem_size
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        # type: () -> str
+        return "IndexEntry({})".format(", ".join(
+            "{}={!r}".format(name, getattr(self, name)) for name in self.__slots__
+        ))
+
+
+# Column name -> array typecode
+INDEX_COLUMNS = (
+    ("type_id", "I"),
+    ("group", "I"),
+    ("instance", "Q"),
+    ("offset", "I"),
+    ("file_size", "I"),
+    ("mem_size", "I"),
+    ("compression_type", "H"),
+)
+
+# bytes.translate() table clearing the high bit of a byte
+_CLEAR_HIGH_BIT = bytes(b & 0x7F for b in range(256))
+
+
+def _from_le_bytes(typecode, data):
+    # type: (str, bytes) -> array
+    """Build an array from little-endian bytes."""
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+class IndexTable(Sequence):
+    """Columnar resource index backed by one array.array per field.
+
+    Behaves as a read-only sequence of IndexEntry: indexing or iterating
+    creates entry views on the fly, slicing returns a smaller IndexTable.
+    The by_type/by_group/by_instance filters scan the columns directly
+    (with NumPy when it is installed) without materializing entries.
+    """
+    __slots__ = tuple(name for name, _ in INDEX_COLUMNS)
+
+    def __init__(self, columns=None):
+        # type: (Optional[Dict[str, array]]) -> None
+        for name, typecode in INDEX_COLUMNS:
+            column = columns[name] if columns is not None else array(typecode)
+            if column.typecode != typecode:
+                raise TypeError("Column {} must have typecode {!r}".format(name, typecode))
+            setattr(self, name, column)
+        counts = {len(getattr(self, name)) for name, _ in INDEX_COLUMNS}
+        if len(counts) > 1:
+            raise ValueError("IndexTable columns have different lengths")
+
+    @classmethod
+    def from_rows(cls, rows):
+        # type: (List[IndexRow]) -> IndexTable
+        """Build a table from (type_id, group, instance, offset, file_size,
+        mem_size, compression_type) tuples."""
+        columns = list(zip(*rows)) or [()] * len(INDEX_COLUMNS)
+        return cls({
+            name: array(typecode, values)
+            for (name, typecode), values in zip(INDEX_COLUMNS, columns)
+        })
+
+    @classmethod
+    def from_index(cls, data, flags, entry_count, backend="auto"):
+        # type: (bytes, int, int, str) -> IndexTable
+        """Decode an index block (the bytes after the flags word).
+
+        backend is "struct", "numpy", or "auto" (NumPy for large indexes
+        when it is installed).
+
+        Raises:
+            ValueError: If the block is shorter than entry_count records.
+        """
+        _check_size(data, flags, entry_count)
+        if backend == "auto":
+            backend = "numpy" if np is not None and entry_count >= NUMPY_MIN_ENTRIES else "struct"
+        if backend == "numpy":
+            columns = index_columns_numpy(data, flags, entry_count)
+            return cls({
+                name: _from_le_bytes(typecode, columns[name].astype("<" + _NUMPY_CODES[typecode]).tobytes())
+                for name, typecode in INDEX_COLUMNS
+            })
+        if backend != "struct":
+            raise ValueError("Unknown index backend: {!r}".format(backend))
+        return cls(_index_columns_struct(data, flags, entry_count))
+
+    # -- Sequence protocol --
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.offset)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return IndexTable({name: getattr(self, name)[index] for name, _ in INDEX_COLUMNS})
+        return IndexEntry(
+            key=ResourceKey(self.type_id[index], self.group[index], self.instance[index]),
+            offset=self.offset[index],
+            file_size=self.file_size[index],
+            mem_size=self.mem_size[index],
+            compressed=self.compression_type[index] != 0,
+            compression_type=self.compression_type[index],
+        )
+
+    def __iter__(self):
+        # type: () -> Iterator[IndexEntry]
+        for type_id, group, instance, offset, file_size, mem_size, compression in self.iter_rows():
+            yield IndexEntry(
+                key=ResourceKey(type_id, group, instance),
+                offset=offset,
+                file_size=file_size,
+                mem_size=mem_size,
+                compressed=compression != 0,
+                compression_type=compression,
+            )
+
+    def __repr__(self):
+        # type: () -> str
+        return "IndexTable({} entries)".format(len(self))
+
+    def iter_rows(self):
+        # type: () -> Iterator[IndexRow]
+        """Iterate plain row tuples without creating entry objects."""
+        return zip(*(getattr(self, name) for name, _ in INDEX_COLUMNS))
+
+    def key_at(self, index):
+        # type: (int) -> Tuple[int, int, int]
+        """Return the (type_id, group, instance) tuple of one row."""
+        return (self.type_id[index], self.group[index], self.instance[index])
+
+    @property
+    def nbytes(self):
+        # type: () -> int
+        """Bytes held by the column arrays."""
+        return sum(len(getattr(self, name)) * getattr(self, name).itemsize for name, _ in INDEX_COLUMNS)
+
+    # -- Serialization --
+
+    def to_bytes(self):
+        # type: () -> bytes
+        """Serialize the columns back to back as little-endian arrays."""
+        parts = []
+        for name, _ in INDEX_COLUMNS:
+            column = getattr(self, name)
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, entry_count):
+        # type: (bytes, int) -> IndexTable
+        """Rebuild a table from to_bytes() output.
+
+        Raises:
+            ValueError: If data does not hold exactly entry_count rows.
+        """
+        columns = {}  # type: Dict[str, array]
+        pos = 0
+        for name, typecode in INDEX_COLUMNS:
+            size = array(typecode).itemsize * entry_count
+            columns[name] = _from_le_bytes(typecode, data[pos:pos + size])
+            pos += size
+        if pos != len(data) or len(columns["compression_type"]) != entry_count:
+            raise ValueError("Serialized index has the wrong size for {} entries".format(entry_count))
+        return cls(columns)
+
+    # -- Filters --
+
+    def take(self, positions):
+        # type: (List[int]) -> IndexTable
+        """Return a table holding only the rows at the given positions."""
+        columns = {}  # type: Dict[str, array]
+        for name, typecode in INDEX_COLUMNS:
+            column = getattr(self, name)
+            columns[name] = array(typecode, [column[i] for i in positions])
+        return IndexTable(columns)
+
+    def positions(self, column_name, value):
+        # type: (str, int) -> List[int]
+        """Row positions whose column equals value."""
+        column = getattr(self, column_name)
+        if np is not None and len(column) >= _NUMPY_FILTER_MIN:
+            values = np.frombuffer(column, dtype=_NUMPY_CODES[column.typecode])
+            return np.flatnonzero(values == value).tolist()
+        return [i for i, v in enumerate(column) if v == value]
+
+    def by_type(self, type_id):
+        # type: (int) -> IndexTable
+        """Rows with the given resource type ID."""
+        return self.take(self.positions("type_id", type_id))
+
+    def by_group(self, group):
+        # type: (int) -> IndexTable
+        """Rows with the given group."""
+        return self.take(self.positions("group", group))
+
+    def by_instance(self, instance):
+        # type: (int) -> IndexTable
+        """Rows with the given instance ID."""
+        return self.take(self.positions("instance", instance))
+
+
+# array typecode -> NumPy dtype code
+_NUMPY_CODES = {"H": "u2", "I": "u4", "Q": "u8"}
+
+# Below this many rows a Python scan beats the NumPy round trip
+_NUMPY_FILTER_MIN = 256
+
+
+def _index_columns_struct(data, flags, entry_count):
+    # type: (bytes, int, int) -> Dict[str, array]
+    """Split the record block into columns with strided array slices.
+
+    The record layout is all uint32 words except the trailing uint16 pair, so
+    the block is viewed once as uint32 (and once as uint16) and each column is
+    an extended slice, with no per-entry Python objects.
+    """
+    layout = index_layout(flags)
+    const = _read_constants(data, layout)
+    start = layout.constants_size
+    record_size = layout.record_size
+    block = bytearray(memoryview(data)[start:start + record_size * entry_count])
+
+    key_count = len(layout.key_fields)
+    # Clear the extended-compression bit (top byte of file_size)
+    high_byte = (key_count + 1) * 4 + 3
+    block[high_byte::record_size] = block[high_byte::record_size].translate(_CLEAR_HIGH_BIT)
+
+    words = _from_le_bytes("I", block)
+    stride = record_size // 4
+    columns = {}  # type: Dict[str, array]
+    key_words = {}  # type: Dict[str, array]
+    for name in _KEY_FIELDS:
+        if name in layout.key_fields:
+            key_words[name] = words[layout.key_fields.index(name)::stride]
+        else:
+            key_words[name] = array("I", [const[name]]) * entry_count
+    columns["type_id"] = key_words["type_id"]
+    columns["group"] = key_words["group"]
+
+    # Interleave (lo, hi) words and reinterpret as native uint64
+    pairs = array("I", bytes(8 * entry_count))
+    lo_slot, hi_slot = (0, 1) if sys.byteorder == "little" else (1, 0)
+    pairs[lo_slot::2] = key_words["instance_lo"]
+    pairs[hi_slot::2] = key_words["instance_hi"]
+    instance = array("Q")
+    instance.frombytes(pairs.tobytes())
+    columns["instance"] = instance
+
+    columns["offset"] = words[key_count::stride]
+    columns["file_size"] = words[key_count + 1::stride]
+    columns["mem_size"] = words[key_count + 2::stride]
+    halves = _from_le_bytes("H", block)
+    columns["compression_type"] = halves[(key_count + 3) * 2::stride * 2]
+    return columns
+
+
+def parse_index(data, flags, entry_count, backend="auto"):
+    # type: (bytes, int, int, str) -> List[IndexRow]
+    """Decode an index block into rows.
+
+    Args:
+        data: Index bytes following the flags word (constants + records).
+        flags: The index flags word.
+        entry_count: Number of entries from the package header.
+        backend: "struct", "numpy", or "auto" (NumPy for large indexes
+            when it is installed).
+
+    Returns:
+        One (type_id, group, instance, offset, file_size, mem_size,
+        compression_type) tuple per entry, in index order. file_size has the
+        extended-compression bit masked off.
+
+    Raises:
+        ValueError: If the block is shorter than entry_count records.
+    """
+    return list(IndexTable.from_index(data, flags, entry_count, backend).iter_rows())
+
+
+def index_dtype(flags):
+    # type: (int) -> object
+    """NumPy structured dtype matching the record layout for flags."""
+    if np is None:
+        raise ImportError("NumPy is required for the numpy index backend")
+    layout = index_layout(flags)
+    fields = [(name, "<u4") for name in layout.key_fields]
+    fields += [("offset", "<u4"), ("file_size", "<u4"), ("mem_size", "<u4"),
+               ("compressed", "<u2"), ("committed", "<u2")]
+    return np.dtype(fields)
+
+
+def index_columns_numpy(data, flags, entry_count):
+    # type: (bytes, int, int) -> Dict[str, object]
+    """Decode an index block into NumPy columns without per-entry objects.
+
+    Returns a dict with uint32 type_id/group/offset/file_size/mem_size,
+    uint64 instance and uint16 compression_type arrays.
+    """
+    _check_size(data, flags, entry_count)
+    layout = index_layout(flags)
+    const = _read_constants(data, layout)
+    records = np.frombuffer(data, dtype=index_dtype(flags), count=entry_count,
+                            offset=layout.constants_size)
+
+    def key_column(name):
+        if name in layout.key_fields:
+            return records[name]
+        return np.full(entry_count, const[name], dtype=np.uint32)
+
+    instance = (key_column("instance_hi").astype(np.uint64) << np.uint64(32)) \
+        | key_column("instance_lo").astype(np.uint64)
+    return {
+        "type_id": key_column("type_id"),
+        "group": key_column("group"),
+        "instance": instance,
+        "offset": records["offset"],
+        "file_size": records["file_size"] & np.uint32(FILE_SIZE_MASK),
+        "mem_size": records["mem_size"],
+        "compression_type": records["compressed"],
+    }
@@ -7,12 +7,27 @@ Sims 4 .package files use the DBPF (Database Packed File) v2.0 format:
 - Key resource type: 0x03B33DDF = Tuning XML
 """
 
+import mmap
+import os
 import struct
+import sys
 import zlib
 from dataclasses import dataclass, field
-from typing import BinaryIO, List
-
-from util.datamining.refpack import is_refpack, decompress as refpack_decompress
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+
+from util.datamining.compression import (
+    COMPRESSION_DELETED,
+    COMPRESSION_REFPACK,
+    COMPRESSION_STREAMABLE,
+    COMPRESSION_ZLIB,
+    DECOMPRESSION_ERRORS,
+    DEFAULT_CODECS,
+    CodecRegistry,
+    decompression_error,
+)
+from util.datamining.index_cache import IndexCache
+from util.datamining.package_index import IndexEntry, IndexTable, ResourceKey, index_body_size
+from util.datamining.refpack import RefPackDecompressor
 from util.datamining.resource_types import (
     TUNING_TYPE_ID,
     COMBINED_TUNING_TYPE_ID,
@@ -26,35 +41,44 @@ TUNING_TYPE_ID = TUNING_TYPE_ID
 DBPF_MAGIC = b"DBPF"
 DBPF_HEADER_SIZE = 96
 
-
-@dataclass
-class ResourceKey:
-    """Identifies a resource within a .package file."""
-    type_id: int
-    group: int
-    instance: int
-
-    @property
-    def is_tuning(self) -> bool:
-        return self.type_id == TUNING_TYPE_ID
-
-    def __str__(self) -> str:
-        return f"{self.type_id:08X}!{self.group:08X}!{self.instance:016X}"
-
-
-@dataclass
-class IndexEntry:
-    """A single resource entry from the package index."""
-    key: ResourceKey
-    offset: int
-    file_size: int  # size in the file (possibly compressed)
-    mem_size: int   # size when decompressed
-    compressed: bool
-    compression_type: int = 0
-
-    @property
-    def is_compressed(self) -> bool:
-        return self.compressed and self.file_size != self.mem_size
+# extract_many() merges ranges separated by at most this many unused bytes...
+DEFAULT_READ_GAP = 64 * 1024
+# ...as long as a merged read stays below this size
+DEFAULT_MAX_READ = 8 * 1024 * 1024
+
+# extract_to() copies and decompresses in pieces of this size
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Kernel-side file-to-file copies; outside Linux sendfile() needs a socket
+ZERO_COPY_SUPPORTED = sys.platform.startswith("linux") and hasattr(os, "sendfile")
+
+ReadRange = Tuple[int, int, List[IndexEntry]]
+
+
+def coalesce_reads(entries: Iterable[IndexEntry], max_gap: int = DEFAULT_READ_GAP,
+                   max_read: int = DEFAULT_MAX_READ) -> List[ReadRange]:
+    """Group entries into sequential (start, end, entries) reads.
+
+    Entries are sorted by offset; neighbours are merged into one read when
+    the hole between them is at most max_gap bytes and the merged read does
+    not exceed max_read. A single entry larger than max_read gets a read of
+    its own.
+    """
+    reads: List[ReadRange] = []
+    start = end = 0
+    group: List[IndexEntry] = []
+    for entry in sorted(entries, key=lambda e: e.offset):
+        entry_end = entry.offset + entry.file_size
+        if group and entry.offset - end <= max_gap and max(end, entry_end) - start <= max_read:
+            group.append(entry)
+            end = max(end, entry_end)
+            continue
+        if group:
+            reads.append((start, end, group))
+        start, end, group = entry.offset, entry_end, [entry]
+    if group:
+        reads.append((start, end, group))
+    return reads
 
 
 @dataclass
@@ -69,19 +93,112 @@ class PackageHeader:
 
 
 class PackageReader:
-    """Reads and parses Sims 4 .package (DBPF v2.0) files."""
+    """Reads and parses Sims 4 .package (DBPF v2.0) files.
 
-    def __init__(self, filepath: str):
+    Used as a context manager, the reader keeps the package open and
+    memory-mapped for its lifetime, so resources are sliced out of the
+    mapping instead of reopening the file for every entry::
+
+        with PackageReader(path) as reader:
+            for entry in reader.entries:
+                data = reader.extract_resource(entry)
+
+    Outside a ``with`` block each call opens the file on demand.
+
+    index_backend selects how the index is decoded: "struct", "numpy", or
+    "auto" (NumPy for large indexes when it is installed). An optional
+    IndexCache lets read() skip index parsing for unchanged packages.
+    Resources are decompressed by the CodecRegistry matching their
+    compression type (the shared DEFAULT_CODECS unless one is given).
+    """
+
+    def __init__(self, filepath: str, index_backend: str = "auto",
+                 index_cache: Optional[IndexCache] = None,
+                 codecs: Optional[CodecRegistry] = None):
         self.filepath = filepath
+        self.index_backend = index_backend
+        self.index_cache = index_cache
+        self.codecs = codecs if codecs is not None else DEFAULT_CODECS
         self.header = PackageHeader()
-        self.entries: List[IndexEntry] = []
+        self.entries: IndexTable = IndexTable()
         self._flags: int = 0
+        self._header_bytes: bytes = b""
+        self._file: Optional[BinaryIO] = None
+        self._map: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+
+    def __enter__(self) -> "PackageReader":
+        self.open()
+        try:
+            self.read()
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @property
+    def is_mapped(self) -> bool:
+        """True while the package is open and memory-mapped."""
+        return self._map is not None
+
+    def open(self) -> None:
+        """Open the package file and memory-map it until close() is called."""
+        if self._file is not None:
+            return
+        self._file = open(self.filepath, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped; read() reports them as too small
+            self._map = None
+            return
+        self._view = memoryview(self._map)
+
+    def close(self) -> None:
+        """Release the mapping and the underlying file handle."""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Views handed out by extract_resource_view() are still alive;
+                # the mapping is unmapped once the last of them is collected.
+                pass
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
     def read(self) -> None:
-        """Read the package file, parsing header and index."""
+        """Read the package file, parsing header and index.
+
+        With an index_cache, a cached index is used when the package is
+        unchanged; otherwise the index is parsed and the cache refreshed.
+        """
+        if self._map is not None:
+            self._map.seek(0)
+            self._read_header(self._map)
+            self._load_index(self._map)
+            return
         with open(self.filepath, "rb") as f:
             self._read_header(f)
-            self._read_index(f)
+            self._load_index(f)
+
+    def _load_index(self, f: BinaryIO) -> None:
+        """Load the index from the cache, or parse it and update the cache."""
+        if self.index_cache is not None:
+            cached = self.index_cache.load(self.filepath, self._header_bytes)
+            if cached is not None:
+                self._flags, self.entries = cached
+                return
+        self._read_index(f)
+        if self.index_cache is not None:
+            self.index_cache.store(self.filepath, self._header_bytes, self._flags, self.entries)
 
     def _read_header(self, f: BinaryIO) -> None:
         """Parse the 96-byte DBPF header."""
@@ -93,6 +210,8 @@ class PackageReader:
         if magic != DBPF_MAGIC:
             raise ValueError(f"Invalid DBPF magic: {magic!r} (expected {DBPF_MAGIC!r})")
 
+        self._header_bytes = data
+
         self.header.magic = magic
         self.header.major_version = struct.unpack_from("<I", data, 4)[0]
         self.header.minor_version = struct.unpack_from("<I", data, 8)[0]
@@ -105,79 +224,309 @@ class PackageReader:
         self.header.index_offset = struct.unpack_from("<I", data, 64)[0]
 
     def _read_index(self, f: BinaryIO) -> None:
-        """Parse the resource index."""
+        """Parse the resource index.
+
+        The flags word is read first to pick the record layout; everything
+        after it is then read in a single call and decoded in bulk.
+        """
         f.seek(self.header.index_offset)
 
-        # Read index flags (first 4 bytes of index)
-        self._flags = struct.unpack_from("<I", f.read(4))[0]
-
-        # Determine which fields are constant across all entries
-        # Bits 0-3 of flags indicate which of type/group/instance_hi/instance_lo are constant
-        const_type = 0
-        const_group = 0
-        const_instance_hi = 0
-        const_instance_lo = 0
-
-        if self._flags & 0x01:
-            const_type = struct.unpack("<I", f.read(4))[0]
-        if self._flags & 0x02:
-            const_group = struct.unpack("<I", f.read(4))[0]
-        if self._flags & 0x04:
-            const_instance_hi = struct.unpack("<I", f.read(4))[0]
-        if self._flags & 0x08:
-            const_instance_lo = struct.unpack("<I", f.read(4))[0]
-
-        self.entries = []
-        for _ in range(self.header.index_entry_count):
-            type_id = const_type if (self._flags & 0x01) else struct.unpack("<I", f.read(4))[0]
-            group = const_group if (self._flags & 0x02) else struct.unpack("<I", f.read(4))[0]
-            instance_hi = const_instance_hi if (self._flags & 0x04) else struct.unpack("<I", f.read(4))[0]
-            instance_lo = const_instance_lo if (self._flags & 0x08) else struct.unpack("<I", f.read(4))[0]
-            instance = (instance_hi << 32) | instance_lo
-
-            offset, file_size = struct.unpack("<II", f.read(8))
-            mem_size, compressed = struct.unpack("<IH", f.read(6))
-
-            # Skip 2 bytes (padding/unknown)
-            f.read(2)
-
-            key = ResourceKey(type_id=type_id, group=group, instance=instance)
-            entry = IndexEntry(
-                key=key,
-                offset=offset,
-                file_size=file_size & 0x7FFFFFFF,  # mask off high bit
-                mem_size=mem_size,
-                compressed=(compressed != 0),
-                compression_type=compressed,
-            )
-            self.entries.append(entry)
+        count = self.header.index_entry_count
+        flags_data = f.read(4)
+        if len(flags_data) < 4:
+            if count == 0:
+                self._flags = 0
+                self.entries = IndexTable()
+                return
+            raise ValueError("Truncated index: missing flags word")
+        self._flags = struct.unpack_from("<I", flags_data)[0]
 
-    def extract_resource(self, entry: IndexEntry) -> bytes:
-        """Extract and decompress a single resource."""
+        body = f.read(index_body_size(self._flags, count))
+        self.entries = IndexTable.from_index(body, self._flags, count, backend=self.index_backend)
+
+    def _read_raw(self, entry: IndexEntry) -> Union[bytes, memoryview]:
+        """Return the stored (possibly compressed) bytes of an entry.
+
+        When the package is mapped this is a zero-copy view into the mapping.
+        """
+        if self._view is not None:
+            end = entry.offset + entry.file_size
+            if end > len(self._view):
+                raise ValueError(f"Resource {entry.key} extends past end of package")
+            return self._view[entry.offset:end]
         with open(self.filepath, "rb") as f:
             f.seek(entry.offset)
-            data = f.read(entry.file_size)
+            return f.read(entry.file_size)
+
+    def _iter_raw_chunks(self, entry: IndexEntry,
+                         chunk_size: int) -> Iterator[Union[bytes, memoryview]]:
+        """Yield the stored bytes of an entry in pieces of at most chunk_size."""
+        if self._view is not None:
+            view = self._read_raw(entry)
+            for pos in range(0, len(view), chunk_size):
+                yield view[pos:pos + chunk_size]
+            return
+        with open(self.filepath, "rb") as f:
+            f.seek(entry.offset)
+            left = entry.file_size
+            while left:
+                chunk = f.read(min(chunk_size, left))
+                if not chunk:
+                    raise ValueError(f"Resource {entry.key} extends past end of package")
+                left -= len(chunk)
+                yield chunk
+
+    def extract_to(self, entry: IndexEntry, fileobj: BinaryIO,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Decompress a resource straight into a binary file object.
+
+        Uncompressed entries are copied chunk by chunk, zlib entries go
+        through zlib.decompressobj() and RefPack entries through the windowed
+        decoder, so the decompressed resource is never held in memory as a
+        whole: peak memory is a few chunks (plus the 128 KiB RefPack window
+        and its compressed input). Other codecs, and registries with the
+        heuristic fallback enabled, decompress in one piece.
+
+        Returns:
+            The number of bytes written.
+        """
+        compression_type = entry.compression_type
+        if not entry.is_compressed and compression_type != COMPRESSION_DELETED:
+            written = 0
+            for chunk in self._iter_raw_chunks(entry, chunk_size):
+                fileobj.write(chunk)
+                written += len(chunk)
+            return written
+
+        codec = self.codecs.codec(compression_type)
+        if not self.codecs.fallback:
+            if compression_type == COMPRESSION_ZLIB and codec == "zlib":
+                return self._stream_zlib(entry, fileobj, chunk_size)
+            if compression_type in (COMPRESSION_REFPACK, COMPRESSION_STREAMABLE) \
+                    and codec is not None and codec.startswith("refpack"):
+                return self._stream_refpack(entry, codec, fileobj, chunk_size)
+
+        data = self.decompress_resource(entry, self._read_raw(entry))
+        fileobj.write(data)
+        return len(data)
+
+    def copy_raw_to(self, entry: IndexEntry, fileobj: BinaryIO) -> Optional[int]:
+        """Copy an uncompressed entry into a file without a userspace buffer.
+
+        The kernel copies straight from the package's file descriptor at the
+        entry's offset, with os.copy_file_range() where available and
+        os.sendfile() otherwise. fileobj is flushed first and left positioned
+        after the copied bytes.
+
+        Returns:
+            The number of bytes copied, or None when the zero-copy path does
+            not apply (not Linux, compressed entry, fileobj without a file
+            descriptor, or a kernel that refuses) and nothing was written;
+            callers then fall back to extract_to().
+        """
+        if not ZERO_COPY_SUPPORTED or entry.is_compressed \
+                or entry.compression_type == COMPRESSION_DELETED:
+            return None
+        try:
+            out_fd = fileobj.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+        fileobj.flush()
+        if self._file is not None:
+            return self._copy_fd_range(entry, self._file.fileno(), out_fd, fileobj)
+        with open(self.filepath, "rb") as f:
+            return self._copy_fd_range(entry, f.fileno(), out_fd, fileobj)
+
+    @staticmethod
+    def _copy_fd_range(entry: IndexEntry, in_fd: int, out_fd: int,
+                       fileobj: BinaryIO) -> Optional[int]:
+        copy_file_range = getattr(os, "copy_file_range", None)
+        copied = 0
+        while copied < entry.file_size:
+            count = entry.file_size - copied
+            try:
+                if copy_file_range is not None:
+                    n = copy_file_range(in_fd, out_fd, count, entry.offset + copied)
+                else:
+                    n = os.sendfile(out_fd, in_fd, entry.offset + copied, count)
+            except OSError:
+                if copied == 0 and copy_file_range is not None:
+                    # e.g. EXDEV on older kernels: retry the whole copy with sendfile
+                    copy_file_range = None
+                    continue
+                if copied == 0:
+                    return None
+                raise
+            if n == 0:
+                raise ValueError(f"Resource {entry.key} extends past end of package")
+            copied += n
+        # The kernel advanced the descriptor; resync the Python file object
+        fileobj.seek(os.lseek(out_fd, 0, os.SEEK_CUR))
+        return copied
+
+    def _stream_zlib(self, entry: IndexEntry, fileobj: BinaryIO, chunk_size: int) -> int:
+        """Inflate a zlib entry into fileobj, at most chunk_size bytes at a time."""
+        decompressor = zlib.decompressobj()
+        consumed = written = 0
+        try:
+            for chunk in self._iter_raw_chunks(entry, chunk_size):
+                consumed += len(chunk)
+                data = decompressor.decompress(chunk, chunk_size)
+                while data:
+                    fileobj.write(data)
+                    written += len(data)
+                    data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+            data = decompressor.flush()
+            if not decompressor.eof:
+                raise ValueError("truncated zlib stream")
+        except DECOMPRESSION_ERRORS as e:
+            self.codecs.record("zlib", consumed, written, error=True)
+            raise decompression_error(entry.key, "zlib", e)
+        fileobj.write(data)
+        written += len(data)
+        self.codecs.record("zlib", consumed, written)
+        return written
+
+    def _stream_refpack(self, entry: IndexEntry, codec: str, fileobj: BinaryIO,
+                        chunk_size: int) -> int:
+        """Decode a RefPack entry into fileobj through the windowed decoder."""
+        decompressor = RefPackDecompressor()
+        consumed = written = 0
+        try:
+            for chunk in self._iter_raw_chunks(entry, chunk_size):
+                consumed += len(chunk)
+                data = decompressor.feed(chunk, chunk_size)
+                while data:
+                    fileobj.write(data)
+                    written += len(data)
+                    data = decompressor.feed(b"", chunk_size)
+            data = decompressor.flush()
+        except DECOMPRESSION_ERRORS as e:
+            self.codecs.record(codec, consumed, written, error=True)
+            raise decompression_error(entry.key, codec, e)
+        fileobj.write(data)
+        written += len(data)
+        self.codecs.record(codec, consumed, written)
+        return written
+
+    def extract_resource(self, entry: IndexEntry) -> bytes:
+        """Extract and decompress a single resource."""
+        return bytes(self.extract_resource_view(entry))
+
+    def extract_resource_view(self, entry: IndexEntry) -> Union[bytes, memoryview]:
+        """Extract a resource without copying it when possible.
+
+        For uncompressed entries of a mapped package this returns a
+        memoryview slice of the mapping. Compressed entries are decompressed
+        straight from the mapped bytes and returned as bytes.
+        """
+        return self.decompress_resource(entry, self._read_raw(entry))
+
+    def decompress_resource(self, entry: IndexEntry,
+                            data: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+        """Decompress the stored bytes of an entry (returned as-is if uncompressed).
 
-        if entry.is_compressed:
-            # Try RefPack (EA's proprietary compression) first
-            if is_refpack(data):
-                data = refpack_decompress(data)
+        The codec is chosen from the entry's compression type; see
+        util.datamining.compression.
+        """
+        if not entry.is_compressed and entry.compression_type != COMPRESSION_DELETED:
+            return data
+        return self.codecs.decompress(entry.compression_type, data, entry.key)
+
+    def extract_many(self, entries: Iterable[IndexEntry], order: str = "offset",
+                     max_gap: int = DEFAULT_READ_GAP, max_read: int = DEFAULT_MAX_READ,
+                     errors: str = "strict",
+                     decompress: bool = True) -> Iterator[Tuple[IndexEntry, Union[bytes, memoryview]]]:
+        """Extract many resources with few large sequential reads.
+
+        Entries are sorted by offset and neighbouring ranges are merged (see
+        coalesce_reads()), so a package is read front to back instead of
+        seeking for every entry. Yields (entry, data) pairs; data is a
+        memoryview into the read buffer for uncompressed entries, valid for
+        as long as the caller keeps it.
+
+        Args:
+            entries: Index entries to extract.
+            order: "offset" yields in file order; "original" yields in the
+                order given, sorting and merging bounded batches of at most
+                max_read bytes so memory stays bounded either way.
+            max_gap: Largest hole (bytes) read through to merge two ranges.
+            max_read: Upper bound on a single merged read.
+            errors: "strict" raises on the first failing entry; "return"
+                yields the ValueError in place of the data and carries on.
+            decompress: If False, yield the stored (possibly compressed) bytes.
+        """
+        if order not in ("offset", "original"):
+            raise ValueError(f"Unknown extract order: {order!r}")
+        if errors not in ("strict", "return"):
+            raise ValueError(f"Unknown errors mode: {errors!r}")
+
+        if order == "offset":
+            batches: Iterable[List[IndexEntry]] = [list(entries)]
+        else:
+            batches = self._original_order_batches(entries, max_read)
+
+        for batch in batches:
+            results = self._extract_batch(batch, max_gap, max_read, errors, decompress)
+            if order == "offset":
+                yield from results
             else:
-                # Fall back to zlib (compression type 0x5A42)
-                try:
-                    data = zlib.decompress(data)
-                except zlib.error:
-                    # Some entries have a 4-byte compression header to skip
+                # Hold one bounded batch, then hand it back in caller order
+                by_id = {}
+                for entry, data in results:
+                    by_id.setdefault(id(entry), []).append(data)
+                for entry in batch:
+                    yield entry, by_id[id(entry)].pop(0)
+
+    @staticmethod
+    def _original_order_batches(entries: Iterable[IndexEntry],
+                                max_read: int) -> Iterator[List[IndexEntry]]:
+        """Split entries into consecutive batches of at most max_read stored bytes."""
+        batch: List[IndexEntry] = []
+        size = 0
+        for entry in entries:
+            if batch and size + entry.file_size > max_read:
+                yield batch
+                batch, size = [], 0
+            batch.append(entry)
+            size += entry.file_size
+        if batch:
+            yield batch
+
+    def _extract_batch(self, entries: List[IndexEntry], max_gap: int, max_read: int,
+                       errors: str, decompress: bool) -> Iterator[Tuple[IndexEntry, Union[bytes, memoryview]]]:
+        """Read and decompress entries in offset order."""
+        f = None
+        if self._view is None:
+            f = open(self.filepath, "rb")
+        try:
+            for start, end, group in coalesce_reads(entries, max_gap, max_read):
+                if f is None:
+                    block = self._view[start:end]
+                else:
+                    f.seek(start)
+                    block = memoryview(f.read(end - start))
+                for entry in group:
                     try:
-                        data = zlib.decompress(data[4:])
-                    except zlib.error:
-                        raise ValueError(f"Failed to decompress resource {entry.key}")
-
-        return data
+                        pos = entry.offset - start
+                        if pos + entry.file_size > len(block):
+                            raise ValueError(f"Resource {entry.key} extends past end of package")
+                        data = block[pos:pos + entry.file_size]
+                        if decompress:
+                            data = self.decompress_resource(entry, data)
+                    except ValueError as e:
+                        if errors == "strict":
+                            raise
+                        data = e
+                    yield entry, data
+        finally:
+            if f is not None:
+                f.close()
 
     def extract_by_type(self, type_id: int) -> List[IndexEntry]:
         """Return all index entries matching a resource type ID."""
-        return [e for e in self.entries if e.key.type_id == type_id]
+        return list(self.entries.by_type(type_id))
 
     def extract_tuning_entries(self) -> List[IndexEntry]:
         """Return all index entries that are tuning XML resources."""
@@ -194,10 +543,10 @@ class PackageReader:
             locale_group: Group ID for locale filtering (0x00000000 = English).
                 Pass None to return all locales.
         """
-        entries = self.extract_by_type(STRING_TABLE_TYPE_ID)
+        entries = self.entries.by_type(STRING_TABLE_TYPE_ID)
         if locale_group is not None:
-            entries = [e for e in entries if e.key.group == locale_group]
-        return entries
+            entries = entries.by_group(locale_group)
+        return list(entries)
 
     def extract_tuning_xml(self, entry: IndexEntry) -> str:
         """Extract a tuning XML resource and return it as a string."""
@@ -0,0 +1,242 @@
+"""
+Parallel decompression of package resources.
+
+zlib releases the GIL while it inflates, so zlib resources scale across
+cores on a thread pool inside one process. The RefPack decoder is pure
+Python and holds the GIL, so RefPack resources go to a process pool instead.
+Stored bytes are read sequentially on the calling thread (see
+PackageReader.extract_many) and only decompression is farmed out.
+
+    with PackageReader(path) as reader, ParallelExtractor() as extractor:
+        for entry, data in extractor.extract(reader, reader.entries):
+            ...
+
+One extractor can serve any number of packages in turn, keeping its pools.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from util.datamining.compression import (
+    COMPRESSION_DELETED,
+    COMPRESSION_REFPACK,
+    COMPRESSION_STREAMABLE,
+    DECOMPRESSION_ERRORS,
+    CodecRegistry,
+    decompression_error,
+)
+from util.datamining.package_index import IndexEntry
+from util.datamining.package_reader import PackageReader
+
+DEFAULT_MAX_IN_FLIGHT = 64 * 1024 * 1024
+
+# Compression types whose decoder holds the GIL
+_PROCESS_TYPES = frozenset((COMPRESSION_REFPACK, COMPRESSION_STREAMABLE))
+
+Result = Tuple[IndexEntry, Union[bytes, memoryview, ValueError]]
+
+
+def _cost(entry):
+    # type: (IndexEntry) -> int
+    """Bytes an entry holds while in flight: stored plus decompressed size."""
+    return entry.file_size + entry.mem_size
+
+
+class _Job:
+    """One entry on its way through a pool."""
+
+    __slots__ = ("entry", "raw", "codec", "future", "cost")
+
+    def __init__(self, entry, raw, codec, future):
+        # type: (IndexEntry, Union[bytes, memoryview], Optional[str], Future) -> None
+        self.entry = entry
+        self.raw = raw
+        self.codec = codec
+        self.future = future
+        self.cost = _cost(entry)
+
+
+class _JobQueue:
+    """Outstanding jobs, released in submission or completion order."""
+
+    def __init__(self, ordered):
+        # type: (bool) -> None
+        self.ordered = ordered
+        self._fifo = deque()  # type: Deque[_Job]
+        self._by_future = {}  # type: Dict[Future, _Job]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._by_future)
+
+    def add(self, job):
+        # type: (_Job) -> None
+        self._by_future[job.future] = job
+        if self.ordered:
+            self._fifo.append(job)
+
+    def pop_finished(self, block):
+        # type: (bool) -> List[_Job]
+        """Remove finished jobs; with block=True wait until at least one is."""
+        if self.ordered:
+            if block:
+                wait([self._fifo[0].future])
+            finished = []  # type: List[_Job]
+            while self._fifo and self._fifo[0].future.done():
+                job = self._fifo.popleft()
+                del self._by_future[job.future]
+                finished.append(job)
+            return finished
+
+        done, _ = wait(self._by_future, timeout=None if block else 0,
+                       return_when=FIRST_COMPLETED)
+        return [self._by_future.pop(future) for future in done]
+
+
+def _done(value=None, error=None):
+    # type: (object, Optional[BaseException]) -> Future
+    future = Future()  # type: Future
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(value)
+    return future
+
+
+class ParallelExtractor:
+    """Decompresses package resources on worker pools.
+
+    The pools are created on first use and shared by every extract() call
+    until close().
+
+    Args:
+        max_workers: Thread pool size (default: CPU count).
+        process_workers: Process pool size for RefPack (default: CPU count).
+            0 decodes RefPack on the thread pool instead.
+        max_in_flight: Budget in bytes (stored + decompressed size) for
+            resources submitted but not yet yielded. At least one resource
+            is always in flight, however large.
+    """
+
+    def __init__(self, max_workers=None, process_workers=None,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        # type: (Optional[int], Optional[int], int) -> None
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.process_workers = process_workers if process_workers is not None else self.max_workers
+        self.max_in_flight = max_in_flight
+        self._threads = None  # type: Optional[ThreadPoolExecutor]
+        self._processes = None  # type: Optional[ProcessPoolExecutor]
+
+    def __enter__(self):
+        # type: () -> ParallelExtractor
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # type: (object, object, object) -> None
+        self.close()
+
+    def close(self):
+        # type: () -> None
+        """Shut down the worker pools."""
+        if self._threads is not None:
+            self._threads.shutdown()
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown()
+            self._processes = None
+
+    def extract(self, reader, entries, ordered=True, errors="strict"):
+        # type: (PackageReader, Iterable[IndexEntry], bool, str) -> Iterator[Result]
+        """Yield (entry, data) for every entry, decompressed in parallel.
+
+        Args:
+            reader: The package to extract from. Keep it open (mapped) for
+                the whole extraction to avoid reopening the file.
+            entries: Index entries of reader to extract.
+            ordered: True yields results in submission (input) order; False
+                yields each as soon as it is ready, reading in file order.
+            errors: "strict" raises on the first failing entry; "return"
+                yields the ValueError in place of the data and carries on.
+        """
+        if errors not in ("strict", "return"):
+            raise ValueError("Unknown errors mode: {!r}".format(errors))
+
+        codecs = reader.codecs
+        raw_entries = reader.extract_many(
+            entries, order="original" if ordered else "offset",
+            errors="return", decompress=False)
+
+        queue = _JobQueue(ordered)
+        in_flight = 0
+
+        for entry, raw in raw_entries:
+            # Wait for room before the entry starts decompressing
+            while queue and in_flight + _cost(entry) > self.max_in_flight:
+                for done in queue.pop_finished(block=True):
+                    in_flight -= done.cost
+                    yield self._result(codecs, done, errors)
+
+            job = self._submit(codecs, entry, raw)
+            queue.add(job)
+            in_flight += job.cost
+
+            for done in queue.pop_finished(block=False):
+                in_flight -= done.cost
+                yield self._result(codecs, done, errors)
+
+        while queue:
+            for done in queue.pop_finished(block=True):
+                yield self._result(codecs, done, errors)
+
+    def _submit(self, codecs, entry, raw):
+        # type: (CodecRegistry, IndexEntry, Union[bytes, memoryview, ValueError]) -> _Job
+        """Start decompressing one entry; trivial cases complete immediately."""
+        if isinstance(raw, ValueError):
+            return _Job(entry, b"", None, _done(error=raw))
+        if not entry.is_compressed and entry.compression_type != COMPRESSION_DELETED:
+            return _Job(entry, raw, None, _done(raw))
+
+        codec = codecs.resolve(entry.compression_type)
+        if codec is None:
+            # Unknown type: raise or run the heuristic fallback right here
+            try:
+                return _Job(entry, raw, None, _done(codecs.decompress(
+                    entry.compression_type, raw, entry.key)))
+            except ValueError as e:
+                return _Job(entry, raw, None, _done(error=e))
+
+        name, decompressor = codec
+        if entry.compression_type in _PROCESS_TYPES and self.process_workers > 0:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+            future = self._processes.submit(decompressor, bytes(raw))
+        else:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers)
+            future = self._threads.submit(decompressor, raw)
+        return _Job(entry, raw, name, future)
+
+    def _result(self, codecs, job, errors):
+        # type: (CodecRegistry, _Job, str) -> Result
+        """Turn a finished job into (entry, data), recording codec stats."""
+        entry = job.entry
+        try:
+            try:
+                data = job.future.result()
+            except DECOMPRESSION_ERRORS as e:
+                if job.codec is None:
+                    raise
+                codecs.record(job.codec, len(job.raw), error=True)
+                if not codecs.fallback:
+                    raise decompression_error(entry.key, job.codec, e)
+                data = codecs.decompress_fallback(job.raw, entry.key)
+            else:
+                if job.codec is not None:
+                    codecs.record(job.codec, len(job.raw), len(data))
+        except ValueError as e:
+            if errors == "strict":
+                raise
+            data = e
+        return entry, data
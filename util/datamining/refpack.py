@@ -1,5 +1,5 @@
 """
-RefPack (QFS) decompression for EA's DBPF format.
+RefPack (QFS) compression for EA's DBPF format.
 
 RefPack is EA's proprietary compression used in The Sims series and other
 EA games. It's a simple LZ-based scheme identified by the magic bytes 0x10FB
@@ -16,9 +16,52 @@ The compression uses variable-length control codes:
   - 0xC0-0xDF: 4-byte code — long copy from output + literal bytes
   - 0xE0-0xFB: 1-byte code — literal bytes only
   - 0xFC-0xFF: stop codes
+
+decompress() writes into a preallocated output buffer and copies each
+back-reference with one slice assignment; overlapping copies (offset
+shorter than length, e.g. run-length patterns) repeat the overlapped
+pattern instead of copying byte by byte. The buffer is the declared size,
+capped at 257 bytes per input byte (the most a control code can expand
+to), so a forged header cannot force a huge allocation.
+
+compress() finds matches with a hash chain over 3-byte prefixes, limited to
+the 128 KiB window; the level (1-9) trades speed for ratio by bounding the
+chain walk and enabling lazy matching.
 """
 
 import struct
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+# Largest back-reference distance (4-byte control: 0x1FFFF + 1), so a
+# streaming decoder never needs more output history than this
+WINDOW_SIZE = 128 * 1024
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_LEVEL = 6
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Longest back-reference a single control code can express (4-byte form)
+MAX_MATCH = 1028
+
+# level: (chain candidates to try, length that ends the search, lazy matching)
+_LEVELS = {
+    1: (2, 8, False),
+    2: (4, 16, False),
+    3: (8, 32, False),
+    4: (8, 32, True),
+    5: (12, 64, True),
+    6: (16, 128, True),
+    7: (32, 258, True),
+    8: (128, 516, True),
+    9: (512, MAX_MATCH, True),
+}
+
+# Positions are chained through a ring twice the window, so a slot is never
+# reused while the position it describes can still be referenced
+_CHAIN_SIZE = 2 * WINDOW_SIZE
+_CHAIN_MASK = _CHAIN_SIZE - 1
 
 
 def is_refpack(data):
@@ -47,6 +90,227 @@ def decompress(data):
     Raises:
         ValueError: If the data is not valid RefPack.
     """
+    return _decode_all(data)
+
+
+def compress(data, level=DEFAULT_LEVEL):
+    # type: (bytes, int) -> bytes
+    """Compress data to a RefPack stream that decompress() restores exactly.
+
+    The stream starts with the 0x10FB magic and a 3-byte size, or 0x90FB
+    and a 4-byte size for data of 16 MiB or more.
+
+    Args:
+        data: Bytes to compress.
+        level: 1 (fastest) to 9 (smallest output).
+
+    Raises:
+        ValueError: If the level is out of range or data exceeds 4 GiB.
+    """
+    if level not in _LEVELS:
+        raise ValueError("RefPack compression level must be 1-9, got {!r}".format(level))
+    data = bytes(data)
+    size = len(data)
+    if size >= 1 << 32:
+        raise ValueError("Data too large for RefPack: {} bytes".format(size))
+
+    if size < 1 << 24:
+        out = bytearray(b"\x10\xFB" + struct.pack(">I", size)[1:])
+    else:
+        out = bytearray(b"\x90\xFB" + struct.pack(">I", size))
+
+    max_chain, nice_length, lazy = _LEVELS[level]
+    head = {}  # type: Dict[bytes, int]
+    chain = [-1] * _CHAIN_SIZE
+    last = size - 3  # last position with a full 3-byte prefix
+
+    def insert(pos):
+        # type: (int) -> int
+        """Add pos to its hash chain; return the previous chain head."""
+        key = data[pos:pos + 3]
+        candidate = head.get(key, -1)
+        chain[pos & _CHAIN_MASK] = candidate
+        head[key] = pos
+        return candidate
+
+    def find(pos):
+        # type: (int) -> Tuple[int, int]
+        """Insert pos and return the best (length, offset) match, or (0, 0)."""
+        candidate = insert(pos)
+        limit = min(MAX_MATCH, size - pos)
+        best_length = 2
+        best_offset = 0
+        best_gain = 0
+        tries = max_chain
+        while candidate >= 0 and tries:
+            offset = pos - candidate
+            if offset > WINDOW_SIZE:
+                break
+            # Candidates only get further away, so a better match must be
+            # longer: check the byte past the current best, then the prefix
+            end = candidate + best_length
+            if (data[end] == data[pos + best_length]
+                    and data[candidate:end] == data[pos:pos + best_length]):
+                length = _match_length(data, candidate, pos, best_length + 1, limit)
+                gain = length - _match_cost(length, offset)
+                if gain > best_gain:
+                    best_length = length
+                    best_offset = offset
+                    best_gain = gain
+                    if length >= nice_length or length == limit:
+                        break
+            candidate = chain[candidate & _CHAIN_MASK]
+            tries -= 1
+        if best_offset:
+            return best_length, best_offset
+        return 0, 0
+
+    def skip(start, end):
+        # type: (int, int) -> None
+        """Insert the positions a match covers, so later matches can use them."""
+        for pos in range(start, min(end, last + 1)):
+            key = data[pos:pos + 3]
+            chain[pos & _CHAIN_MASK] = head.get(key, -1)
+            head[key] = pos
+
+    pos = 0
+    literal_start = 0
+    if lazy:
+        # Hold each match back one position in case the next one is longer
+        held_length = 0
+        held_offset = 0
+        while pos <= last:
+            if held_length >= nice_length:
+                length, offset = 0, 0
+                insert(pos)
+            else:
+                length, offset = find(pos)
+            if held_length and (length - _match_cost(length, offset)
+                                <= held_length - _match_cost(held_length, held_offset)):
+                match_pos = pos - 1
+                _emit_match(out, data, literal_start, match_pos, held_length, held_offset)
+                skip(pos + 1, match_pos + held_length)
+                pos = literal_start = match_pos + held_length
+                held_length = 0
+            else:
+                if length:
+                    held_length, held_offset = length, offset
+                pos += 1
+        if held_length:
+            match_pos = pos - 1
+            _emit_match(out, data, literal_start, match_pos, held_length, held_offset)
+            literal_start = match_pos + held_length
+    else:
+        while pos <= last:
+            length, offset = find(pos)
+            if length:
+                _emit_match(out, data, literal_start, pos, length, offset)
+                # Fast levels only index the start of long matches
+                skip(pos + 1, pos + min(length, nice_length))
+                pos = literal_start = pos + length
+            else:
+                pos += 1
+
+    trailing = _emit_literals(out, data, literal_start, size)
+    out.append(0xFC | trailing)
+    out += data[size - trailing:size]
+    return bytes(out)
+
+
+def _match_cost(length, offset):
+    # type: (int, int) -> int
+    """Bytes of control code needed for a copy; length + 1 if none fits."""
+    if length <= 10 and offset <= 1024:
+        return 2
+    if length <= 67 and offset <= 16384:
+        return 3 if length >= 4 else length + 1
+    return 4 if length >= 5 else length + 1
+
+
+def _match_length(data, a, b, length, limit):
+    # type: (bytes, int, int, int, int) -> int
+    """Length of the common run at a and b (a < b), at most limit, given
+    that the first length bytes are already known to match."""
+    while length + 32 <= limit and data[a + length:a + length + 32] == data[b + length:b + length + 32]:
+        length += 32
+    while length < limit and data[a + length] == data[b + length]:
+        length += 1
+    return length
+
+
+def _emit_literals(out, data, start, end):
+    # type: (bytearray, bytes, int, int) -> int
+    """Write data[start:end] as literal-only codes, up to 112 bytes each.
+
+    Returns the 0-3 bytes left over, which the next control code carries.
+    """
+    remaining = end - start
+    while remaining >= 4:
+        count = min(112, remaining & ~3)
+        out.append(0xE0 | ((count - 4) >> 2))
+        out += data[start:start + count]
+        start += count
+        remaining -= count
+    return remaining
+
+
+def _emit_match(out, data, literal_start, pos, length, offset):
+    # type: (bytearray, bytes, int, int, int, int) -> None
+    """Write the literals before pos, then a back-reference control code."""
+    literals = _emit_literals(out, data, literal_start, pos)
+    o = offset - 1
+    if length <= 10 and offset <= 1024:
+        out.append(((o >> 3) & 0x60) | ((length - 3) << 2) | literals)
+        out.append(o & 0xFF)
+    elif length <= 67 and offset <= 16384:
+        out.append(0x80 | (length - 4))
+        out.append((literals << 6) | (o >> 8))
+        out.append(o & 0xFF)
+    else:
+        out.append(0xC0 | ((o >> 12) & 0x10) | (((length - 5) >> 8) << 2) | literals)
+        out.append((o >> 8) & 0xFF)
+        out.append(o & 0xFF)
+        out.append((length - 5) & 0xFF)
+    out += data[pos - literals:pos]
+
+
+def iter_decompress(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    # type: (bytes, int) -> Iterator[bytes]
+    """Decompress RefPack data, yielding the output in chunks.
+
+    Only the last WINDOW_SIZE bytes of output are kept for back-references,
+    so memory stays bounded by WINDOW_SIZE + chunk_size however large the
+    decompressed resource is.
+
+    Raises:
+        ValueError: If the data is not valid RefPack.
+    """
+    read_header(data)  # report a bad header now rather than on first next()
+    return _iter_decode(data, chunk_size)
+
+
+def _iter_decode(data, chunk_size):
+    # type: (BytesLike, int) -> Iterator[bytes]
+    decompressor = RefPackDecompressor()
+    chunk = decompressor.feed(data, chunk_size)
+    while chunk:
+        yield chunk
+        chunk = decompressor.feed(b"", chunk_size)
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
+
+
+def read_header(data):
+    # type: (bytes) -> Tuple[int, int]
+    """Parse the RefPack header.
+
+    Returns:
+        (offset of the first control code, decompressed size).
+
+    Raises:
+        ValueError: If the header is missing or invalid.
+    """
     offset = 0
 
     # Skip optional 4-byte compressed size prefix
@@ -81,83 +345,284 @@ def decompress(data):
         )
         offset += 3
 
-    output = bytearray()
-    src = offset
+    return offset, decompressed_size
+
+
+def _back_reference(output, end, copy_offset, copy_length):
+    # type: (bytearray, int, int, int) -> bytes
+    """The bytes a back-reference copies, given output written up to end.
 
-    while src < len(data):
+    When the copy overlaps its own output (copy_offset < copy_length), the
+    copied bytes repeat the last copy_offset bytes, as a byte-by-byte copy
+    would.
+
+    Raises:
+        ValueError: If the reference points before the start of the output.
+    """
+    copy_src = end - copy_offset
+    if copy_src < 0:
+        raise ValueError(
+            "RefPack back-reference offset {} exceeds the {} bytes decoded".format(
+                copy_offset, end
+            )
+        )
+    if copy_offset >= copy_length:
+        return output[copy_src:copy_src + copy_length]
+    repeats = copy_length // copy_offset + 1
+    return (output[copy_src:end] * repeats)[:copy_length]
+
+
+# Most output one input byte can produce: a 4-byte control copies up to 1028
+_MAX_EXPANSION = 257
+
+
+def _decode_all(data):
+    # type: (bytes) -> bytes
+    """Decode a whole RefPack stream into a buffer of the declared size.
+
+    The declared size comes from an untrusted header, so the buffer is
+    preallocated only up to what the stream could possibly produce.
+    """
+    src, decompressed_size = read_header(data)
+    output = bytearray(min(decompressed_size, len(data) * _MAX_EXPANSION))
+    dst = 0
+    end = len(data)
+
+    while src < end:
         code = data[src]
+        stop = False
 
         if code <= 0x7F:
             # 2-byte control: short back-reference + literals
-            if src + 1 >= len(data):
+            if src + 1 >= end:
                 break
             b1 = data[src + 1]
             num_literals = code & 0x03
             copy_length = ((code & 0x1C) >> 2) + 3
             copy_offset = ((code & 0x60) << 3) + b1 + 1
             src += 2
-
-            # Append literal bytes
-            output.extend(data[src:src + num_literals])
-            src += num_literals
-
-            # Copy from output history
-            copy_src = len(output) - copy_offset
-            for i in range(copy_length):
-                output.append(output[copy_src + i])
-
         elif code <= 0xBF:
             # 3-byte control: medium back-reference + literals
-            if src + 2 >= len(data):
+            if src + 2 >= end:
                 break
             b1 = data[src + 1]
-            b2 = data[src + 2]
             num_literals = ((b1 & 0xC0) >> 6) & 0x03
             copy_length = (code & 0x3F) + 4
-            copy_offset = ((b1 & 0x3F) << 8) + b2 + 1
+            copy_offset = ((b1 & 0x3F) << 8) + data[src + 2] + 1
             src += 3
-
-            output.extend(data[src:src + num_literals])
-            src += num_literals
-
-            copy_src = len(output) - copy_offset
-            for i in range(copy_length):
-                output.append(output[copy_src + i])
-
         elif code <= 0xDF:
             # 4-byte control: long back-reference + literals
-            if src + 3 >= len(data):
+            if src + 3 >= end:
                 break
-            b1 = data[src + 1]
-            b2 = data[src + 2]
-            b3 = data[src + 3]
             num_literals = code & 0x03
-            copy_length = ((code & 0x0C) << 6) + b3 + 5
-            copy_offset = ((code & 0x10) << 12) + (b1 << 8) + b2 + 1
+            copy_length = ((code & 0x0C) << 6) + data[src + 3] + 5
+            copy_offset = ((code & 0x10) << 12) + (data[src + 1] << 8) + data[src + 2] + 1
             src += 4
-
-            output.extend(data[src:src + num_literals])
-            src += num_literals
-
-            copy_src = len(output) - copy_offset
-            for i in range(copy_length):
-                output.append(output[copy_src + i])
-
         elif code <= 0xFB:
             # 1-byte control: literal bytes only
             num_literals = ((code & 0x1F) << 2) + 4
+            copy_length = 0
             src += 1
-
-            output.extend(data[src:src + num_literals])
-            src += num_literals
-
         else:
             # 0xFC-0xFF: stop codes with 0-3 trailing literals
             num_literals = code & 0x03
+            copy_length = 0
             src += 1
+            stop = True
 
-            output.extend(data[src:src + num_literals])
+        if num_literals:
+            literals = data[src:src + num_literals]
+            # Slice assignment also grows the buffer if the stream
+            # overruns its declared size
+            output[dst:dst + len(literals)] = literals
+            dst += len(literals)
             src += num_literals
+
+        if copy_length:
+            output[dst:dst + copy_length] = _back_reference(output, dst, copy_offset, copy_length)
+            dst += copy_length
+
+        if stop:
             break
 
-    return bytes(output[:decompressed_size])
+    if dst != decompressed_size:
+        del output[min(dst, decompressed_size):]
+    return bytes(output)
+
+
+class RefPackDecompressor:
+    """Incremental RefPack decoder, used like zlib.decompressobj().
+
+    Compressed data is passed to feed() in pieces of any size and flush()
+    ends the stream. Only the last WINDOW_SIZE bytes of output are kept for
+    back-references, plus whatever a max_length limit holds back, so
+    resources of any size stream in bounded memory.
+
+    Attributes:
+        size: Declared decompressed size, once the header has been read.
+        eof: True once the stop code has been decoded.
+        unused_data: Bytes that followed the stop code.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self.size = None  # type: Optional[int]
+        self.eof = False
+        self.unused_data = b""
+        self._input = b""  # type: BytesLike
+        self._src = 0
+        self._output = bytearray()
+        self._returned = 0  # bytes of _output already handed out
+        self._remaining = 0  # declared bytes not yet handed out
+        self._finished = False
+
+    def feed(self, data, max_length=0):
+        # type: (BytesLike, int) -> bytes
+        """Decode as much of the stream as the data received so far allows.
+
+        A control code whose literals have not all arrived waits for the
+        next feed(). Call with empty data to continue after a max_length
+        limit.
+
+        Args:
+            data: The next piece of compressed data.
+            max_length: If nonzero, return at most this many bytes; the
+                rest is returned by later calls.
+
+        Raises:
+            ValueError: If the header is invalid.
+        """
+        if self._finished:
+            raise ValueError("RefPackDecompressor already flushed")
+        if self.eof:
+            self.unused_data += bytes(data)
+            return b""
+        if data:
+            if self._src >= len(self._input):
+                self._input = data
+            else:
+                self._input = bytes(self._input[self._src:]) + bytes(data)
+            self._src = 0
+        self._decode(max_length, final=False)
+        return self._take(max_length)
+
+    def flush(self):
+        # type: () -> bytes
+        """End the stream and return the remaining output.
+
+        Like decompress(), a stream cut off mid control code stops there
+        and output is never longer than the declared size.
+
+        Raises:
+            ValueError: If the data never contained a complete header.
+        """
+        if not self._finished:
+            self._decode(0, final=True)
+            self._finished = True
+        return self._take(0)
+
+    def _read_header(self, final):
+        # type: (bool) -> bool
+        data = self._input[self._src:]
+        # The longest header (compressed size prefix, magic, 4-byte size)
+        # is 10 bytes; wait for that much unless the stream has ended
+        if not final and len(data) < 10:
+            return False
+        offset, self.size = read_header(data)
+        self._remaining = self.size
+        self._src += offset
+        return True
+
+    def _decode(self, max_length, final):
+        # type: (int, bool) -> None
+        if self.size is None and not self._read_header(final):
+            return
+
+        data = self._input
+        src = self._src
+        end = len(data)
+        output = self._output
+        target = self._returned + max_length if max_length else None
+
+        while src < end and not self.eof:
+            if target is not None and len(output) >= target:
+                break
+
+            code = data[src]
+            stop = False
+
+            if code <= 0x7F:
+                # 2-byte control: short back-reference + literals
+                if src + 1 >= end:
+                    break
+                b1 = data[src + 1]
+                code_size = 2
+                num_literals = code & 0x03
+                copy_length = ((code & 0x1C) >> 2) + 3
+                copy_offset = ((code & 0x60) << 3) + b1 + 1
+            elif code <= 0xBF:
+                # 3-byte control: medium back-reference + literals
+                if src + 2 >= end:
+                    break
+                b1 = data[src + 1]
+                code_size = 3
+                num_literals = ((b1 & 0xC0) >> 6) & 0x03
+                copy_length = (code & 0x3F) + 4
+                copy_offset = ((b1 & 0x3F) << 8) + data[src + 2] + 1
+            elif code <= 0xDF:
+                # 4-byte control: long back-reference + literals
+                if src + 3 >= end:
+                    break
+                code_size = 4
+                num_literals = code & 0x03
+                copy_length = ((code & 0x0C) << 6) + data[src + 3] + 5
+                copy_offset = ((code & 0x10) << 12) + (data[src + 1] << 8) + data[src + 2] + 1
+            elif code <= 0xFB:
+                # 1-byte control: literal bytes only
+                code_size = 1
+                num_literals = ((code & 0x1F) << 2) + 4
+                copy_length = 0
+            else:
+                # 0xFC-0xFF: stop codes with 0-3 trailing literals
+                code_size = 1
+                num_literals = code & 0x03
+                copy_length = 0
+                stop = True
+
+            if not final and src + code_size + num_literals > end:
+                break  # wait for the rest of the literals
+            src += code_size
+
+            output += data[src:src + num_literals]
+            src += num_literals
+
+            if copy_length:
+                output += _back_reference(output, len(output), copy_offset, copy_length)
+
+            if stop:
+                self.eof = True
+                self.unused_data = bytes(data[src:])
+                src = end
+
+        if final:
+            src = end  # a truncated control code ends the stream
+        self._src = src
+
+    def _take(self, max_length):
+        # type: (int) -> bytes
+        """Hand out pending output and drop history outside the window."""
+        output = self._output
+        start = self._returned
+        stop = len(output)
+        if max_length:
+            stop = min(stop, start + max_length)
+        result = bytes(output[start:start + min(stop - start, self._remaining)])
+        self._remaining -= len(result)
+        self._returned = stop
+
+        # Trim in window-sized steps so the buffer is not shifted every call
+        excess = min(self._returned, len(output) - WINDOW_SIZE)
+        if excess >= WINDOW_SIZE:
+            del output[:excess]
+            self._returned -= excess
+        return result
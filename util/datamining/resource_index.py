@@ -0,0 +1,223 @@
+"""
+Merged resource index across every package of a game install.
+
+The game resolves a resource key against all of its packages, with delta
+builds overriding full builds. GameResourceIndex loads each package's index
+once and builds a single hash map from (type, group, instance) to the
+winning (package, row), so extractors can read every resource exactly once
+instead of re-extracting and overwriting overridden copies.
+
+A deleted entry (compression type 0xFFE0) in a later package hides the
+resource: it still wins the key, but it has no data, so iter_type() and
+by_package() skip it and deleted_keys() lists the keys it hides.
+"""
+
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from util.datamining.compression import COMPRESSION_DELETED, CodecRegistry
+from util.datamining.index_cache import IndexCache
+from util.datamining.package_discovery import discover_all_packages, order_full_before_delta
+from util.datamining.package_index import IndexEntry, IndexTable, ResourceKey
+from util.datamining.package_reader import PackageReader
+
+KeyTuple = Tuple[int, int, int]
+
+# Locations are packed as (package_index << 32) | row to keep the map compact
+_ROW_BITS = 32
+_ROW_MASK = (1 << _ROW_BITS) - 1
+
+
+def _key_tuple(key):
+    # type: (Union[ResourceKey, KeyTuple]) -> KeyTuple
+    if isinstance(key, ResourceKey):
+        return key.as_tuple()
+    return tuple(key)
+
+
+class ResourceLocation:
+    """Where a resource lives: the package it comes from and its index entry."""
+
+    __slots__ = ("package_path", "rel_path", "entry")
+
+    def __init__(self, package_path, rel_path, entry):
+        # type: (str, str, IndexEntry) -> None
+        self.package_path = package_path
+        self.rel_path = rel_path
+        self.entry = entry
+
+    def __repr__(self):
+        return "ResourceLocation(rel_path={!r}, key={})".format(self.rel_path, self.entry.key)
+
+
+class GameResourceIndex:
+    """Deduplicated view of all resources in an ordered list of packages.
+
+    Packages are given in precedence order: when several contain the same
+    key, the last one wins (full builds first, then delta builds). The
+    losing copies are remembered so overrides can be listed.
+
+    Args:
+        packages: (absolute_path, relative_path) tuples in precedence order.
+        index_cache: Optional IndexCache used when loading package indexes.
+        codecs: Optional CodecRegistry for the package readers.
+    """
+
+    def __init__(self, packages, index_cache=None, codecs=None):
+        # type: (Sequence[Tuple[str, str]], Optional[IndexCache], Optional[CodecRegistry]) -> None
+        self.packages = list(packages)  # type: List[Tuple[str, str]]
+        self.readers = []  # type: List[PackageReader]
+        self._winners = {}  # type: Dict[KeyTuple, int]
+        self._overridden = {}  # type: Dict[KeyTuple, List[int]]
+        self._deleted = set()  # type: Set[KeyTuple]
+
+        for pkg_index, (pkg_path, rel_path) in enumerate(self.packages):
+            reader = PackageReader(pkg_path, index_cache=index_cache, codecs=codecs)
+            reader.read()
+            self.readers.append(reader)
+            self._add_table(pkg_index, reader.entries)
+
+    @classmethod
+    def from_game_folder(cls, game_folder, index_cache=None, codecs=None):
+        # type: (str, Optional[IndexCache], Optional[CodecRegistry]) -> GameResourceIndex
+        """Index every .package under a game folder in game precedence order.
+
+        Full builds come before deltas, and within each the base game comes
+        before packs in EP, GP, SP, FP order (see order_full_before_delta).
+        """
+        packages = order_full_before_delta(discover_all_packages(game_folder))
+        return cls(packages, index_cache=index_cache, codecs=codecs)
+
+    def _add_table(self, pkg_index, table):
+        # type: (int, IndexTable) -> None
+        winners = self._winners
+        overridden = self._overridden
+        deleted = self._deleted
+        base = pkg_index << _ROW_BITS
+        for row, key in enumerate(zip(table.type_id, table.group, table.instance)):
+            previous = winners.get(key)
+            if previous is not None:
+                overridden.setdefault(key, []).append(previous)
+            winners[key] = base | row
+            if table.compression_type[row] == COMPRESSION_DELETED:
+                deleted.add(key)
+            elif previous is not None:
+                deleted.discard(key)
+
+    def _location(self, packed):
+        # type: (int) -> ResourceLocation
+        pkg_index = packed >> _ROW_BITS
+        pkg_path, rel_path = self.packages[pkg_index]
+        return ResourceLocation(pkg_path, rel_path, self.readers[pkg_index].entries[packed & _ROW_MASK])
+
+    # -- Lookup --
+
+    def __len__(self):
+        # type: () -> int
+        """Number of unique resource keys."""
+        return len(self._winners)
+
+    def __contains__(self, key):
+        # type: (Union[ResourceKey, KeyTuple]) -> bool
+        return _key_tuple(key) in self._winners
+
+    def lookup(self, type_id, group, instance):
+        # type: (int, int, int) -> Optional[ResourceLocation]
+        """Return the winning location of a resource key, or None."""
+        packed = self._winners.get((type_id, group, instance))
+        if packed is None:
+            return None
+        return self._location(packed)
+
+    def iter_type(self, type_id):
+        # type: (int) -> Iterator[ResourceLocation]
+        """Yield the winning location of every resource of a type, except deleted ones."""
+        winners = self._winners
+        for pkg_index, reader in enumerate(self.readers):
+            table = reader.entries
+            base = pkg_index << _ROW_BITS
+            for row in table.positions("type_id", type_id):
+                if winners[table.key_at(row)] == base | row \
+                        and table.compression_type[row] != COMPRESSION_DELETED:
+                    yield self._location(base | row)
+
+    # -- Overrides --
+
+    @property
+    def overridden_count(self):
+        # type: () -> int
+        """Number of package entries shadowed by a later package."""
+        return sum(len(locations) for locations in self._overridden.values())
+
+    def overridden_keys(self):
+        # type: () -> List[KeyTuple]
+        """Keys present in more than one package, sorted."""
+        return sorted(self._overridden)
+
+    def overridden(self, key):
+        # type: (Union[ResourceKey, KeyTuple]) -> List[ResourceLocation]
+        """Shadowed copies of a key, lowest precedence first."""
+        return [self._location(packed) for packed in self._overridden.get(_key_tuple(key), [])]
+
+    # -- Deletions --
+
+    def deleted_keys(self, include_types=None, exclude_types=None):
+        # type: (Optional[Set[int]], Optional[Set[int]]) -> List[KeyTuple]
+        """Keys whose winning entry is a deletion, sorted, optionally filtered by type."""
+        return sorted(
+            key for key in self._deleted
+            if (include_types is None or key[0] in include_types)
+            and (exclude_types is None or key[0] not in exclude_types))
+
+    # -- Extraction --
+
+    def by_package(self, include_types=None, exclude_types=None, packages=None,
+                   include_overridden=False):
+        # type: (Optional[Set[int]], Optional[Set[int]], Optional[Sequence[str]], bool) -> Iterator[Tuple[PackageReader, str, IndexTable]]
+        """Group resources by package for extraction.
+
+        Yields (reader, rel_path, entries) in precedence order, with each
+        package's entries sorted by offset. The reader is memory-mapped
+        while the caller handles its entries and closed afterwards. Deleted
+        entries carry no data and are never yielded.
+
+        Args:
+            include_types: If set, only these type IDs.
+            exclude_types: If set, skip these type IDs.
+            packages: If set, only these package paths.
+            include_overridden: Also yield shadowed copies, for resources
+                that are merged across packages rather than replaced.
+        """
+        wanted = None
+        if packages is not None:
+            wanted = {os.path.abspath(p) for p in packages}
+        winners = self._winners
+
+        for pkg_index, reader in enumerate(self.readers):
+            pkg_path, rel_path = self.packages[pkg_index]
+            if wanted is not None and os.path.abspath(pkg_path) not in wanted:
+                continue
+
+            table = reader.entries
+            base = pkg_index << _ROW_BITS
+            positions = []  # type: List[int]
+            compression_type = table.compression_type
+            for row, key in enumerate(zip(table.type_id, table.group, table.instance)):
+                type_id = key[0]
+                if include_types is not None and type_id not in include_types:
+                    continue
+                if exclude_types is not None and type_id in exclude_types:
+                    continue
+                if compression_type[row] == COMPRESSION_DELETED:
+                    continue
+                if include_overridden or winners[key] == base | row:
+                    positions.append(row)
+            if not positions:
+                continue
+
+            positions.sort(key=table.offset.__getitem__)
+            reader.open()
+            try:
+                yield reader, rel_path, table.take(positions)
+            finally:
+                reader.close()
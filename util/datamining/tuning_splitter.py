@@ -3,13 +3,23 @@ Split CombinedTuning XML into individual standalone tuning files.
 
 Resolves all <r x="..."> references inline so each output entry is
 self-contained (no dependency on the shared <g> table).
+
+Each shared <g> entry is expanded and serialized once (_RefSerializer), and
+that text is spliced into every entry that references it. The output is
+byte-identical to deep-copying the referenced elements and serializing the
+resolved tree, which resolve_references() still does for callers that want
+element trees.
 """
 
 import copy
 import xml.etree.ElementTree as ET
-from typing import Dict, List, NamedTuple, Optional
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
-from util.datamining.binary_tuning import decode_combined_tuning, is_binary_combined_tuning
+from util.datamining.binary_tuning import (
+    DataParseStats,
+    build_combined_tuning_tree,
+    is_binary_combined_tuning,
+)
 
 
 class SplitEntry(NamedTuple):
@@ -62,50 +72,162 @@ def _resolve_refs_inplace(element, ref_table):
             _resolve_refs_inplace(child, ref_table)
 
 
+def resolve_references(element, ref_table):
+    # type: (ET.Element, Dict[str, ET.Element]) -> ET.Element
+    """Deep copy of element with every <r> reference resolved inline."""
+    resolved = copy.deepcopy(element)
+    _resolve_refs_inplace(resolved, ref_table)
+    return resolved
+
+
 def _element_to_xml(element):
     # type: (ET.Element) -> str
     """Serialize an element to an XML string with declaration."""
     return ET.tostring(element, encoding="unicode")
 
 
-def split_combined_tuning(data):
-    # type: (bytes) -> List[SplitEntry]
+# Tag of the placeholder swapped in for an <r> while serializing; "<" is
+# always escaped in text, so "<\x01" can only be the start of a placeholder
+_MARKER = "\x01"
+
+
+class _RefSerializer:
+    """Serializes elements with <r> references expanded from cached text.
+
+    Resolvable <r> elements are swapped for empty placeholder elements, the
+    element is serialized once, and each placeholder is replaced with the
+    cached expansion of its shared entry (nested references included).
+    Output equals _element_to_xml(resolve_references(element, ref_table)).
+    """
+
+    def __init__(self, ref_table):
+        # type: (Dict[str, ET.Element]) -> None
+        self._refs = ref_table
+        # (x, n of the <r>) -> serialized expansion of shared entry x
+        self._expansions = {}  # type: Dict[Tuple[str, Optional[str]], str]
+
+    def serialize(self, element):
+        # type: (ET.Element) -> str
+        """Serialize element (and its tail) with references resolved."""
+        if not len(element) or next(element.iter("r"), None) is None:
+            return _element_to_xml(element)
+
+        refs = self._refs
+        swapped = []  # type: List[Tuple[ET.Element, int, ET.Element]]
+        stack = [element]
+        while stack:
+            parent = stack.pop()
+            for i, child in enumerate(parent):
+                if child.tag == "r":
+                    # Unresolvable references are kept verbatim, children and all
+                    x = child.get("x")
+                    if x is not None and x in refs:
+                        swapped.append((parent, i, child))
+                elif len(child):
+                    stack.append(child)
+        if not swapped:
+            return _element_to_xml(element)
+
+        try:
+            for index, (parent, i, _) in enumerate(swapped):
+                parent[i] = ET.Element(_MARKER + str(index))
+            xml = _element_to_xml(element)
+        finally:
+            for parent, i, child in swapped:
+                parent[i] = child
+
+        pieces = xml.split("<" + _MARKER)
+        parts = [pieces[0]]
+        for piece in pieces[1:]:
+            end = piece.index(" />")
+            child = swapped[int(piece[:end])][2]
+            parts.append(self._expansion(child.get("x"), child.get("n")))
+            parts.append(piece[end + 3:])
+        return "".join(parts)
+
+    def _expansion(self, x, n):
+        # type: (str, Optional[str]) -> str
+        """Serialized shared entry x, renamed to n as the <r> asks."""
+        key = (x, n)
+        xml = self._expansions.get(key)
+        if xml is None:
+            shared = self._refs[x]
+            attrib = shared.attrib
+            if n is not None:
+                attrib = dict(attrib)
+                attrib["n"] = n
+            # A shallow stand-in: the children are shared, not copied
+            renamed = ET.Element(shared.tag, attrib)
+            renamed.text = shared.text
+            renamed.tail = shared.tail
+            renamed.extend(shared)
+            xml = self._expansions[key] = self.serialize(renamed)
+        return xml
+
+
+def split_combined_tuning(data, stats=None):
+    # type: (Union[bytes, ET.Element], Optional[DataParseStats]) -> List[SplitEntry]
     """Split a CombinedTuning resource into individual standalone entries.
 
+    Holds every entry's XML at once; iter_split_combined_tuning() yields
+    them one at a time instead.
+
     Args:
-        data: Raw (decompressed) CombinedTuning resource bytes.
+        data: Raw (decompressed) CombinedTuning resource bytes, or its
+            already parsed root element.
+        stats: Optional DataParseStats to collect binary parsing counters into.
 
     Returns:
         List of SplitEntry, each with resolved XML.
     """
-    # Decode binary DATA format if needed
-    if is_binary_combined_tuning(data):
-        xml_str = decode_combined_tuning(data)
-    else:
-        xml_str = data.decode("utf-8")
+    return list(iter_split_combined_tuning(data, stats))
+
 
-    root = ET.fromstring(xml_str)
-    ref_table = _build_ref_table(root)
+def iter_split_combined_tuning(data, stats=None):
+    # type: (Union[bytes, ET.Element], Optional[DataParseStats]) -> Iterator[SplitEntry]
+    """Parse a CombinedTuning resource and iterate over its standalone entries.
 
-    entries = []  # type: List[SplitEntry]
+    The resource is parsed (and binary DATA decoded straight into elements,
+    without an XML text round trip) before this returns, so malformed data
+    raises here rather than on the first next(). Each entry's XML is only
+    serialized when the iterator reaches it, so a caller that writes and
+    drops entries as they come never holds more than one.
 
+    Args:
+        data: Raw (decompressed) CombinedTuning resource bytes, or its
+            already parsed root element.
+        stats: Optional DataParseStats to collect binary parsing counters into.
+
+    Returns:
+        Iterator of SplitEntry, <I> entries then <M> entries, in the order
+        split_combined_tuning() lists them.
+    """
+    if isinstance(data, ET.Element):
+        root = data
+    elif is_binary_combined_tuning(data):
+        root = build_combined_tuning_tree(data, stats)
+    else:
+        root = ET.fromstring(data.decode("utf-8"))
+    return _iter_entries(root, _RefSerializer(_build_ref_table(root)))
+
+
+def _iter_entries(root, serializer):
+    # type: (ET.Element, _RefSerializer) -> Iterator[SplitEntry]
+    """Yield a SplitEntry for each tuning <I> and module <M> under root."""
     # Process <I> elements (instance tuning: Skills, Careers, Traits, etc.)
     for el in root.iter("I"):
         cls = el.get("c")
         if cls is None:
             continue  # skip <I> without class (not a tuning entry)
 
-        entry_el = copy.deepcopy(el)
-        _resolve_refs_inplace(entry_el, ref_table)
-
-        entries.append(SplitEntry(
+        yield SplitEntry(
             cls=cls,
             name=el.get("n", ""),
             instance_id=el.get("s", "0"),
             module=el.get("m", ""),
             element_tag="I",
-            xml=_element_to_xml(entry_el),
-        ))
+            xml=serializer.serialize(el),
+        )
 
     # Process <M> elements (module tuning: collection_manager, etc.)
     for el in root.iter("M"):
@@ -117,16 +239,11 @@ def split_combined_tuning(data):
         if not module or el.get("s") is None:
             continue
 
-        entry_el = copy.deepcopy(el)
-        _resolve_refs_inplace(entry_el, ref_table)
-
-        entries.append(SplitEntry(
+        yield SplitEntry(
             cls="",
             name=module,
             instance_id=el.get("s", "0"),
             module=module,
             element_tag="M",
-            xml=_element_to_xml(entry_el),
-        ))
-
-    return entries
+            xml=serializer.serialize(el),
+        )